@@ -0,0 +1,208 @@
+"""
+Asyncio version of bot engine. All updates, api calls and kick timers are served by one
+event loop, only storage calls are done in thread pool
+"""
+
+import asyncio
+from typing import Any, Coroutine
+import traceback
+
+from telebot.async_telebot import AsyncTeleBot
+import telebot
+
+from bot import CHAT_RATE_LIMITED_METHODS, EngineBase, EngineTask
+from entities.rate_limiter import RateLimiter
+from entities.retry import Backoff, DeadLetterSink
+from entities.scheduler import AsyncScheduler
+from logger import Logger
+from metrics import BotMetrics
+from storage import AsyncStorage
+import plugins
+
+
+class AsyncEngine(EngineBase):
+    """
+    Represents wrapper for async telebot. Api calls are started as tasks, calls to one
+    chat are executed in order they were made and calls to different chats run
+    concurrently
+    """
+
+    scheduler_class = AsyncScheduler
+
+    def __init__(
+        self,
+        bot_username: str,
+        bot: AsyncTeleBot,
+        metrics: BotMetrics,
+        storage: AsyncStorage,
+        logger: Logger,
+        max_concurrency: int = 32,
+        rate_limiter: RateLimiter = None,
+        backoff: Backoff = None,
+        dead_letter: DeadLetterSink = None,
+    ) -> None:
+        super().__init__(
+            bot_username, bot, metrics, storage, logger, rate_limiter, backoff, dead_letter
+        )
+        self._tasks: set[asyncio.Task] = set()
+        # Lock of chat and number of calls holding or waiting for it
+        self._chat_locks: dict[Any, tuple[asyncio.Lock, int]] = {}
+        # Limits number of http requests made at once
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+
+        self._bot.register_message_handler(
+            self._chat_member_joins, content_types=["new_chat_members"]
+        )
+        self._bot.register_message_handler(self.on_chat_message, content_types=["text"])
+
+    async def start(self) -> None:
+        """
+        Starts bot engine and polls updates until polling is stopped
+        """
+        self.log("Start polling...")
+        await self._bot.infinity_polling()
+
+    async def stop(self, timeout: float = 30) -> None:
+        """
+        Stops bot engine. Started api calls are waited for given time
+        """
+        self._scheduler.stop()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+        await self._storage.close()
+        await self._bot.close_session()
+        self.log("Bot stopped")
+
+    def create_task(self, coro: Coroutine) -> asyncio.Task:
+        """
+        Runs coroutine in background. Engine keeps reference to the task and waits for
+        it on stop
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        # Errors are already logged, this only marks them as retrieved, so asyncio
+        # does not complain about them when nobody awaits the task
+        if not task.cancelled():
+            task.exception()
+
+    def send_message(self, **kwargs) -> asyncio.Task:
+        """
+        Sends message to telegram. Returns task resolved with sent message
+        """
+        return self._call(EngineTask("send_message", kwargs))
+
+    def delete_message(self, chat_id, message_id: int) -> asyncio.Task:
+        """
+        Delete existing message in group
+        """
+        return self._call(
+            EngineTask("delete_message", {"chat_id": chat_id, "message_id": message_id})
+        )
+
+    def kick_chat_member(self, chat_id: int, user_id: int) -> asyncio.Task:
+        """Remove chat member from group without ban"""
+        return self._call(
+            EngineTask("kick_chat_member", {"chat_id": chat_id, "user_id": user_id})
+        )
+
+    def ban_user(self, chat_id: int, user_id: int) -> asyncio.Task:
+        """Permanently ban user from group"""
+        return self._call(
+            EngineTask("ban_chat_member", {"chat_id": chat_id, "user_id": user_id})
+        )
+
+    def _call(self, task: EngineTask) -> asyncio.Task:
+        # Tasks are started in order they were created and take chat lock in the
+        # same order, so calls to one chat keep their order
+        return self.create_task(self._execute_task(task))
+
+    async def _execute_task(self, task: EngineTask) -> Any:
+        chat_id = task.kwargs.get("chat_id")
+        lock, waiters = self._chat_locks.get(chat_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._chat_locks[chat_id] = (lock, waiters + 1)
+        try:
+            async with lock:
+                return await self._execute_in_chat(task)
+        finally:
+            lock, waiters = self._chat_locks[chat_id]
+            if waiters == 1:
+                del self._chat_locks[chat_id]
+            else:
+                self._chat_locks[chat_id] = (lock, waiters - 1)
+
+    async def _execute_in_chat(self, task: EngineTask) -> Any:
+        chat_id = task.kwargs.get("chat_id")
+        delay = self._rate_limiter.reserve(
+            chat_id, task.method_name in CHAT_RATE_LIMITED_METHODS
+        )
+        while True:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                async with self._semaphore:
+                    self._in_flight += 1
+                    self._metrics.set_reply_tasks_in_flight(0, self._in_flight)
+                    try:
+                        self.log(f"Execing method '{task.method_name}'")
+                        response = await getattr(self._bot, task.method_name)(
+                            **task.kwargs
+                        )
+                    finally:
+                        self._in_flight -= 1
+                        self._metrics.set_reply_tasks_in_flight(0, self._in_flight)
+                self._metrics.inc_commands_executed_total(task.method_name, chat_id or 0)
+                return response
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                delay = self._throttled_delay(task, exc)
+                if delay is None:
+                    delay = self._retry_delay(task, exc)
+                if delay is None:
+                    raise
+
+    async def _chat_member_joins(self, message: telebot.types.Message):
+        await self._storage.on_added_to_group(message.chat.id)
+
+        self._metrics.inc_members_joined_total(message.chat.id, message.from_user.id)
+
+        await self._run_plugins(plugins.PLUGIN_NEW_CHAT_MEMBER, message)
+
+    async def _run_plugins(self, plugin_type: int, message: telebot.types.Message) -> bool:
+        for plugin in self._plugins[plugin_type]:
+            try:
+                if await plugin.execute(self, message):
+                    return True
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                cls_name = plugin.__class__.__name__
+                self.log(
+                    f"Unhandled error in plugin {cls_name}:\n{exc}\n{traceback.format_exc()}",
+                    "error",
+                )
+                self._metrics.inc_plugin_errors_total(cls_name, exc.__class__.__name__)
+        return False
+
+    async def on_bot_added_to_group(self, group_id: int):
+        """Fired when bot added to new group"""
+        await self._storage.on_added_to_group(group_id)
+
+    async def on_chat_message(self, message):
+        await self._storage.on_added_to_group(message.chat.id)
+
+        self._metrics.inc_messages_received_total(message.chat.id, message.from_user.id)
+
+        if await self._run_plugins(plugins.PLUGIN_NEW_CHAT_MESSAGE, message):
+            return
+
+        state = await self.storage.get_user_state(message.chat.id, message.from_user.id)
+        if not state.confirmed and not state.confirm_code:
+            # user added in group before bot
+            return
+        if not state.confirmed:
+            self.delete_message(chat_id=message.chat.id, message_id=message.id)
@@ -1,17 +1,88 @@
-from queue import Queue
-from threading import Thread
+from concurrent.futures import Future, InvalidStateError
+from queue import Empty, Queue
+from threading import Event, Thread
 from collections import defaultdict
+from typing import Any
+import time
 import traceback
+import warnings
 
 import telebot
-from telebot.apihelper import ApiException
+from telebot import asyncio_helper
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
 
 from entities.delayed_response import DelayedResponseQueue
+from entities.journal import TaskJournal
+from entities.priority_queue import LaneQueue
+from entities.rate_limiter import RateLimiter
+from entities.retry import Backoff, DeadLetterSink, OrderedDelayQueue
+from entities.scheduler import Scheduler
+from entities.webhook import WebhookServer
 from logger import Logger
 from storage import AbstractStorage
 import plugins
+from plugins.runner import PluginRunner
 from metrics import BotMetrics
 
+# Methods sending messages, which are limited by telegram in every chat
+CHAT_RATE_LIMITED_METHODS = {"send_message"}
+# Maximum number of messages deleted by one deleteMessages request
+MAX_DELETE_BATCH = 100
+# Maximum number of tasks deferred by one reply worker. When it is reached, worker
+# stops taking fresh tasks, so senders are blocked by size of reply queue
+MAX_DEFERRED_TASKS = 1000
+# Priority lanes of reply queue. Moderation actions are executed first, so
+# spammers are removed before captchas of a raid are sent
+REPLY_LANES = ("moderation", "delete", "send")
+METHOD_LANES = {
+    "ban_chat_member": 0,
+    "kick_chat_member": 0,
+    "delete_message": 1,
+    "delete_messages": 1,
+}
+# Lane of QueueExit, it is taken when all tasks are taken
+EXIT_LANE = len(REPLY_LANES)
+# Methods written to task journal. Sent messages are not replayed, because
+# continuations waiting for them are lost when bot is stopped
+JOURNALED_METHODS = set(METHOD_LANES)
+
+
+def task_lane(task: "EngineTask") -> int:
+    """Returns priority lane of task, lanes of unknown methods are the lowest"""
+    return METHOD_LANES.get(task.method_name, len(REPLY_LANES) - 1)
+
+
+def is_retryable_error(exc: Exception) -> bool:
+    """
+    Returns True when failed request can succeed if it is sent again later. Errors
+    caused by request itself, like deleting missing message, are not retried.
+    Errors of both thread and asyncio telebot are recognized
+    """
+    match exc:
+        case ApiTelegramException() | asyncio_helper.ApiTelegramException():
+            return exc.error_code >= 500
+        case ApiHTTPException():
+            return getattr(exc.result, "status_code", 500) >= 500
+        case asyncio_helper.ApiHTTPException():
+            return getattr(exc.result, "status", 500) >= 500
+        case _:
+            # Network errors and broken responses
+            return True
+
+
+def requested_retry_after(exc: Exception) -> float | None:
+    """
+    Returns number of seconds telegram asked to wait when request was rejected
+    because of flood limit, or None for other errors
+    """
+    match exc:
+        case ApiTelegramException() | asyncio_helper.ApiTelegramException() if (
+            exc.error_code == 429
+        ):
+            return (exc.result_json or {}).get("parameters", {}).get("retry_after")
+        case _:
+            return None
+
 
 class QueueExit:
     """
@@ -37,13 +108,56 @@ class EngineTask:
         self.tries: int = tries
         self.max_tries: int = max_tries
         self.response_queue: DelayedResponseQueue = response_queue
+        # Resolved with api response, or with error when task is dropped
+        self.future: Future = Future()
+        # Records of task journal acknowledged when task is done
+        self.journal_ids: list[int] = []
 
 
-class Engine:
+class DeleteBatch:
     """
-    Represents wrapper for telebot for implement custom logic for event processing
+    Messages of one chat waiting to be deleted with one request
+    """
+
+    def __init__(self, chat_id: int) -> None:
+        self.chat_id = chat_id
+        self.message_ids: list[int] = []
+        self.journal_ids: list[int] = []
+
+    def to_task(self) -> EngineTask:
+        """Returns task deleting all messages of batch"""
+        if len(self.message_ids) == 1:
+            task = EngineTask(
+                "delete_message",
+                {"chat_id": self.chat_id, "message_id": self.message_ids[0]},
+            )
+        else:
+            task = EngineTask(
+                "delete_messages",
+                {"chat_id": self.chat_id, "message_ids": self.message_ids},
+            )
+        task.journal_ids = self.journal_ids
+        return task
+
+
+def task_order_key(task: EngineTask | DeleteBatch) -> tuple | None:
+    """
+    Returns key of tasks executed in order they were queued: tasks of one chat in
+    one lane. Tasks of higher lanes are not waiting for deferred tasks of lower ones
+    """
+    if not isinstance(task, EngineTask):
+        return None
+    return task.kwargs.get("chat_id"), task_lane(task)
+
+
+class EngineBase:
+    """
+    State and decisions shared by thread and asyncio engines. Engines only make api
+    calls and wait for retries in their own way
     """
 
+    scheduler_class = Scheduler
+
     def __init__(
         self,
         bot_username: str,
@@ -51,19 +165,155 @@ class Engine:
         metrics: BotMetrics,
         storage: AbstractStorage,
         logger: Logger,
+        rate_limiter: RateLimiter = None,
+        backoff: Backoff = None,
+        dead_letter: DeadLetterSink = None,
     ) -> None:
         self.bot_username = bot_username
         self._bot = bot
         self._metrics = metrics
         self._storage = storage
         self._logger = logger
-
+        self._scheduler = self.scheduler_class(logger)
+        self._rate_limiter = rate_limiter or RateLimiter()
+        self._backoff = backoff or Backoff()
+        self._dead_letter = dead_letter
         self._plugins = defaultdict(list)
+
+    @property
+    def storage(self) -> AbstractStorage:
+        """Storage getter"""
+        return self._storage
+
+    @property
+    def scheduler(self) -> Scheduler:
+        """Scheduler of delayed jobs, e.g. kicks of users not solved captcha"""
+        return self._scheduler
+
+    @property
+    def metrics(self) -> BotMetrics:
+        """Metrics getter"""
+        return self._metrics
+
+    def add_callback_query_handler(self, callback: callable, **kwargs) -> None:
+        self._bot.register_callback_query_handler(callback, **kwargs)
+
+    def add_plugin(self, plugin) -> None:
+        """Add user plugin to bot engine"""
+
+        self._plugins[plugin.plugin_type].append(plugin)
+
+        self.log(f"Registered plugin: {plugin.__class__.__name__}")
+
+    def log(self, msg: str, severity: str = "info") -> None:
+        """Writes log message"""
+        match severity:
+            case "error":
+                self._logger.error(msg)
+            case _:
+                self._logger.info(msg)
+
+    def _throttled_delay(self, task: EngineTask, exc: Exception) -> float | None:
+        """
+        Returns delay asked by telegram when task was rejected by flood limit, chat
+        is paused for this time. Returns None for other errors
+        """
+        retry_after = requested_retry_after(exc)
+        if retry_after is None:
+            return None
+        chat_id = task.kwargs.get("chat_id")
+        self.log(f"Too many requests to chat {chat_id}, retry after {retry_after}")
+        self._metrics.inc_reply_tasks_throttled_total("retry_after")
+        self._rate_limiter.pause(chat_id, retry_after)
+        return retry_after
+
+    def _retry_delay(self, task: EngineTask, exc: Exception) -> float | None:
+        """
+        Returns delay before the next try of failed task, or None when task is
+        dropped. Tasks which failed all tries are saved to dead letter sink
+        """
+        if not is_retryable_error(exc):
+            self.log(
+                f"Unhandled {exc.__class__.__name__}: {exc}\n{traceback.format_exc()}",
+                severity="error",
+            )
+            return None
+
+        if task.tries < task.max_tries:
+            delay = self._backoff.delay(task.tries)
+            self.log(
+                f"Method '{task.method_name}' failed: {exc}, retry in {delay:.1f}s",
+                severity="error",
+            )
+            task.tries += 1
+            self._metrics.inc_reply_tasks_retried_total(task.method_name)
+            return delay
+
+        self.log(
+            f"Task dropped because max retry limit exceeded: {exc}\n{traceback.format_exc()}",
+            severity="error",
+        )
+        self._metrics.inc_reply_tasks_dead_lettered_total(task.method_name)
+        if self._dead_letter is not None:
+            try:
+                self._dead_letter.put(task, exc)
+            except Exception as sink_exc:  # pylint: disable=broad-exception-caught
+                self.log(f"Failed to save dead task: {sink_exc}", severity="error")
+        return None
+
+
+class Engine(EngineBase):
+    """
+    Represents wrapper for telebot for implement custom logic for event processing
+    """
+
+    def __init__(
+        self,
+        bot_username: str,
+        bot: telebot.TeleBot,
+        metrics: BotMetrics,
+        storage: AbstractStorage,
+        logger: Logger,
+        reply_workers: int = 4,
+        rate_limiter: RateLimiter = None,
+        backoff: Backoff = None,
+        dead_letter: DeadLetterSink = None,
+        delete_batch_window: float = 0.5,
+        webhook: WebhookServer = None,
+        reply_starvation_after: float = 5.0,
+        journal: TaskJournal = None,
+        drain_timeout: float = 30.0,
+        plugin_workers: int = 8,
+        plugin_timeout: float | None = 10.0,
+    ) -> None:
+        super().__init__(
+            bot_username, bot, metrics, storage, logger, rate_limiter, backoff, dead_letter
+        )
+        # Deletes of one chat made during this time are sent with one request
+        self._delete_batch_window = delete_batch_window
+        # Updates are received by webhook server instead of polling when it is set
+        self._webhook = webhook
+        # Moderation tasks are saved there until they are done, so they survive restart
+        self._journal = journal
+        # Workers exit without finishing their tasks when stop exceeds this time
+        self._drain_timeout = drain_timeout
+        self._abort = Event()
+
+        self._plugin_runner = PluginRunner(
+            self, metrics, logger, plugin_workers, plugin_timeout
+        )
         self._msg_queue = Queue()
-        self._reply_queue = Queue(25)
+        # Tasks are sharded between workers by chat, so tasks of one chat are
+        # executed in order they were added and different chats are not waiting
+        # for each other. Inside of worker tasks are taken by priority lanes
+        self._reply_queues = [
+            LaneQueue(len(REPLY_LANES) + 1, 25, reply_starvation_after)
+            for _ in range(reply_workers)
+        ]
 
         self._threads = [
-            Thread(target=self._send_message_queue, args=(self._reply_queue,)),
+            Thread(target=self._send_message_queue, args=(queue, worker))
+            for worker, queue in enumerate(self._reply_queues)
         ]
 
         self._bot.register_message_handler(
@@ -77,6 +327,13 @@ class Engine:
         """
         for thread in self._threads:
             thread.start()
+        self._replay_journal()
+        self._scheduler.start()
+        if self._webhook is not None:
+            self.log("Start webhook...")
+            self._webhook.start()
+            self._webhook.wait()
+            return
         self.log("Start polling...")
         self._bot.infinity_polling()
 
@@ -84,105 +341,299 @@ class Engine:
         """
         Stops bot engine
         """
-        for _ in range(len(self._threads)):
-            self._reply_queue.put(QueueExit)
-
-        for thread in self._threads:
-            thread.join()
-
+        # Update intake is stopped first. Updates which are already accepted are
+        # handled by telebot workers and plugins, their replies go to reply queues
+        if self._webhook is not None:
+            self._webhook.stop()
         self._bot.stop_bot()
-        self.log("Bot stopped")
-
-    @property
-    def storage(self) -> AbstractStorage:
-        """Storage getter"""
-        return self._storage
+        self._plugin_runner.close()
 
-    @property
-    def metrics(self) -> BotMetrics:
-        """Metrics getter"""
-        return self._metrics
-
-    def add_callback_query_handler(self, callback: callable, **kwargs) -> None:
-        self._bot.register_callback_query_handler(callback, **kwargs)
-
-    def add_plugin(self, plugin) -> None:
-        """Add user plugin to bot engine"""
+        # Deadlines which are not fired yet are kept in storage
+        self._scheduler.stop()
 
-        self._plugins[plugin.plugin_type].append(plugin)
+        for queue in self._reply_queues:
+            queue.put(QueueExit, EXIT_LANE)
 
-        self.log(f"Registered plugin: {plugin.__class__.__name__}")
+        deadline = time.monotonic() + self._drain_timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        if any(x.is_alive() for x in self._threads):
+            self.log(
+                f"Reply queues are not drained in {self._drain_timeout}s, stopping workers",
+                severity="error",
+            )
+            self._abort.set()
+            for thread in self._threads:
+                thread.join()
+
+        if self._journal is not None:
+            self.log(f"{len(self._journal)} tasks are left in journal")
+            self._journal.close()
+
+        # Storage can keep pending writes in memory, they must be saved before exit
+        self._storage.close()
+        self.log("Bot stopped")
 
-    def send_message(self, reply_to: DelayedResponseQueue = None, **kwargs) -> Queue:
+    def send_message(self, reply_to: DelayedResponseQueue = None, **kwargs) -> Future:
         """
-        Send message through queue to telegram
+        Send message through queue to telegram. Returns future resolved with sent
+        message, so caller can attach continuation instead of waiting for it.
+        reply_to queue is deprecated and kept for old plugins
         """
+        if reply_to is not None:
+            warnings.warn(
+                "reply_to is deprecated, use future returned by send_message",
+                DeprecationWarning,
+                stacklevel=2,
+            )
         task = EngineTask("send_message", kwargs, response_queue=reply_to)
-        self._reply_queue.put(task)
-        return task.response_queue
+        self._put_task(task)
+        return task.future
 
     def delete_message(self, chat_id, message_id: int) -> None:
         """
         Delete existing message in group via queue
         """
-        self._reply_queue.put(
+        self._put_task(
             EngineTask("delete_message", {"chat_id": chat_id, "message_id": message_id})
         )
 
     def kick_chat_member(self, chat_id: int, user_id: int):
         """Remove chat member from group without ban"""
-        self._reply_queue.put(
+        self._put_task(
             EngineTask("kick_chat_member", {"chat_id": chat_id, "user_id": user_id})
         )
 
     def ban_user(self, chat_id: int, user_id: int) -> None:
         """Permanently ban user from group"""
-        self._reply_queue.put(
+        self._put_task(
             EngineTask("ban_chat_member", {"chat_id": chat_id, "user_id": user_id})
         )
 
-    def _send_message_queue(self, queue: Queue):
+    def _replay_journal(self) -> None:
+        if self._journal is None:
+            return
+        records = self._journal.pending()
+        for record in records:
+            task = EngineTask(record.method_name, record.kwargs, record.tries)
+            task.journal_ids = [record.journal_id]
+            self._put_task(task)
+        if records:
+            self.log(f"Replayed {len(records)} tasks from journal")
+
+    def _journal_task(self, task: EngineTask) -> None:
+        if (
+            self._journal is not None
+            and task.method_name in JOURNALED_METHODS
+            and not task.journal_ids
+        ):
+            try:
+                task.journal_ids = [
+                    self._journal.append(task.method_name, task.kwargs, task.tries)
+                ]
+            except OSError as exc:
+                # Task is still executed, it is only not replayed after crash
+                self.log(f"Failed to write task to journal: {exc}", severity="error")
+
+    def _rejournal_task(self, task: EngineTask) -> None:
+        # Task is written again with its new number of tries before the old record
+        # is acknowledged, so task replayed after crash is not given all tries again
+        if self._journal is None or not task.journal_ids:
+            return
+        journal_ids = task.journal_ids
+        try:
+            task.journal_ids = [
+                self._journal.append(task.method_name, task.kwargs, task.tries)
+            ]
+            for journal_id in journal_ids:
+                self._journal.ack(journal_id)
+        except OSError as exc:
+            self.log(f"Failed to write task to journal: {exc}", severity="error")
+
+    def _ack_task(self, task: EngineTask) -> None:
+        if self._journal is not None:
+            try:
+                for journal_id in task.journal_ids:
+                    self._journal.ack(journal_id)
+            except OSError as exc:
+                # Task can be executed again after restart, which is better than
+                # stopping worker
+                self.log(f"Failed to acknowledge task in journal: {exc}", severity="error")
+
+    def _put_task(self, task: EngineTask) -> None:
+        self._journal_task(task)
+        chat_id = task.kwargs.get("chat_id", 0)
+        if not isinstance(chat_id, int):
+            chat_id = hash(chat_id)
+        worker = chat_id % len(self._reply_queues)
+        queue = self._reply_queues[worker]
+        queue.put(task, task_lane(task))
+        self._metrics.set_reply_queue_depth(worker, queue.qsize())
+
+    def _send_message_queue(self, queue: LaneQueue, worker: int = 0):
+        # Tasks waiting for rate limit or retry. They are kept by worker itself, so
+        # retries never take place in queue of fresh tasks
+        deferred = OrderedDelayQueue(task_order_key)
+        delete_batches: dict[int, DeleteBatch] = {}
+        stopping = False
         while True:
-            task: EngineTask = queue.get()
             try:
-                if task == QueueExit:
+                if self._abort.is_set():
+                    # Tasks which are left are kept in journal
+                    left = len(deferred) + queue.qsize() - (0 if stopping else 1)
+                    self.log(f"Reply worker {worker} stopped, {left} tasks are left")
                     return
+                delay = deferred.next_delay()
+                if delay == 0:
+                    task = deferred.pop()
+                    if isinstance(task, DeleteBatch):
+                        # Batch could be already sent when it became full
+                        if delete_batches.get(task.chat_id) is task:
+                            del delete_batches[task.chat_id]
+                            self._schedule_task(task.to_task(), worker, deferred)
+                        continue
+                    paused = self._rate_limiter.paused_for(task.kwargs.get("chat_id"))
+                    if paused > 0:
+                        deferred.put(task, paused)
+                        continue
+                    try:
+                        self._execute_task(task, worker, deferred)
+                    finally:
+                        # Tasks of chat waiting behind this one are not left forever
+                        for waiting in deferred.done(task):
+                            self._schedule_task(waiting, worker, deferred)
+                    continue
+                if stopping or len(deferred) >= MAX_DEFERRED_TASKS:
+                    if delay is None:
+                        return
+                    # Fresh tasks are left in queue until deferred ones are finished
+                    self._abort.wait(delay)
+                    continue
+
+                try:
+                    lane, task, waited = queue.get(timeout=delay)
+                except Empty:
+                    continue
+                self._metrics.set_reply_queue_depth(worker, queue.qsize())
+                if task == QueueExit:
+                    # Deferred tasks are finished before exit
+                    stopping = True
+                    continue
+                self._metrics.observe_reply_queue_wait_seconds(REPLY_LANES[lane], waited)
 
-                exec_method = getattr(self._bot, task.method_name)
-                self.log(f"Execing method '{task.method_name}'")
-                response = exec_method(**task.kwargs)
-                if task.response_queue:
-                    task.response_queue.put(response)
-
-                self._metrics.inc_commands_executed_total(
-                    task.method_name, task.kwargs.get("chat_id", 0)
-                )
-            except ApiException as exc:
+                if task.method_name == "delete_message" and self._delete_batch_window > 0:
+                    self._add_to_delete_batch(task, delete_batches, worker, deferred)
+                else:
+                    self._schedule_task(task, worker, deferred)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                # Worker serves all chats sharded to it, so it stops only on exit
                 self.log(
-                    f"Unhandled ApiException: {exc}\n{traceback.format_exc()}",
+                    f"Reply worker {worker} failed: {exc}\n{traceback.format_exc()}",
                     severity="error",
                 )
 
-            except Exception as exc:
-                self.log(
-                    f"Unhandled Exception: {exc}\n{traceback.format_exc()}", "error"
+    def _add_to_delete_batch(
+        self,
+        task: EngineTask,
+        delete_batches: dict[int, DeleteBatch],
+        worker: int,
+        deferred: OrderedDelayQueue,
+    ) -> None:
+        chat_id = task.kwargs["chat_id"]
+        batch = delete_batches.get(chat_id)
+        if batch is None:
+            batch = delete_batches[chat_id] = DeleteBatch(chat_id)
+            deferred.put(batch, self._delete_batch_window)
+        batch.message_ids.append(task.kwargs["message_id"])
+        batch.journal_ids.extend(task.journal_ids)
+        if len(batch.message_ids) >= MAX_DELETE_BATCH:
+            del delete_batches[chat_id]
+            self._schedule_task(batch.to_task(), worker, deferred)
+
+    def _schedule_task(
+        self, task: EngineTask, worker: int, deferred: OrderedDelayQueue
+    ) -> None:
+        if deferred.is_held(task):
+            # Earlier task of chat is deferred, so this one waits behind it
+            deferred.wait(task)
+            return
+        delay = self._rate_limiter.reserve(
+            task.kwargs.get("chat_id"),
+            task.method_name in CHAT_RATE_LIMITED_METHODS,
+        )
+        if delay > 0:
+            self._metrics.inc_reply_tasks_throttled_total("rate_limit")
+            deferred.put(task, delay)
+        else:
+            self._execute_task(task, worker, deferred)
+
+    def _execute_task(self, task: EngineTask, worker: int, deferred: OrderedDelayQueue) -> None:
+        chat_id = task.kwargs.get("chat_id")
+        if task.future.cancelled():
+            self._ack_task(task)
+            return
+        try:
+            exec_method = getattr(self._bot, task.method_name)
+            self.log(f"Execing method '{task.method_name}'")
+            self._metrics.set_reply_tasks_in_flight(worker, 1)
+            response = exec_method(**task.kwargs)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            # Chat is paused and the task is retried when telegram allows it
+            retry_after = self._throttled_delay(task, exc)
+            if retry_after is None:
+                self._task_failed(task, exc, deferred)
+            else:
+                deferred.put(task, retry_after)
+        else:
+            # Only errors of api call are retried, request which succeeded is not
+            # sent again whatever happens while its response is delivered
+            if task.response_queue:
+                task.response_queue.put(response)
+            self._complete_task(task, response)
+
+            self._metrics.inc_commands_executed_total(task.method_name, chat_id or 0)
+        finally:
+            self._metrics.set_reply_tasks_in_flight(worker, 0)
+
+    def _task_failed(self, task: EngineTask, exc: Exception, deferred: OrderedDelayQueue) -> None:
+        if task.method_name == "delete_messages":
+            self.log(
+                f"Bulk delete in chat {task.kwargs['chat_id']} failed: {exc}, "
+                "deleting messages one by one",
+                severity="error",
+            )
+            for message_id in task.kwargs["message_ids"]:
+                single = EngineTask(
+                    "delete_message",
+                    {"chat_id": task.kwargs["chat_id"], "message_id": message_id},
                 )
-                if task.tries <= task.max_tries:
-                    task.tries += 1
-                    queue.put(task)
-                else:
-                    self.log("Task dropped because max retry limit exceeded")
+                self._journal_task(single)
+                deferred.put(
+                    single, self._rate_limiter.reserve(task.kwargs["chat_id"], False)
+                )
+            self._ack_task(task)
+            return
 
-            finally:
-                queue.task_done()
+        delay = self._retry_delay(task, exc)
+        if delay is not None:
+            self._rejournal_task(task)
+            deferred.put(task, delay)
+            return
+        self._complete_task(task, exc=exc)
 
-    def log(self, msg: str, severity: str = "info") -> None:
-        """Writes log message"""
-        match severity:
-            case "error":
-                self._logger.error(msg)
-            case _:
-                self._logger.info(msg)
+    def _complete_task(
+        self, task: EngineTask, response: Any = None, exc: Exception = None
+    ) -> None:
+        """Resolves future of finished task and removes task from journal"""
+        try:
+            if exc is None:
+                task.future.set_result(response)
+            else:
+                task.future.set_exception(exc)
+        except InvalidStateError:
+            # Caller cancelled future while request was executed
+            self.log(f"Result of cancelled method '{task.method_name}' is dropped")
+        self._ack_task(task)
 
     def _chat_member_joins(self, message: telebot.types.Message):
         # Hotfix for handling messages from groups when storage does not have
@@ -191,22 +642,10 @@ class Engine:
 
         self._metrics.inc_members_joined_total(message.chat.id, message.from_user.id)
 
-        if self._run_plugins(plugins.PLUGIN_NEW_CHAT_MEMBER, message):
-            return
+        self._run_plugins(plugins.PLUGIN_NEW_CHAT_MEMBER, message)
 
     def _run_plugins(self, plugin_type: int, message: telebot.types.Message) -> bool:
-        for plugin in self._plugins[plugin_type]:
-            try:
-                if plugin.execute(self, message):
-                    return True
-            except Exception as exc:
-                cls_name = plugin.__class__.__name__
-                self.log(
-                    f"Unhandled error in plugin {cls_name}:\n{exc}\n{traceback.format_exc()}",
-                    "error",
-                )
-                self._metrics.inc_plugin_errors_total(cls_name, exc.__class__.__name__)
-        return False
+        return self._plugin_runner.run(self._plugins[plugin_type], message)
 
     def on_bot_added_to_group(self, group_id: int):
         """Fired when bot added to new group"""
@@ -222,12 +661,9 @@ class Engine:
         if self._run_plugins(plugins.PLUGIN_NEW_CHAT_MESSAGE, message):
             return
 
-        if not self.storage.is_user_confirmed(
-            message.chat.id, message.from_user.id
-        ) and not self.storage.get_user_confirm_code(
-            message.chat.id, message.from_user.id
-        ):
+        state = self.storage.get_user_state(message.chat.id, message.from_user.id)
+        if not state.confirmed and not state.confirm_code:
             # user added in group before bot
             return
-        if not self.storage.is_user_confirmed(message.chat.id, message.from_user.id):
+        if not state.confirmed:
             self.delete_message(chat_id=message.chat.id, message_id=message.id)
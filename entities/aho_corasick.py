@@ -0,0 +1,118 @@
+from collections import deque
+from typing import Iterable, Iterator
+import re
+import unicodedata
+
+# Invisible characters inserted into words to break filters
+_ZERO_WIDTH = "\u00ad\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff"
+# Cyrillic and greek letters looking like latin ones are replaced by them in words
+# written in mixed scripts, so they match. Words written in one script are kept,
+# otherwise russian words would match latin patterns. Patterns are normalized in
+# the same way
+_HOMOGLYPHS = (
+    "\u0430\u0432\u0435\u0451\u043a\u043c\u043d\u043e\u0440\u0441\u0442\u0443\u0445"
+    "\u0456\u0457\u0458\u0455\u0501\u0261\u03bf\u03b1\u03bd\u03c1\u03c4\u03c5",
+    "abeekmhopctyxiijsdgoavptu",
+)
+_REMOVE_ZERO_WIDTH = str.maketrans("", "", _ZERO_WIDTH)
+_FOLD_HOMOGLYPHS = str.maketrans(*_HOMOGLYPHS)
+_WORD = re.compile(r"\w+")
+_LATIN = re.compile("[a-z]")
+_HOMOGLYPH = re.compile(f"[{_HOMOGLYPHS[0]}]")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Returns text reduced to form used for matching. Compatibility forms like
+    fullwidth or bold letters are decomposed, case is folded, invisible
+    characters are removed and homoglyphs in words mixing latin letters with
+    other ones are replaced by latin letters
+    """
+    text = unicodedata.normalize("NFKC", text).casefold().translate(_REMOVE_ZERO_WIDTH)
+    return _WORD.sub(_fold_mixed_word, text)
+
+
+def _fold_mixed_word(match: re.Match) -> str:
+    word = match.group()
+    if _LATIN.search(word) and _HOMOGLYPH.search(word):
+        return word.translate(_FOLD_HOMOGLYPHS)
+    return word
+
+
+class AhoCorasick:
+    """
+    Automaton finding all of patterns in text by one pass, so time of search does
+    not depend on number of patterns. Immutable after creation, so it can be
+    used by many threads
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.patterns: list[str] = []
+        self._goto: list[dict[str, int]] = [{}]
+        # Pattern ending in node, or -1
+        self._output: list[int] = [-1]
+        self._fail: list[int] = [0]
+        # The nearest node with output reachable by fail links
+        self._output_link: list[int] = [0]
+        for pattern in patterns:
+            if pattern:
+                self._insert(pattern)
+        self._build_links()
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def find_all(self, text: str) -> Iterator[tuple[int, str]]:
+        """Yields end position and pattern of every occurrence found in text"""
+        goto, fail, output, output_link = (
+            self._goto,
+            self._fail,
+            self._output,
+            self._output_link,
+        )
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state if output[state] >= 0 else output_link[state]
+            while node:
+                yield position, self.patterns[output[node]]
+                node = output_link[node]
+
+    def find_first(self, text: str) -> str | None:
+        """Returns the first pattern found in text, or None"""
+        for _, pattern in self.find_all(text):
+            return pattern
+        return None
+
+    def _insert(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._output.append(-1)
+                self._fail.append(0)
+                self._output_link.append(0)
+            state = next_state
+        if self._output[state] < 0:
+            self._output[state] = len(self.patterns)
+            self.patterns.append(pattern)
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[child] = fail
+                self._output_link[child] = (
+                    fail if self._output[fail] >= 0 else self._output_link[fail]
+                )
@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Iterable, NamedTuple
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import BotMetrics
+from storage import LRUCache
+
+CAS_HOST = "https://api.cas.chat/check"
+
+
+class CircuitOpenError(Exception):
+    """Raised when requests are not sent because service is failing"""
+
+
+class CircuitBreaker:
+    """
+    Stops requests to failing service. After failure_threshold failures in a row
+    circuit is opened and requests fail fast for reset_timeout seconds, then one
+    trial request is let through. Its success closes circuit, failure opens it again
+    """
+
+    def __init__(
+        self, failure_threshold: int = 5, reset_timeout: float = 30, clock=time.monotonic
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        """Returns True when requests are rejected"""
+        with self._lock:
+            return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Returns True when request can be sent"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or self._clock() - self._opened_at < self.reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        """Closes circuit"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """Opens circuit when too many requests failed in a row"""
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial = False
+
+
+class _CachedResult(NamedTuple):
+    banned: bool
+    expires_at: float
+
+
+class CASClientBase:
+    """
+    Cache and circuit breaker shared by thread and asyncio clients of combot
+    anti-spam service. Results are cached, bans are cached longer than clean users,
+    because ban is rarely lifted while clean user can be banned soon. Clients only
+    send requests in their own way
+    """
+
+    def __init__(
+        self,
+        host: str = CAS_HOST,
+        req_timeout: float = 3,
+        positive_ttl: float = 24 * 3600,
+        negative_ttl: float = 600,
+        cache_size: int = 100000,
+        breaker: CircuitBreaker = None,
+        metrics: BotMetrics = None,
+        clock=time.monotonic,
+    ) -> None:
+        self.host = host
+        self.req_timeout = req_timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.breaker = breaker or CircuitBreaker()
+        self._metrics = metrics
+        self._clock = clock
+        self._cache = LRUCache(cache_size)
+        self._cache_lock = Lock()
+
+    def _cached(self, user_id: int) -> bool | None:
+        """
+        Returns cached result, or None when request has to be sent. Raises
+        CircuitOpenError when service is failing
+        """
+        with self._cache_lock:
+            cached = self._cache.get(user_id)
+        if isinstance(cached, _CachedResult) and cached.expires_at > self._clock():
+            self._count_cache("hit")
+            return cached.banned
+        self._count_cache("miss")
+
+        if not self.breaker.allow():
+            raise CircuitOpenError("CAS requests are stopped after failures")
+        return None
+
+    def _request_failed(self, started: float) -> None:
+        self.breaker.record_failure()
+        self._observe("error", time.monotonic() - started)
+
+    def _request_succeeded(self, user_id: int, banned: bool, started: float) -> None:
+        self.breaker.record_success()
+        self._observe("ok", time.monotonic() - started)
+
+        ttl = self.positive_ttl if banned else self.negative_ttl
+        with self._cache_lock:
+            self._cache.put(user_id, _CachedResult(banned, self._clock() + ttl))
+
+    def _count_cache(self, result: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc_cas_cache_lookups_total(result)
+
+    def _observe(self, status: str, seconds: float) -> None:
+        if self._metrics is not None:
+            self._metrics.observe_cas_request_seconds(status, seconds)
+            self._metrics.set_cas_circuit_open(self.breaker.is_open)
+
+
+class CASClient(CASClientBase):
+    """
+    Client of combot anti-spam service. Connections are kept in pool and reused,
+    several users are checked concurrently
+    """
+
+    def __init__(
+        self,
+        host: str = CAS_HOST,
+        req_timeout: float = 3,
+        pool_size: int = 8,
+        positive_ttl: float = 24 * 3600,
+        negative_ttl: float = 600,
+        cache_size: int = 100000,
+        breaker: CircuitBreaker = None,
+        metrics: BotMetrics = None,
+        clock=time.monotonic,
+    ) -> None:
+        super().__init__(
+            host, req_timeout, positive_ttl, negative_ttl, cache_size, breaker, metrics, clock
+        )
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+        self._executor = ThreadPoolExecutor(pool_size, thread_name_prefix="cas")
+
+    def is_banned(self, user_id: int) -> bool:
+        """
+        Returns True when user is banned by CAS. Raises CircuitOpenError when
+        service is failing and request errors when it fails right now
+        """
+        cached = self._cached(user_id)
+        if cached is not None:
+            return cached
+        started = time.monotonic()
+        try:
+            response = self._session.get(
+                self.host, params={"user_id": user_id}, timeout=self.req_timeout
+            )
+            response.raise_for_status()
+            banned = bool(response.json().get("ok", False))
+        except Exception:
+            self._request_failed(started)
+            raise
+        self._request_succeeded(user_id, banned, started)
+        return banned
+
+    def check_many(self, user_ids: Iterable[int]) -> dict[int, bool | Exception]:
+        """
+        Checks users concurrently. Returns result of every user, or error when
+        user was not checked
+        """
+        futures = {x: self._executor.submit(self.is_banned, x) for x in user_ids}
+        results = {}
+        for user_id, future in futures.items():
+            try:
+                results[user_id] = future.result()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                results[user_id] = exc
+        return results
+
+    def close(self) -> None:
+        """Closes pooled connections"""
+        self._executor.shutdown(wait=False)
+        self._session.close()
@@ -0,0 +1,120 @@
+from threading import Event, Thread
+from typing import Iterable
+import time
+import traceback
+
+import requests
+
+from entities.int_set import IntSet
+from logger import Logger
+from metrics import BotMetrics
+
+CAS_EXPORT_URL = "https://api.cas.chat/export.csv"
+
+
+def parse_cas_export(lines: Iterable[str | bytes]) -> IntSet:
+    """
+    Builds set of banned user ids from CAS export, which has one user id per line.
+    Header and broken lines are skipped
+    """
+    values = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            values.append(int(line.split(b"," if isinstance(line, bytes) else ",")[0]))
+        except ValueError:
+            continue
+    return IntSet(values)
+
+
+class CASIndex:
+    """
+    Local copy of CAS ban list. It is loaded from export file and refreshed in
+    background thread. New list is built aside and then replaces old one, so
+    lookups are never blocked and never see partially loaded list
+    """
+
+    def __init__(
+        self,
+        source: str = CAS_EXPORT_URL,
+        refresh_interval: float = 3600,
+        req_timeout: float = 60,
+        metrics: BotMetrics = None,
+        logger: Logger = None,
+    ) -> None:
+        # Url of export or path to local export file
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.req_timeout = req_timeout
+        self._metrics = metrics
+        self._logger = logger
+        self._banned: IntSet | None = None
+        self.updated_at: float | None = None
+        self._stop = Event()
+        self._thread = Thread(target=self._refresh_loop, daemon=True)
+
+    def __contains__(self, user_id: int) -> bool:
+        banned = self._banned
+        return banned is not None and user_id in banned
+
+    def __len__(self) -> int:
+        banned = self._banned
+        return 0 if banned is None else len(banned)
+
+    @property
+    def loaded(self) -> bool:
+        """Returns True when ban list was loaded at least once"""
+        return self._banned is not None
+
+    def start(self) -> None:
+        """Starts background refreshing. The first load is done in background too"""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops background refreshing"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def refresh(self) -> int:
+        """Loads ban list from source and replaces current one. Returns its size"""
+        if self.source.startswith(("http://", "https://")):
+            with requests.get(self.source, stream=True, timeout=self.req_timeout) as response:
+                response.raise_for_status()
+                banned = parse_cas_export(response.iter_lines())
+        else:
+            with open(self.source, "rb") as file:
+                banned = parse_cas_export(file)
+        if not banned and self._banned:
+            # Empty export is more likely broken download than amnesty
+            raise ValueError("CAS export is empty")
+        self._banned = banned
+        self.updated_at = time.time()
+        if self._metrics is not None:
+            self._metrics.set_cas_index_size(len(banned))
+        return len(banned)
+
+    def _refresh_loop(self) -> None:
+        delay = 0.0
+        while not self._stop.wait(delay):
+            delay = self.refresh_interval
+            try:
+                size = self.refresh()
+                self._count("ok")
+                if self._logger is not None:
+                    self._logger.info(f"CAS ban list loaded, {size} users")
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                self._count("error")
+                if self._logger is not None:
+                    self._logger.error(
+                        f"Error loading CAS ban list: {exc}\n" + traceback.format_exc()
+                    )
+                if not self.loaded:
+                    # Lookups fall back to api until list is loaded, so it is retried soon
+                    delay = min(self.refresh_interval, 60)
+
+    def _count(self, status: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc_cas_index_refresh_total(status)
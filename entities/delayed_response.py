@@ -1,11 +1,24 @@
 from queue import Queue
 from typing import Any
+import warnings
 
 
 class DelayedResponseQueue(Queue):
     """
-    Implements one-shot queue for receiving only one message, then queue will be closed
+    Implements one-shot queue for receiving only one message, then queue will be closed.
+    Deprecated: waiting for it blocks handler thread until reply worker sends message,
+    use future returned by Engine.send_message instead
     """
+
+    def __init__(self, maxsize: int = 0) -> None:
+        warnings.warn(
+            "DelayedResponseQueue is deprecated, use future returned by "
+            "Engine.send_message",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        super().__init__(maxsize)
+
     def get(self, block: bool = True, timeout: float | None = None) -> Any:
         result = super().get(block, timeout)
         self.task_done()
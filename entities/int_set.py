@@ -0,0 +1,59 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from typing import Iterable
+import sys
+
+# Size of int object for user id, which is kept in buffer until merge
+_INT_SIZE = sys.getsizeof(2**40)
+
+
+class IntSet:
+    """
+    Memory efficient set of 64-bit integers. Values are kept in sorted array, which
+    takes 8 bytes per value, and new values are collected in small buffer merged into
+    array when it becomes full. Lookups are lock-free, but adding values must be
+    serialized by caller
+    """
+
+    merge_threshold = 1024
+
+    def __init__(self, values: Iterable[int] = ()) -> None:
+        self._sorted = array("q", sorted(set(values)))
+        self._buffer: set[int] = set()
+
+    def __contains__(self, value: int) -> bool:
+        # Buffer is read before array, because merge replaces array first
+        buffer = self._buffer
+        if value in buffer:
+            return True
+        values = self._sorted
+        idx = bisect_left(values, value)
+        return idx < len(values) and values[idx] == value
+
+    def __len__(self) -> int:
+        return len(self._sorted) + len(self._buffer)
+
+    def __iter__(self):
+        return iter(merge(self._sorted, sorted(self._buffer)))
+
+    def add(self, value: int) -> None:
+        """Adds value to set"""
+        if value in self:
+            return
+        self._buffer.add(value)
+        if len(self._buffer) >= self.merge_threshold:
+            self._merge()
+
+    def memory_usage(self) -> int:
+        """Returns approximate number of bytes used by set"""
+        buffer = self._buffer
+        return (
+            sys.getsizeof(self._sorted)
+            + sys.getsizeof(buffer)
+            + len(buffer) * _INT_SIZE
+        )
+
+    def _merge(self) -> None:
+        self._sorted = array("q", merge(self._sorted, sorted(self._buffer)))
+        self._buffer = set()
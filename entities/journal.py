@@ -0,0 +1,117 @@
+from itertools import count
+from threading import Lock
+from typing import Any, NamedTuple
+import json
+import os
+
+
+class JournalRecord(NamedTuple):
+    """Task written to journal and not acknowledged yet"""
+
+    journal_id: int
+    method_name: str
+    kwargs: dict
+    tries: int
+
+    def to_json(self) -> dict[str, Any]:
+        """Returns journal line of the task"""
+        return {
+            "op": "add",
+            "id": self.journal_id,
+            "method_name": self.method_name,
+            "kwargs": self.kwargs,
+            "tries": self.tries,
+        }
+
+
+class TaskJournal:
+    """
+    Append-only journal of outbound tasks. Task is written before it is queued and
+    acknowledged when it is executed or dropped, so tasks which were queued when
+    bot was stopped or crashed are executed again on start. File is rewritten
+    with pending tasks only after every compact_every acknowledgements
+    """
+
+    def __init__(self, path: str, compact_every: int = 1000, fsync: bool = False) -> None:
+        self.path = path
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = Lock()
+        self._pending: dict[int, JournalRecord] = {}
+        self._acked = 0
+        self._file = None
+        self._load()
+        self._ids = count(max(self._pending, default=0) + 1)
+        self._compact()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def pending(self) -> list[JournalRecord]:
+        """Returns tasks which are not acknowledged, in order they were written"""
+        with self._lock:
+            return list(self._pending.values())
+
+    def append(self, method_name: str, kwargs: dict, tries: int = 1) -> int:
+        """Writes task to journal and returns its id"""
+        with self._lock:
+            record = JournalRecord(next(self._ids), method_name, kwargs, tries)
+            self._write(record.to_json())
+            self._pending[record.journal_id] = record
+            return record.journal_id
+
+    def ack(self, journal_id: int) -> None:
+        """Marks task as done, so it is not executed again on start"""
+        with self._lock:
+            if self._pending.pop(journal_id, None) is None:
+                return
+            self._write({"op": "ack", "id": journal_id})
+            self._acked += 1
+            if self._acked >= self.compact_every:
+                self._compact()
+
+    def close(self) -> None:
+        """Compacts journal and closes its file"""
+        with self._lock:
+            self._compact()
+            self._file.close()
+
+    def _write(self, record: dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line is broken when bot crashed while writing it
+                    continue
+                match record.get("op"):
+                    case "add":
+                        self._pending[record["id"]] = JournalRecord(
+                            record["id"],
+                            record["method_name"],
+                            record["kwargs"],
+                            record.get("tries", 1),
+                        )
+                    case "ack":
+                        self._pending.pop(record["id"], None)
+
+    def _compact(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for record in self._pending.values():
+                file.write(json.dumps(record.to_json(), ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")  # pylint: disable=consider-using-with
+        self._acked = 0
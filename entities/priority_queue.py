@@ -0,0 +1,74 @@
+from collections import deque
+from queue import Empty, Full
+from threading import Condition
+from typing import Any
+import time
+
+
+class LaneQueue:
+    """
+    Queue with several priority lanes, lane 0 has the highest priority. Items of
+    one lane are taken in order they were put. Item which waits longer than
+    starvation_after seconds is taken before items of higher lanes, so low lanes
+    keep moving when high lanes are always busy
+    """
+
+    def __init__(
+        self,
+        lanes: int,
+        maxsize: int = 0,
+        starvation_after: float = 5.0,
+        clock=time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.starvation_after = starvation_after
+        self._clock = clock
+        self._cond = Condition()
+        # Every lane keeps items with time they were put
+        self._lanes: list[deque[tuple[float, Any]]] = [deque() for _ in range(lanes)]
+
+    def qsize(self, lane: int = None) -> int:
+        """Returns number of items in lane, or in all lanes when lane is not given"""
+        with self._cond:
+            if lane is not None:
+                return len(self._lanes[lane])
+            return sum(len(x) for x in self._lanes)
+
+    def put(self, item: Any, lane: int, timeout: float = None) -> None:
+        """
+        Puts item into lane. When lane is full, waits for free place and raises
+        queue.Full after timeout. Lanes are limited separately, so full low lane
+        does not block high lane
+        """
+        with self._cond:
+            items = self._lanes[lane]
+            if self.maxsize > 0 and not self._cond.wait_for(
+                lambda: len(items) < self.maxsize, timeout
+            ):
+                raise Full
+            items.append((self._clock(), item))
+            self._cond.notify_all()
+
+    def get(self, timeout: float = None) -> tuple[int, Any, float]:
+        """
+        Takes next item. Returns its lane, item and number of seconds it waited in
+        queue. Raises queue.Empty after timeout
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: any(self._lanes), timeout):
+                raise Empty
+            now = self._clock()
+            lane = self._select(now)
+            put_at, item = self._lanes[lane].popleft()
+            self._cond.notify_all()
+            return lane, item, now - put_at
+
+    def _select(self, now: float) -> int:
+        starving = [
+            (items[0][0], lane)
+            for lane, items in enumerate(self._lanes)
+            if items and now - items[0][0] >= self.starvation_after
+        ]
+        if starving:
+            return min(starving)[1]
+        return next(lane for lane, items in enumerate(self._lanes) if items)
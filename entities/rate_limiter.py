@@ -0,0 +1,114 @@
+from threading import Lock
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket allowing reservation of tokens ahead. When bucket is empty token
+    is still taken and caller receives time it should wait before using it, so
+    callers are served in order they reserved tokens
+    """
+
+    def __init__(self, rate: float, capacity: float, now: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Takes one token and returns number of seconds to wait before using it"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def pause(self, until: float) -> None:
+        """Stops giving tokens until given time"""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = min(self.tokens, 0)
+
+    def is_idle(self, now: float) -> bool:
+        """Returns True when bucket is full, so it can be dropped and created again"""
+        return (
+            now >= self.paused_until
+            and self.tokens + (now - self.updated) * self.rate >= self.capacity
+        )
+
+
+class RateLimiter:
+    """
+    Models Telegram bot api limits: about 30 requests per second in total, one
+    message per second in private chat and 20 messages per minute in group
+    """
+
+    # Idle chat buckets are removed every time this number of buckets is created
+    cleanup_every = 1000
+
+    def __init__(
+        self,
+        global_rate: float = 30,
+        group_rate: float = 20 / 60,
+        private_rate: float = 1,
+        group_burst: float = 5,
+        clock=time.monotonic,
+    ) -> None:
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self.group_burst = group_burst
+        self._clock = clock
+        self._lock = Lock()
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._created = 0
+
+    def reserve(self, chat_id: int | str | None, per_chat: bool = True) -> float:
+        """
+        Reserves request to chat and returns number of seconds to wait before it
+        can be sent. Chat limit is applied only when per_chat is set, but pause of
+        chat is always respected
+        """
+        with self._lock:
+            now = self._clock()
+            delay = self._global.reserve(now)
+            if chat_id is None:
+                return delay
+            bucket = self._chats.get(chat_id)
+            if per_chat:
+                delay = max(delay, self._chat_bucket(chat_id, now).reserve(now))
+            elif bucket is not None:
+                delay = max(delay, bucket.paused_until - now)
+            return delay
+
+    def paused_for(self, chat_id: int | str | None) -> float:
+        """Returns number of seconds chat is still paused for"""
+        with self._lock:
+            bucket = self._global if chat_id is None else self._chats.get(chat_id)
+            if bucket is None:
+                return 0.0
+            return max(0.0, bucket.paused_until - self._clock())
+
+    def pause(self, chat_id: int | str | None, seconds: float) -> None:
+        """Pauses requests to chat, e.g. when api asked to retry after given time"""
+        with self._lock:
+            now = self._clock()
+            if chat_id is None:
+                self._global.pause(now + seconds)
+            else:
+                self._chat_bucket(chat_id, now).pause(now + seconds)
+
+    def _chat_bucket(self, chat_id: int | str, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            self._created += 1
+            if self._created % self.cleanup_every == 0:
+                self._chats = {
+                    k: v for k, v in self._chats.items() if not v.is_idle(now)
+                }
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.private_rate, 1, now)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst, now)
+            self._chats[chat_id] = bucket
+        return bucket
@@ -0,0 +1,151 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from heapq import heappop, heappush
+from itertools import count
+from threading import Lock
+from typing import Any, Callable, Hashable
+import json
+import random
+import time
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter. Half of delay is fixed and another half is
+    random, so retries of many tasks failed at once are spread in time
+    """
+
+    def __init__(self, base: float = 1.0, max_delay: float = 60.0) -> None:
+        self.base = base
+        self.max_delay = max_delay
+
+    def delay(self, tries: int) -> float:
+        """Returns delay before next try when task was already tried given times"""
+        delay = min(self.max_delay, self.base * 2 ** max(0, tries - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class DelayQueue:
+    """
+    Heap of items which can be taken only after their delay is passed. Items with
+    equal time are taken in order they were put. Not thread safe
+    """
+
+    def __init__(self, clock=time.monotonic) -> None:
+        self._clock = clock
+        self._heap: list[tuple[float, int, Any]] = []
+        self._sequence = count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def put(self, item: Any, delay: float = 0.0) -> None:
+        """Adds item, which can be taken after delay seconds"""
+        heappush(self._heap, (self._clock() + delay, next(self._sequence), item))
+
+    def next_delay(self) -> float | None:
+        """
+        Returns number of seconds until the first item can be taken, or None when
+        queue is empty
+        """
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self._clock())
+
+    def pop(self) -> Any:
+        """Removes and returns the first item regardless of its delay"""
+        return heappop(self._heap)[2]
+
+
+class OrderedDelayQueue(DelayQueue):
+    """
+    Delay queue keeping order of items having the same key. While item of key is
+    deferred, next items of this key wait behind it and are returned by done when
+    all deferred items of key are finished. Items with key None are not ordered.
+    Not thread safe
+    """
+
+    def __init__(self, key: Callable[[Any], Hashable | None], clock=time.monotonic) -> None:
+        super().__init__(clock)
+        self._key = key
+        # Number of items of key in heap
+        self._deferred: dict[Hashable, int] = {}
+        self._waiting: dict[Hashable, deque] = {}
+        self._waiting_size = 0
+
+    def __len__(self) -> int:
+        """Returns number of deferred and waiting items"""
+        return super().__len__() + self._waiting_size
+
+    def put(self, item: Any, delay: float = 0.0) -> None:
+        super().put(item, delay)
+        key = self._key(item)
+        if key is not None:
+            self._deferred[key] = self._deferred.get(key, 0) + 1
+
+    def pop(self) -> Any:
+        item = super().pop()
+        key = self._key(item)
+        if key is not None:
+            if self._deferred[key] > 1:
+                self._deferred[key] -= 1
+            else:
+                del self._deferred[key]
+        return item
+
+    def is_held(self, item: Any) -> bool:
+        """Returns True when item has to wait for items of its key"""
+        key = self._key(item)
+        return key is not None and (key in self._deferred or key in self._waiting)
+
+    def wait(self, item: Any) -> None:
+        """Adds item to wait for deferred items of its key"""
+        self._waiting.setdefault(self._key(item), deque()).append(item)
+        self._waiting_size += 1
+
+    def done(self, item: Any) -> list:
+        """
+        Marks taken item as finished. Returns items waiting for its key, in order
+        they came, when no item of key is deferred anymore
+        """
+        key = self._key(item)
+        if key is None or key in self._deferred:
+            return []
+        waiting = self._waiting.pop(key, ())
+        self._waiting_size -= len(waiting)
+        return list(waiting)
+
+
+class DeadLetterSink(ABC):
+    """
+    Receives tasks which were not executed after all tries, so they can be
+    inspected or replayed manually
+    """
+
+    @abstractmethod
+    def put(self, task: Any, error: Exception) -> None:
+        """Saves failed task with the last error"""
+
+
+class JsonLinesDeadLetterSink(DeadLetterSink):
+    """Appends failed tasks to file, one json object per line"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = Lock()
+
+    def put(self, task: Any, error: Exception) -> None:
+        record = json.dumps(
+            {
+                "method_name": task.method_name,
+                "kwargs": task.kwargs,
+                "tries": task.tries,
+                "error": f"{error.__class__.__name__}: {error}",
+                "failed_at": time.time(),
+            },
+            ensure_ascii=False,
+            default=str,
+        )
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(record + "\n")
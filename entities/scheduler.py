@@ -0,0 +1,165 @@
+from heapq import heapify, heappop, heappush
+import asyncio
+from itertools import count
+from threading import Condition, Thread
+from typing import Any, Callable, Hashable
+import time
+import traceback
+
+from logger import Logger
+
+
+class Scheduler:
+    """
+    Runs callbacks at given time by one thread. Jobs are kept in heap ordered by time,
+    cancelled jobs are left in heap and skipped when their time comes. Callbacks must
+    be short, because they delay all jobs after them
+    """
+
+    def __init__(self, logger: Logger = None, clock=time.time) -> None:
+        self._logger = logger
+        self._clock = clock
+        self._cond = Condition()
+        self._heap: list[tuple[float, int, Hashable]] = []
+        # Job key -> sequence number of its heap entry, callback and arguments
+        self._jobs: dict[Hashable, tuple[int, Callable, tuple]] = {}
+        self._sequence = count()
+        self._stopped = False
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def start(self) -> None:
+        """Starts scheduler thread"""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops scheduler thread. Jobs which are not fired yet are discarded"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def schedule(
+        self, key: Hashable, run_at: float, callback: Callable, *args: Any
+    ) -> None:
+        """
+        Schedules callback to run at given unix time. Job with the same key is
+        replaced
+        """
+        with self._cond:
+            sequence = next(self._sequence)
+            self._jobs[key] = (sequence, callback, args)
+            heappush(self._heap, (run_at, sequence, key))
+            if self._heap[0][1] == sequence:
+                self._cond.notify()
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancels job. Returns False when there was no such job"""
+        with self._cond:
+            if self._jobs.pop(key, None) is None:
+                return False
+            # Heap is rebuilt when most of its entries are cancelled jobs
+            if len(self._heap) > 64 and len(self._heap) > 2 * len(self._jobs):
+                self._heap = [x for x in self._heap if self._is_live(x)]
+                heapify(self._heap)
+            return True
+
+    def _is_live(self, entry: tuple[float, int, Hashable]) -> bool:
+        job = self._jobs.get(entry[2])
+        return job is not None and job[0] == entry[1]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap and not self._is_live(self._heap[0]):
+                        heappop(self._heap)
+                        continue
+                    delay = self._heap[0][0] - self._clock() if self._heap else None
+                    if delay is not None and delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if self._stopped:
+                    return
+                key = heappop(self._heap)[2]
+                _, callback, args = self._jobs.pop(key)
+
+            try:
+                callback(*args)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                if self._logger is not None:
+                    self._logger.error(
+                        f"Error in scheduled job {key}: {exc}\n{traceback.format_exc()}"
+                    )
+
+
+class AsyncScheduler:
+    """
+    Scheduler for asyncio engine. Every job is a timer of event loop, so no threads
+    are used. Callback can be a coroutine function, its coroutine is run as a task.
+    Must be used from the event loop thread
+    """
+
+    def __init__(self, logger: Logger = None, clock=time.time) -> None:
+        self._logger = logger
+        self._clock = clock
+        self._jobs: dict[Hashable, asyncio.TimerHandle] = {}
+        self._running: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def schedule(
+        self, key: Hashable, run_at: float, callback: Callable, *args: Any
+    ) -> None:
+        """
+        Schedules callback to run at given unix time. Job with the same key is
+        replaced
+        """
+        self.cancel(key)
+        self._jobs[key] = asyncio.get_running_loop().call_later(
+            max(0.0, run_at - self._clock()), self._fire, key, callback, args
+        )
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancels job. Returns False when there was no such job"""
+        handle = self._jobs.pop(key, None)
+        if handle is None:
+            return False
+        handle.cancel()
+        return True
+
+    def stop(self) -> None:
+        """Cancels all jobs which are not fired yet and jobs which are running"""
+        for handle in self._jobs.values():
+            handle.cancel()
+        self._jobs.clear()
+        for task in self._running:
+            task.cancel()
+
+    def _fire(self, key: Hashable, callback: Callable, args: tuple) -> None:
+        del self._jobs[key]
+        try:
+            result = callback(*args)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._log_error(key, exc)
+            return
+        if asyncio.iscoroutine(result):
+            task = asyncio.get_running_loop().create_task(self._run(key, result))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, key: Hashable, coro) -> None:
+        try:
+            await coro
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._log_error(key, exc)
+
+    def _log_error(self, key: Hashable, exc: Exception) -> None:
+        if self._logger is not None:
+            self._logger.error(
+                f"Error in scheduled job {key}: {exc}\n{traceback.format_exc()}"
+            )
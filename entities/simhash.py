@@ -0,0 +1,181 @@
+from collections import OrderedDict, deque
+from hashlib import blake2b
+from threading import Lock
+from typing import NamedTuple
+import itertools
+import time
+
+from entities.aho_corasick import normalize_text
+
+FINGERPRINT_BITS = 64
+
+
+def simhash(text: str, shingle: int = 4, max_chars: int = 1024) -> int:
+    """
+    Returns 64 bit fingerprint of text. Texts differing in few characters have
+    fingerprints differing in few bits. Text is normalized and split to overlapping
+    character shingles, only the first max_chars characters are used, so time of
+    hashing is bounded
+    """
+    text = " ".join(normalize_text(text).split())[:max_chars]
+    features = {text[i:i + shingle] for i in range(max(len(text) - shingle + 1, 1))}
+    # Bits of every feature hash are counted by columns of their binary strings
+    rows = [
+        format(int.from_bytes(blake2b(x.encode(), digest_size=8).digest(), "big"), "064b")
+        for x in features
+    ]
+    fingerprint = 0
+    for column in zip(*rows):
+        fingerprint = (fingerprint << 1) | (column.count("1") * 2 > len(rows))
+    return fingerprint
+
+
+class Duplicate(NamedTuple):
+    """Result of adding message to index"""
+
+    # Number of distinct chats and users which posted the same text
+    chats: int
+    users: int
+    # Copies to remove as (chat_id, message_id, user_id), given when text is flagged
+    copies: list[tuple[int, int, int]]
+
+    @property
+    def flagged(self) -> bool:
+        """Returns True when text was posted in too many chats"""
+        return bool(self.copies)
+
+
+class _Cluster:
+    __slots__ = ("fingerprint", "created_at", "chats", "users", "copies", "flagged")
+
+    def __init__(self, fingerprint: int, created_at: float) -> None:
+        self.fingerprint = fingerprint
+        self.created_at = created_at
+        self.chats: set[int] = set()
+        self.users: set[int] = set()
+        self.copies: list[tuple[int, int, int]] = []
+        self.flagged = False
+
+
+class DuplicateIndex:
+    """
+    Index of recently posted texts shared by all chats. Fingerprints differing in
+    at most max_distance bits are the same text. Equal fingerprints are found in
+    dict, other ones are found by bands: fingerprint is split to bands and the last
+    texts having every band value are kept in table, near duplicates have equal
+    bands. Cells of table are sized so that all of max_entries texts fit in them,
+    so text is found whatever traffic. Lookup is not constant time: new text is
+    compared with up to bands * bucket_size texts, which grows with max_entries,
+    640 texts with default settings. Text is forgotten window seconds after it was
+    posted first time, and the oldest texts are forgotten when there are more than
+    max_entries of them, so memory is bounded
+    """
+
+    def __init__(
+        self,
+        window: float = 60,
+        min_chats: int = 3,
+        max_distance: int = 10,
+        bands: int = 8,
+        bucket_size: int | None = None,
+        max_entries: int = 10000,
+        max_copies: int = 50,
+        clock=time.monotonic,
+    ) -> None:
+        self.window = window
+        self.min_chats = min_chats
+        self.max_distance = max_distance
+        self.bands = bands
+        self.max_entries = max_entries
+        # Copies, chats and users kept for one text, so spammed text takes bounded memory
+        self.max_copies = max_copies
+        self._clock = clock
+        self._band_bits = FINGERPRINT_BITS // bands
+        self._band_mask = (1 << self._band_bits) - 1
+        if bucket_size is None:
+            # Texts are spread evenly by band values, so every cell gets its share
+            bucket_size = max(4, 2 * -(-max_entries // (1 << self._band_bits)))
+        self.bucket_size = bucket_size
+        self._lock = Lock()
+        self._ids = itertools.count()
+        self._clusters: OrderedDict[int, _Cluster] = OrderedDict()
+        # Fingerprint of the first copy of text -> its id
+        self._exact: dict[int, int] = {}
+        # Band value -> ids of the last texts having it. Ids of forgotten texts are
+        # left here and skipped, they are pushed out by new ones
+        self._buckets: dict[tuple[int, int], deque[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def add(self, fingerprint: int, chat_id: int, user_id: int, message_id: int) -> Duplicate:
+        """
+        Adds message to index. Returns copies to remove when the same text was
+        posted in min_chats chats, the earlier copies are returned once, after that
+        every new copy is returned as soon as it is added
+        """
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            keys = self._band_keys(fingerprint)
+            cluster_id = self._find(fingerprint, keys)
+            if cluster_id is None:
+                cluster_id = next(self._ids)
+                self._clusters[cluster_id] = _Cluster(fingerprint, now)
+                self._exact[fingerprint] = cluster_id
+                self._evict(now)
+            cluster = self._clusters[cluster_id]
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = deque(maxlen=self.bucket_size)
+                if cluster_id not in bucket:
+                    bucket.append(cluster_id)
+
+            copy = (chat_id, message_id, user_id)
+            if len(cluster.chats) < self.max_copies:
+                cluster.chats.add(chat_id)
+            if len(cluster.users) < self.max_copies:
+                cluster.users.add(user_id)
+            if cluster.flagged:
+                copies = [copy]
+            elif len(cluster.chats) >= self.min_chats:
+                cluster.flagged = True
+                copies = cluster.copies + [copy]
+                cluster.copies = []
+            else:
+                copies = []
+                if len(cluster.copies) < self.max_copies:
+                    cluster.copies.append(copy)
+            return Duplicate(len(cluster.chats), len(cluster.users), copies)
+
+    def _band_keys(self, fingerprint: int) -> list[tuple[int, int]]:
+        return [
+            (band, (fingerprint >> (band * self._band_bits)) & self._band_mask)
+            for band in range(self.bands)
+        ]
+
+    def _find(self, fingerprint: int, keys: list[tuple[int, int]]) -> int | None:
+        cluster_id = self._exact.get(fingerprint)
+        if cluster_id is not None:
+            return cluster_id
+        best_id, best_distance = None, self.max_distance + 1
+        for key in keys:
+            for cluster_id in self._buckets.get(key, ()):
+                cluster = self._clusters.get(cluster_id)
+                if cluster is None:
+                    continue
+                distance = (cluster.fingerprint ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best_id, best_distance = cluster_id, distance
+        return best_id
+
+    def _evict(self, now: float) -> None:
+        # Texts are ordered by time they were posted first, so expired ones are first
+        while self._clusters:
+            cluster_id, cluster = next(iter(self._clusters.items()))
+            if now - cluster.created_at < self.window and len(self._clusters) <= self.max_entries:
+                break
+            del self._clusters[cluster_id]
+            if self._exact.get(cluster.fingerprint) == cluster_id:
+                del self._exact[cluster.fingerprint]
@@ -0,0 +1,212 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Full, Queue
+from threading import Thread
+import hmac
+import json
+import traceback
+
+import telebot
+
+from logger import Logger
+from metrics import BotMetrics
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Updates are small, larger requests are not sent by telegram
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class _Exit:
+    """Tells webhook worker to exit"""
+
+
+def update_chat_id(update: telebot.types.Update) -> int | None:
+    """Returns id of chat update belongs to, or None for updates without chat"""
+    for message in (
+        update.message,
+        update.edited_message,
+        update.channel_post,
+        update.callback_query.message if update.callback_query else None,
+        update.my_chat_member,
+        update.chat_member,
+        update.chat_join_request,
+    ):
+        if message is not None and message.chat is not None:
+            return message.chat.id
+    return None
+
+
+class WebhookServer:
+    """
+    Receives updates posted by telegram and passes them to bot handlers in worker
+    threads. Updates of one chat are handled by the same worker in order they came.
+    When queue of worker is full, request is answered with 503, so telegram sends
+    the update again later
+    """
+
+    def __init__(
+        self,
+        bot: telebot.TeleBot,
+        secret_token: str,
+        host: str = "0.0.0.0",
+        port: int = 8443,
+        path: str = "/webhook",
+        url: str = None,
+        max_connections: int = 40,
+        workers: int = 4,
+        queue_size: int = 256,
+        put_timeout: float = 1.0,
+        metrics: BotMetrics = None,
+        logger: Logger = None,
+    ) -> None:
+        if not secret_token:
+            raise ValueError("Webhook secret token is required")
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.url = url
+        self.max_connections = max_connections
+        self.put_timeout = put_timeout
+        self._metrics = metrics
+        self._logger = logger
+        self._queues = [Queue(max(1, queue_size // workers)) for _ in range(workers)]
+        self._workers = [
+            Thread(target=self._worker, args=(x,), daemon=True) for x in range(workers)
+        ]
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._server_thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> tuple[str, int]:
+        """Host and port server is listening on"""
+        return self._server.server_address[:2]
+
+    def start(self) -> None:
+        """
+        Starts accepting updates. When public url is set, webhook is registered in
+        telegram, otherwise it must be registered by proxy in front of the bot
+        """
+        for thread in self._workers:
+            thread.start()
+        self._server_thread.start()
+        self._log(f"Webhook is listening on {self.address[0]}:{self.address[1]}{self.path}")
+        if self.url:
+            self.bot.set_webhook(
+                url=self.url,
+                secret_token=self.secret_token,
+                max_connections=self.max_connections,
+            )
+
+    def wait(self) -> None:
+        """Blocks until server is stopped"""
+        while self._server_thread.is_alive():
+            self._server_thread.join(1)
+
+    def stop(self) -> None:
+        """
+        Stops accepting updates. Updates already accepted are handled before
+        workers exit, because telegram will not send them again
+        """
+        if self._server_thread.is_alive():
+            self._server.shutdown()
+        self._server.server_close()
+        for queue in self._queues:
+            queue.put(_Exit)
+        for thread in self._workers:
+            if thread.is_alive():
+                thread.join()
+
+    def submit(self, update: telebot.types.Update) -> bool:
+        """
+        Puts update into queue of its worker. Returns False when queue stays full
+        for put_timeout seconds
+        """
+        chat_id = update_chat_id(update)
+        key = update.update_id if chat_id is None else chat_id
+        worker = key % len(self._queues)
+        queue = self._queues[worker]
+        try:
+            queue.put(update, timeout=self.put_timeout)
+        except Full:
+            return False
+        if self._metrics is not None:
+            self._metrics.set_webhook_queue_depth(worker, queue.qsize())
+        return True
+
+    def _worker(self, worker: int) -> None:
+        queue = self._queues[worker]
+        while True:
+            update = queue.get()
+            if update is _Exit:
+                return
+            if self._metrics is not None:
+                self._metrics.set_webhook_queue_depth(worker, queue.qsize())
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                self._log(
+                    f"Error in update {update.update_id} handler: {exc}\n"
+                    + traceback.format_exc(),
+                    "error",
+                )
+
+    def _count(self, status: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc_webhook_updates_total(status)
+
+    def _log(self, msg: str, severity: str = "info") -> None:
+        if self._logger is None:
+            return
+        match severity:
+            case "error":
+                self._logger.error(msg)
+            case _:
+                self._logger.info(msg)
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Accepts update posted by telegram"""
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """Handles POST request with update"""
+                if self.path != server.path:
+                    self._reply(404, "not_found")
+                    return
+                token = self.headers.get(SECRET_TOKEN_HEADER, "")
+                if not hmac.compare_digest(token.encode(), server.secret_token.encode()):
+                    self._reply(403, "forbidden")
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                    if length > MAX_BODY_SIZE:
+                        self._reply(413, "too_large")
+                        return
+                    # Negative length would make server read until client disconnects
+                    update = None if length < 0 else telebot.types.Update.de_json(
+                        json.loads(self.rfile.read(length))
+                    )
+                except (ValueError, TypeError, KeyError, AttributeError):
+                    update = None
+                if update is None:
+                    self._reply(400, "bad_request")
+                    return
+                if not server.submit(update):
+                    self._reply(503, "rejected", {"Retry-After": "1"})
+                    return
+                self._reply(200, "accepted")
+
+            def _reply(self, code: int, status: str, headers: dict = None) -> None:
+                server._count(status)  # pylint: disable=protected-access
+                self.send_response(code)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                # Every update would be written to stderr otherwise
+                pass
+
+        return Handler
@@ -1,4 +1,5 @@
 """The main function for launching the bot."""
+import asyncio
 import os
 import signal
 import sys
@@ -7,13 +8,68 @@ import telebot
 from dotenv import load_dotenv
 
 from bot import Engine
+from entities.rate_limiter import RateLimiter
+from entities.cas_client import CASClient
+from entities.cas_index import CAS_EXPORT_URL, CASIndex
+from entities.journal import TaskJournal
+from entities.retry import JsonLinesDeadLetterSink
+from entities.simhash import DuplicateIndex
+from entities.webhook import WebhookServer
 from logger import Logger
 from plugins.members import CASBan, AntispamVerification, RemoveMemberJoinedMessage
-from plugins.chat_message import TestPlugin
-from storage import FileSystem
+from plugins.chat_message import DuplicateFloodFilter, SpamPhraseFilter, TestPlugin
+from storage import (
+    AbstractStorage,
+    AsyncStorage,
+    FileSystem,
+    CachedStorage,
+    ConfirmCodeSweeper,
+    ConfirmedSetStorage,
+    WriteBehindStorage,
+)
+from storage_backends.log_structured import LogStructured
+from storage_backends.redis import RedisStorage
+from storage_backends.sqlite import SQLite
 from metrics import start_metrics_server, BotMetrics
 
 
+def create_storage(backend: str, path: str, confirm_code_ttl: int) -> AbstractStorage:
+    """
+    Creates storage backend by its name
+    """
+    match backend:
+        case "redis":
+            return RedisStorage.from_url(
+                os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+                int(os.getenv("REDIS_POOL_SIZE", "16")),
+                confirm_code_ttl=confirm_code_ttl,
+                prefix=os.getenv("REDIS_PREFIX", "antispam"),
+            )
+        case "sqlite":
+            os.makedirs(path, exist_ok=True)
+            return SQLite(os.path.join(path, "bot.sqlite3"))
+        case "log":
+            return LogStructured(os.path.join(path, "log"))
+        case _:
+            return FileSystem(path)
+
+
+def create_cas_index(metrics: BotMetrics) -> CASIndex | None:
+    """
+    Creates local CAS ban list when it is enabled. List is loaded in background
+    """
+    if os.getenv("CAS_LOCAL_INDEX", "0") != "1":
+        return None
+    cas_index = CASIndex(
+        os.getenv("CAS_EXPORT_URL", CAS_EXPORT_URL),
+        float(os.getenv("CAS_REFRESH_INTERVAL", "3600")),
+        metrics=metrics,
+        logger=Logger("CASIndex"),
+    )
+    cas_index.start()
+    return cas_index
+
+
 def main():
     """
     Main entrypoint
@@ -25,23 +81,124 @@ def main():
     )
 
     bot_metrics = BotMetrics()
-    storage = FileSystem(
-        os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "storage")
+    kick_after_sec = int(os.getenv("PLUGIN_KICK_NOT_CONFIRMED_USER_AFTER", "180"))
+    # Confirm codes are kept a bit longer than captha lives, so user who solves
+    # captha right before kick is not affected
+    confirm_code_ttl = kick_after_sec + int(os.getenv("CONFIRM_CODE_EXPIRE_GRACE", "3600"))
+    backend = os.getenv("STORAGE_BACKEND", "filesystem")
+    storage = create_storage(
+        backend,
+        os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), "storage"),
+        confirm_code_ttl,
     )
-    bot = telebot.TeleBot(os.getenv("TELEGRAM_BOT_TOKEN"))
+    if os.getenv("STORAGE_WRITE_BEHIND", "0") == "1":
+        storage = WriteBehindStorage(storage, logger=Logger("Storage"))
+    if os.getenv("STORAGE_CONFIRMED_SETS", "0") == "1":
+        storage = ConfirmedSetStorage(storage, bot_metrics)
+    # Shared storage can be changed by other bot instances, so local cache is
+    # disabled for it unless enabled explicitly
+    cache_size = int(
+        os.getenv("STORAGE_CACHE_SIZE", "0" if backend == "redis" else "100000")
+    )
+    if cache_size > 0:
+        storage = CachedStorage(storage, cache_size, bot_metrics)
+    sweeper = ConfirmCodeSweeper(
+        storage,
+        confirm_code_ttl,
+        metrics=bot_metrics,
+        logger=Logger("ConfirmCodeSweeper"),
+    )
+    cas_index = create_cas_index(bot_metrics)
+    if os.getenv("ENGINE_MODE", "thread") == "async":
+        main_async(storage, bot_metrics, kick_after_sec, sweeper, cas_index)
+        return
+
+    webhook_mode = os.getenv("UPDATES_MODE", "polling") == "webhook"
+    # Webhook workers run handlers themselves, so telebot thread pool is not used
+    bot = telebot.TeleBot(os.getenv("TELEGRAM_BOT_TOKEN"), threaded=not webhook_mode)
+    webhook = None
+    if webhook_mode:
+        webhook = WebhookServer(
+            bot,
+            os.getenv("WEBHOOK_SECRET_TOKEN"),
+            os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            int(os.getenv("WEBHOOK_PORT", "8443")),
+            os.getenv("WEBHOOK_PATH", "/webhook"),
+            os.getenv("WEBHOOK_URL") or None,
+            workers=int(os.getenv("WEBHOOK_WORKERS", "4")),
+            queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "256")),
+            metrics=bot_metrics,
+            logger=Logger("Webhook"),
+        )
     logger = Logger("BOT")
     engine = Engine(
-        os.getenv("TELEGRAM_BOT_USERNAME"), bot, bot_metrics, storage, logger
+        os.getenv("TELEGRAM_BOT_USERNAME"),
+        bot,
+        bot_metrics,
+        storage,
+        logger,
+        int(os.getenv("ENGINE_REPLY_WORKERS", "4")),
+        RateLimiter(
+            float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "30")),
+            float(os.getenv("RATE_LIMIT_GROUP_PER_MINUTE", "20")) / 60,
+        ),
+        delete_batch_window=float(os.getenv("DELETE_BATCH_WINDOW", "0.5")),
+        dead_letter=JsonLinesDeadLetterSink(os.getenv("DEAD_LETTER_FILE"))
+        if os.getenv("DEAD_LETTER_FILE")
+        else None,
+        webhook=webhook,
+        reply_starvation_after=float(os.getenv("REPLY_STARVATION_AFTER", "5")),
+        journal=TaskJournal(os.getenv("TASK_JOURNAL_FILE"))
+        if os.getenv("TASK_JOURNAL_FILE")
+        else None,
+        drain_timeout=float(os.getenv("ENGINE_DRAIN_TIMEOUT", "30")),
+        plugin_workers=int(os.getenv("PLUGIN_WORKERS", "8")),
+        plugin_timeout=float(os.getenv("PLUGIN_TIMEOUT", "10")) or None,
+    )
+    engine.add_plugin(
+        CASBan(
+            Logger("CasBan"),
+            cas_index,
+            os.getenv("CAS_HTTP_FALLBACK", "0") == "1",
+            CASClient(
+                pool_size=int(os.getenv("CAS_POOL_SIZE", "8")),
+                positive_ttl=float(os.getenv("CAS_POSITIVE_TTL", "86400")),
+                negative_ttl=float(os.getenv("CAS_NEGATIVE_TTL", "600")),
+                metrics=bot_metrics,
+            ),
+        )
     )
-    engine.add_plugin(CASBan(Logger("CasBan")))
     engine.add_plugin(
         AntispamVerification(
             Logger("AntispamVerification"),
             engine,
-            int(os.getenv("PLUGIN_KICK_NOT_CONFIRMED_USER_AFTER", "180")),
+            kick_after_sec,
         )
     )
     engine.add_plugin(RemoveMemberJoinedMessage(Logger("RemoveMemberJoinedMessage")))
+    if os.getenv("SPAM_PHRASES_FILE"):
+        spam_filter = SpamPhraseFilter(
+            Logger("SpamPhraseFilter"),
+            os.getenv("SPAM_PHRASES_FILE"),
+            float(os.getenv("SPAM_PHRASES_RELOAD_INTERVAL", "30")),
+            bot_metrics,
+        )
+        spam_filter.start()
+        engine.add_plugin(spam_filter)
+    if os.getenv("DUPLICATE_FLOOD_FILTER", "0") == "1":
+        engine.add_plugin(
+            DuplicateFloodFilter(
+                Logger("DuplicateFloodFilter"),
+                DuplicateIndex(
+                    window=float(os.getenv("DUPLICATE_FLOOD_WINDOW", "60")),
+                    min_chats=int(os.getenv("DUPLICATE_FLOOD_MIN_CHATS", "3")),
+                    max_entries=int(os.getenv("DUPLICATE_FLOOD_MAX_ENTRIES", "10000")),
+                ),
+                int(os.getenv("DUPLICATE_FLOOD_MIN_LENGTH", "30")),
+                os.getenv("DUPLICATE_FLOOD_BAN", "0") == "1",
+                bot_metrics,
+            )
+        )
     engine.add_plugin(TestPlugin(Logger("TestPlugin")))
 
     def handle_ctrlc(
@@ -52,14 +209,97 @@ def main():
         Function for handling Ctrl+C keys pressed
         """
         print("\n*** Ctrl-c was pressed. Stopping bot... ")
+        sweeper.stop()
         engine.stop()
         sys.exit(0)
 
     signal.signal(signal.SIGINT, handle_ctrlc)
     signal.signal(signal.SIGTERM, handle_ctrlc)
 
+    sweeper.start()
+
     engine.start()
 
 
+async def run_async_engine(
+    engine, cas_ban, verification, sweeper: ConfirmCodeSweeper
+) -> None:
+    """
+    Runs asyncio engine until SIGINT or SIGTERM is received
+    """
+    await verification.restore_kick_deadlines()
+    polling = asyncio.ensure_future(engine.start())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, polling.cancel)
+    try:
+        await polling
+    except asyncio.CancelledError:
+        print("\n*** Signal received. Stopping bot... ")
+    sweeper.stop()
+    await engine.stop()
+    await cas_ban.client.close()
+
+
+def main_async(
+    storage: AbstractStorage,
+    bot_metrics: BotMetrics,
+    kick_after_sec: int,
+    sweeper: ConfirmCodeSweeper,
+    cas_index: CASIndex | None,
+) -> None:
+    """
+    Entrypoint of asyncio engine. Aiohttp is imported only here, so it is not
+    required when thread engine is used
+    """
+    # pylint: disable=import-outside-toplevel
+    from telebot.async_telebot import AsyncTeleBot
+
+    from async_bot import AsyncEngine
+    from plugins.async_members import (
+        AsyncAntispamVerification,
+        AsyncCASBan,
+        AsyncCASClient,
+        AsyncRemoveMemberJoinedMessage,
+    )
+
+    engine = AsyncEngine(
+        os.getenv("TELEGRAM_BOT_USERNAME"),
+        AsyncTeleBot(os.getenv("TELEGRAM_BOT_TOKEN")),
+        bot_metrics,
+        AsyncStorage(storage, int(os.getenv("ASYNC_STORAGE_WORKERS", "8"))),
+        Logger("BOT"),
+        int(os.getenv("ASYNC_MAX_CONCURRENCY", "32")),
+        RateLimiter(
+            float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "30")),
+            float(os.getenv("RATE_LIMIT_GROUP_PER_MINUTE", "20")) / 60,
+        ),
+        dead_letter=JsonLinesDeadLetterSink(os.getenv("DEAD_LETTER_FILE"))
+        if os.getenv("DEAD_LETTER_FILE")
+        else None,
+    )
+    cas_ban = AsyncCASBan(
+        Logger("CasBan"),
+        AsyncCASClient(
+            positive_ttl=float(os.getenv("CAS_POSITIVE_TTL", "86400")),
+            negative_ttl=float(os.getenv("CAS_NEGATIVE_TTL", "600")),
+            metrics=bot_metrics,
+        ),
+        index=cas_index,
+        http_fallback=os.getenv("CAS_HTTP_FALLBACK", "0") == "1",
+    )
+    verification = AsyncAntispamVerification(
+        Logger("AntispamVerification"), engine, kick_after_sec
+    )
+    engine.add_plugin(cas_ban)
+    engine.add_plugin(verification)
+    engine.add_plugin(
+        AsyncRemoveMemberJoinedMessage(Logger("RemoveMemberJoinedMessage"))
+    )
+
+    sweeper.start()
+    asyncio.run(run_async_engine(engine, cas_ban, verification, sweeper))
+
+
 if __name__ == "__main__":
     main()
@@ -1,4 +1,4 @@
-from prometheus_client import start_http_server, Counter
+from prometheus_client import start_http_server, Counter, Gauge, Histogram
 
 
 def start_metrics_server(port: int, host: str = "0.0.0.0"):
@@ -46,6 +46,160 @@ class BotMetrics:
                 "chat_id",
             ],
         )
+        self.storage_cache_hits_total = Counter(
+            "storage_cache_hits_total",
+            "Total number of storage lookups served from cache",
+            [
+                "method_name",
+            ],
+        )
+        self.storage_cache_misses_total = Counter(
+            "storage_cache_misses_total",
+            "Total number of storage lookups passed to underlying storage",
+            [
+                "method_name",
+            ],
+        )
+        self.confirmed_sets_groups = Gauge(
+            "confirmed_sets_groups",
+            "Number of groups with confirmed users set loaded into memory",
+        )
+        self.confirmed_sets_users = Gauge(
+            "confirmed_sets_users",
+            "Number of confirmed users kept in memory",
+        )
+        self.confirmed_sets_bytes = Gauge(
+            "confirmed_sets_bytes",
+            "Approximate memory used by confirmed users sets",
+        )
+        self.pending_confirm_codes = Gauge(
+            "pending_confirm_codes",
+            "Number of confirm codes of users who did not solve captha yet",
+        )
+        self.confirm_codes_swept_total = Counter(
+            "confirm_codes_swept_total",
+            "Total number of removed expired confirm codes",
+        )
+        self.reply_queue_depth = Gauge(
+            "reply_queue_depth",
+            "Number of tasks waiting in queue of reply worker",
+            [
+                "worker",
+            ],
+        )
+        self.reply_tasks_in_flight = Gauge(
+            "reply_tasks_in_flight",
+            "Number of tasks executed by reply worker right now",
+            [
+                "worker",
+            ],
+        )
+        self.reply_tasks_retried_total = Counter(
+            "reply_tasks_retried_total",
+            "Total number of failed reply tasks scheduled for retry",
+            [
+                "method_name",
+            ],
+        )
+        self.reply_tasks_dead_lettered_total = Counter(
+            "reply_tasks_dead_lettered_total",
+            "Total number of reply tasks dropped after all tries",
+            [
+                "method_name",
+            ],
+        )
+        self.reply_tasks_throttled_total = Counter(
+            "reply_tasks_throttled_total",
+            "Total number of reply tasks delayed by rate limits",
+            [
+                "reason",
+            ],
+        )
+        self.reply_queue_wait_seconds = Histogram(
+            "reply_queue_wait_seconds",
+            "Time reply task waited in priority lane of reply queue",
+            [
+                "lane",
+            ],
+            buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+        )
+        self.cas_index_size = Gauge(
+            "cas_index_size",
+            "Number of users in local CAS ban list",
+        )
+        self.cas_index_refresh_total = Counter(
+            "cas_index_refresh_total",
+            "Total number of local CAS ban list refreshes",
+            [
+                "status",
+            ],
+        )
+        self.cas_cache_lookups_total = Counter(
+            "cas_cache_lookups_total",
+            "Total number of CAS lookups by cache result",
+            [
+                "result",
+            ],
+        )
+        self.cas_request_seconds = Histogram(
+            "cas_request_seconds",
+            "Latency of CAS api requests",
+            [
+                "status",
+            ],
+            buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5),
+        )
+        self.cas_circuit_open = Gauge(
+            "cas_circuit_open",
+            "Set to 1 when CAS requests are stopped after failures",
+        )
+        self.plugin_execution_seconds = Histogram(
+            "plugin_execution_seconds",
+            "Execution time of plugin",
+            [
+                "plugin_name",
+            ],
+            buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+        )
+        self.plugin_timeouts_total = Counter(
+            "plugin_timeouts_total",
+            "Total number of plugins not finished in time",
+            [
+                "plugin_name",
+            ],
+        )
+        self.spam_phrases_matched_total = Counter(
+            "spam_phrases_matched_total",
+            "Total number of messages containing blocked phrases",
+            [
+                "action",
+            ],
+        )
+        self.duplicate_messages_total = Counter(
+            "duplicate_messages_total",
+            "Total number of copies of text posted in many groups",
+            [
+                "action",
+            ],
+        )
+        self.duplicate_index_size = Gauge(
+            "duplicate_index_size",
+            "Number of texts in index of recent messages",
+        )
+        self.webhook_updates_total = Counter(
+            "webhook_updates_total",
+            "Total number of requests received by webhook",
+            [
+                "status",
+            ],
+        )
+        self.webhook_queue_depth = Gauge(
+            "webhook_queue_depth",
+            "Number of updates waiting in queue of webhook worker",
+            [
+                "worker",
+            ],
+        )
 
     def inc_captha_solved_total(self, captha_code: str):
         self.captha_solved_total.labels(captha_code).inc()
@@ -61,3 +215,74 @@ class BotMetrics:
 
     def inc_commands_executed_total(self, command_name: str, chat_id: int):
         self.commands_executed_total.labels(command_name, chat_id).inc()
+
+    def inc_storage_cache_hits_total(self, method_name: str, amount: int = 1):
+        self.storage_cache_hits_total.labels(method_name).inc(amount)
+
+    def inc_storage_cache_misses_total(self, method_name: str, amount: int = 1):
+        self.storage_cache_misses_total.labels(method_name).inc(amount)
+
+    def set_confirmed_sets_size(self, groups: int, users: int, memory_usage: int):
+        self.confirmed_sets_groups.set(groups)
+        self.confirmed_sets_users.set(users)
+        self.confirmed_sets_bytes.set(memory_usage)
+
+    def set_pending_confirm_codes(self, count: int):
+        self.pending_confirm_codes.set(count)
+
+    def inc_confirm_codes_swept_total(self, amount: int = 1):
+        self.confirm_codes_swept_total.inc(amount)
+
+    def set_reply_queue_depth(self, worker: int, depth: int):
+        self.reply_queue_depth.labels(worker).set(depth)
+
+    def set_reply_tasks_in_flight(self, worker: int, count: int):
+        self.reply_tasks_in_flight.labels(worker).set(count)
+
+    def inc_reply_tasks_throttled_total(self, reason: str):
+        self.reply_tasks_throttled_total.labels(reason).inc()
+
+    def inc_reply_tasks_retried_total(self, method_name: str):
+        self.reply_tasks_retried_total.labels(method_name).inc()
+
+    def inc_reply_tasks_dead_lettered_total(self, method_name: str):
+        self.reply_tasks_dead_lettered_total.labels(method_name).inc()
+
+    def observe_reply_queue_wait_seconds(self, lane: str, seconds: float):
+        self.reply_queue_wait_seconds.labels(lane).observe(seconds)
+
+    def set_cas_index_size(self, size: int):
+        self.cas_index_size.set(size)
+
+    def inc_cas_index_refresh_total(self, status: str):
+        self.cas_index_refresh_total.labels(status).inc()
+
+    def inc_cas_cache_lookups_total(self, result: str):
+        self.cas_cache_lookups_total.labels(result).inc()
+
+    def observe_cas_request_seconds(self, status: str, seconds: float):
+        self.cas_request_seconds.labels(status).observe(seconds)
+
+    def set_cas_circuit_open(self, is_open: bool):
+        self.cas_circuit_open.set(int(is_open))
+
+    def observe_plugin_execution_seconds(self, plugin_name: str, seconds: float):
+        self.plugin_execution_seconds.labels(plugin_name).observe(seconds)
+
+    def inc_plugin_timeouts_total(self, plugin_name: str):
+        self.plugin_timeouts_total.labels(plugin_name).inc()
+
+    def inc_spam_phrases_matched_total(self, action: str):
+        self.spam_phrases_matched_total.labels(action).inc()
+
+    def inc_duplicate_messages_total(self, action: str, count: int = 1):
+        self.duplicate_messages_total.labels(action).inc(count)
+
+    def set_duplicate_index_size(self, size: int):
+        self.duplicate_index_size.set(size)
+
+    def inc_webhook_updates_total(self, status: str):
+        self.webhook_updates_total.labels(status).inc()
+
+    def set_webhook_queue_depth(self, worker: int, depth: int):
+        self.webhook_queue_depth.labels(worker).set(depth)
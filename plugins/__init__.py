@@ -1,29 +1,54 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
 
 import telebot
 
 import bot
 from logger import Logger
 
+if TYPE_CHECKING:
+    # Async engine requires aiohttp, which is not needed for thread engine
+    import async_bot
+
 PLUGIN_NEW_CHAT_MESSAGE = 1
 PLUGIN_NEW_CHAT_MEMBER = 2
 
 
-class AbstractPlugin(ABC):
-    """ Base class for all of plugins """
+class BasePlugin(ABC):
+    """ Logging shared by plugins of thread and asyncio engines """
 
     def __init__(self, logger: Logger) -> None:
         self._logger = logger
 
-    @abstractmethod
-    def execute(self, engine: bot.Engine, message: telebot.types.Message) -> None | bool:
-        pass
-
     def log(self, msg: str, severity: str = "info") -> None:
         match severity:
             case "error":
                 self._logger.error(msg)
             case _:
                 self._logger.info(msg)
+
+
+class AbstractPlugin(BasePlugin):
+    """ Base class for all of plugins """
+
+    # Plugin does not depend on results of other plugins, so it is run concurrently
+    # with them and its result does not stop them
+    concurrent: bool = False
+    # Seconds engine waits for plugin, default timeout of engine is used when None
+    timeout: float | None = None
+
+    @abstractmethod
+    def execute(self, engine: bot.Engine, message: telebot.types.Message) -> None | bool:
+        pass
+
+
+class AsyncAbstractPlugin(BasePlugin):
+    """ Base class for plugins of asyncio engine """
+
+    @abstractmethod
+    async def execute(
+        self, engine: async_bot.AsyncEngine, message: telebot.types.Message
+    ) -> None | bool:
+        pass
@@ -0,0 +1,234 @@
+"""
+This module contains plugins for asyncio engine which handle events when new chat member
+joins to group
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+import aiohttp
+import telebot
+
+from entities.cas_client import CAS_HOST, CASClientBase, CircuitBreaker
+from entities.cas_index import CASIndex
+from metrics import BotMetrics
+from plugins import AsyncAbstractPlugin, PLUGIN_NEW_CHAT_MEMBER
+from plugins.members import CaptchaMixin, lookup_cas_index
+
+if TYPE_CHECKING:
+    import async_bot
+
+
+class AsyncMemberPlugin(AsyncAbstractPlugin):
+    """Base class for new member plugins of asyncio engine"""
+
+    plugin_type = PLUGIN_NEW_CHAT_MEMBER
+
+
+class AsyncCASClient(CASClientBase):
+    """
+    Client of combot anti-spam service. One http session is shared by all lookups.
+    Results are cached and failing service is not asked in the same way as by
+    CASClient
+    """
+
+    def __init__(
+        self,
+        host: str = CAS_HOST,
+        req_timeout: float = 3,
+        positive_ttl: float = 24 * 3600,
+        negative_ttl: float = 600,
+        cache_size: int = 100000,
+        breaker: CircuitBreaker = None,
+        metrics: BotMetrics = None,
+        clock=time.monotonic,
+    ) -> None:
+        super().__init__(
+            host, req_timeout, positive_ttl, negative_ttl, cache_size, breaker, metrics, clock
+        )
+        self._session: aiohttp.ClientSession | None = None
+
+    async def is_banned(self, user_id: int) -> bool:
+        """
+        Returns True when user is banned by CAS. Raises CircuitOpenError when
+        service is failing and request errors when it fails right now
+        """
+        cached = self._cached(user_id)
+        if cached is not None:
+            return cached
+        if self._session is None:
+            # Session must be created inside running event loop
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.req_timeout)
+            )
+        started = time.monotonic()
+        try:
+            async with self._session.get(self.host, params={"user_id": user_id}) as response:
+                response.raise_for_status()
+                json = await response.json(content_type=None)
+                banned = bool(json.get("ok", False))
+        except Exception:
+            self._request_failed(started)
+            raise
+        self._request_succeeded(user_id, banned, started)
+        return banned
+
+    async def close(self) -> None:
+        """Closes http session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncCASBan(AsyncMemberPlugin):
+    """
+    Check if member is already banned by combot service. All new members are checked
+    concurrently. Local index of ban list is used in the same way as by CASBan
+    """
+
+    def __init__(
+        self,
+        logger,
+        client: AsyncCASClient = None,
+        index: CASIndex = None,
+        http_fallback: bool = False,
+    ) -> None:
+        super().__init__(logger)
+        self.client = client or AsyncCASClient()
+        self.index = index
+        self.http_fallback = http_fallback
+
+    async def execute(
+        self, engine: async_bot.AsyncEngine, message: telebot.types.Message
+    ) -> None | bool:
+        members = message.new_chat_members
+        results = await asyncio.gather(
+            *(self._is_banned(x.id) for x in members), return_exceptions=True
+        )
+        banned = False
+        for new_member, result in zip(members, results):
+            if isinstance(result, Exception):
+                self.log(f"CAS check for user {new_member.id} failed: {result}", "error")
+                continue
+            if not result:
+                continue
+            self.log(f"CAS ban for {new_member.username}, {new_member.full_name}")
+            engine.ban_user(message.chat.id, new_member.id)
+            banned = True
+        return banned or None
+
+    async def _is_banned(self, user_id: int) -> bool:
+        banned = lookup_cas_index(self.index, user_id, self.http_fallback)
+        if banned is not None:
+            return banned
+        return await self.client.is_banned(user_id)
+
+
+class AsyncAntispamVerification(CaptchaMixin, AsyncMemberPlugin):
+    """
+    Performs antispam verification on asyncio engine. Kicks user from group if they
+    not passed verification through emoji
+    """
+
+    def __init__(
+        self, logger, engine: async_bot.AsyncEngine, kick_after_sec: int = 180
+    ) -> None:
+        super().__init__(logger)
+        self.engine = engine
+        self.kick_after_sec = kick_after_sec
+
+        self.engine.add_callback_query_handler(self._user_selected_answer, func=None)
+
+    async def execute(
+        self, engine: async_bot.AsyncEngine, message: telebot.types.Message
+    ) -> None | bool:
+        bot_added, new_members = self._split_new_members(engine, message)
+        if bot_added:
+            await engine.on_bot_added_to_group(message.chat.id)
+
+        states = await engine.storage.get_users_state(
+            message.chat.id, [x.id for x in new_members]
+        )
+        confirm_codes, unconfirmed = self._select_confirm_codes(new_members, states)
+        if confirm_codes:
+            await engine.storage.set_users_confirm_code(message.chat.id, confirm_codes)
+
+        for new_member, confirm_code in unconfirmed:
+            engine.create_task(
+                self._send_captcha(engine, message.chat.id, new_member, confirm_code)
+            )
+
+    async def _send_captcha(
+        self,
+        engine: async_bot.AsyncEngine,
+        group_id: int,
+        new_member: telebot.types.User,
+        confirm_code: str,
+    ) -> None:
+        try:
+            sent = await engine.send_message(
+                **self._captcha_message(group_id, new_member, confirm_code)
+            )
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self.log(
+                f"Captcha for user {new_member.id} in group {group_id} was not sent: {exc}",
+                "error",
+            )
+            return
+
+        deadline = self._kick_deadline(group_id, new_member.id, sent.id)
+        # Deadline is saved, so user is kicked even if bot is restarted
+        await engine.storage.add_kick_deadlines([deadline])
+        self._schedule_kick(engine, deadline)
+
+    async def restore_kick_deadlines(self) -> None:
+        """Schedules kicks saved before restart. Must be called inside event loop"""
+        deadlines = await self.engine.storage.get_kick_deadlines()
+        for deadline in deadlines:
+            self._schedule_kick(self.engine, deadline)
+        if deadlines:
+            self.log(f"Restored {len(deadlines)} kick deadlines")
+
+    async def _user_selected_answer(self, callback: telebot.types.CallbackQuery) -> None:
+        chat_id = callback.message.chat.id
+        user_id = callback.from_user.id
+
+        answer = self._parse_answer(callback.data)
+        if answer is None:
+            return
+
+        state = await self.engine.storage.get_user_state(chat_id, user_id)
+        if not self._is_solved(callback, state, answer):
+            return
+        await self.engine.storage.set_user_confirmed(chat_id, user_id)
+        self.engine.scheduler.cancel(("kick", chat_id, user_id))
+        await self.engine.storage.remove_kick_deadline(chat_id, user_id)
+        self.engine.delete_message(chat_id=chat_id, message_id=callback.message.id)
+        self.engine.metrics.inc_captha_solved_total(answer)
+
+    async def kick_inactive(
+        self,
+        engine: async_bot.AsyncEngine,
+        group_id: int,
+        user_id: int,
+        captha_msg_id: int,
+    ) -> None:
+        """Removes chat member if they does not pressed validation button"""
+        await engine.storage.remove_kick_deadline(group_id, user_id)
+        if await engine.storage.is_user_confirmed(group_id, user_id):
+            return
+
+        engine.kick_chat_member(group_id, user_id)
+        self._log_kicked(group_id, user_id)
+        engine.delete_message(group_id, captha_msg_id)
+
+
+class AsyncRemoveMemberJoinedMessage(AsyncMemberPlugin):
+    """Performs removing message about new member joined"""
+
+    async def execute(
+        self, engine: async_bot.AsyncEngine, message: telebot.types.Message
+    ) -> None | bool:
+        engine.delete_message(message.chat.id, message.id)
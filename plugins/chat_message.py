@@ -2,9 +2,16 @@
 This module contains user-defined plugins which can be plugged into bot to handle events
 when new chat messages received
 """
+import os
+from threading import Event, Thread
+import traceback
+
 import telebot
 
 import bot
+from entities.aho_corasick import AhoCorasick, normalize_text
+from entities.simhash import DuplicateIndex, simhash
+from metrics import BotMetrics
 from plugins import PLUGIN_NEW_CHAT_MESSAGE, AbstractPlugin
 
 
@@ -22,3 +29,169 @@ class TestPlugin(ChatMessagePlugin):
         self, engine: bot.Engine, message: telebot.types.Message
     ) -> None | bool:
         self._logger.info("Received message")
+
+
+class SpamPhraseFilter(ChatMessagePlugin):
+    """
+    Deletes messages containing phrases, links or usernames from blocklist file.
+    File has one phrase per line, lines starting with # are comments and phrases
+    starting with ! also ban author of message. All phrases are compiled into one
+    automaton, so every message is checked by one pass whatever number of phrases.
+    File is reloaded in background when it is changed, new automaton replaces old
+    one when it is built
+    """
+
+    def __init__(
+        self,
+        logger,
+        path: str,
+        reload_interval: float = 30,
+        metrics: BotMetrics = None,
+    ) -> None:
+        super().__init__(logger)
+        self.path = path
+        self.reload_interval = reload_interval
+        self._metrics = metrics
+        # Automaton and phrases banning author, replaced together by one assignment
+        self._blocklist: tuple[AhoCorasick, frozenset[str]] = (AhoCorasick(()), frozenset())
+        self._mtime: float | None = None
+        self._stop = Event()
+        self._thread = Thread(target=self._reload_loop, daemon=True)
+        self.reload()
+
+    def start(self) -> None:
+        """Starts watching blocklist file"""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops watching blocklist file"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def reload(self) -> bool:
+        """Loads blocklist when file was changed. Returns True when it was loaded"""
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self._mtime:
+            return False
+        phrases, ban_phrases = [], set()
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                ban = line.startswith("!")
+                phrase = normalize_text(line[1:].strip() if ban else line)
+                if not phrase:
+                    continue
+                phrases.append(phrase)
+                if ban:
+                    ban_phrases.add(phrase)
+        matcher = AhoCorasick(phrases)
+        self._blocklist = (matcher, frozenset(ban_phrases))
+        self._mtime = mtime
+        self.log(f"Loaded {len(matcher)} blocked phrases from {self.path}")
+        return True
+
+    def execute(
+        self, engine: bot.Engine, message: telebot.types.Message
+    ) -> None | bool:
+        matcher, ban_phrases = self._blocklist
+        text = self._message_text(message)
+        if not text or not len(matcher):
+            return None
+
+        matched = None
+        for _, phrase in matcher.find_all(normalize_text(text)):
+            matched = phrase
+            if phrase in ban_phrases:
+                break
+        if matched is None:
+            return None
+
+        ban = matched in ban_phrases
+        self.log(
+            f"Message {message.id} of user {message.from_user.id} in group "
+            + f"{message.chat.id} contains blocked phrase '{matched}'"
+        )
+        engine.delete_message(message.chat.id, message.id)
+        if ban:
+            engine.ban_user(message.chat.id, message.from_user.id)
+        if self._metrics is not None:
+            self._metrics.inc_spam_phrases_matched_total("ban" if ban else "delete")
+        return True
+
+    @staticmethod
+    def _message_text(message: telebot.types.Message) -> str:
+        # Links hidden behind text are checked too
+        parts = [message.text or message.caption or ""]
+        for entity in message.entities or message.caption_entities or []:
+            if entity.type == "text_link" and entity.url:
+                parts.append(entity.url)
+        return "\n".join(parts)
+
+    def _reload_loop(self) -> None:
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                self.log(
+                    f"Error loading blocklist {self.path}: {exc}\n{traceback.format_exc()}",
+                    "error",
+                )
+
+
+class DuplicateFloodFilter(ChatMessagePlugin):
+    """
+    Deletes text posted by spammers in many groups at once. Fingerprint of every
+    message is added to index shared by all groups, and when nearly the same text
+    was posted in min_chats groups during window seconds, all its copies are
+    deleted and, when ban is set, their authors are banned. Short messages are
+    skipped, because greetings and thanks are posted everywhere by people
+    """
+
+    concurrent = True
+
+    def __init__(
+        self,
+        logger,
+        index: DuplicateIndex = None,
+        min_length: int = 30,
+        ban: bool = False,
+        metrics: BotMetrics = None,
+    ) -> None:
+        super().__init__(logger)
+        self.index = index if index is not None else DuplicateIndex()
+        self.min_length = min_length
+        self.ban = ban
+        self._metrics = metrics
+
+    def execute(
+        self, engine: bot.Engine, message: telebot.types.Message
+    ) -> None | bool:
+        text = message.text or message.caption
+        if not text or len(text) < self.min_length:
+            return None
+
+        duplicate = self.index.add(
+            simhash(text), message.chat.id, message.from_user.id, message.id
+        )
+        if self._metrics is not None:
+            self._metrics.set_duplicate_index_size(len(self.index))
+        if not duplicate.flagged:
+            return None
+
+        self.log(
+            f"Message {message.id} of user {message.from_user.id} in group "
+            + f"{message.chat.id} was posted in {duplicate.chats} groups by "
+            + f"{duplicate.users} users, deleting {len(duplicate.copies)} copies"
+        )
+        for chat_id, message_id, user_id in duplicate.copies:
+            engine.delete_message(chat_id, message_id)
+            if self.ban:
+                engine.ban_user(chat_id, user_id)
+        if self._metrics is not None:
+            self._metrics.inc_duplicate_messages_total(
+                "ban" if self.ban else "delete", len(duplicate.copies)
+            )
+        return True
@@ -2,18 +2,19 @@
 This module contains user-defined plugins which can be plugged into bot to handle events
 when new chat member joins to group
 """
-from threading import Timer
+from concurrent.futures import Future
+from functools import partial
 from random import choice, seed, shuffle
+import time
 
-import requests
 import telebot
 
 import bot
+from entities.cas_client import CASClient
+from entities.cas_index import CASIndex
 from views import messages
 from plugins import AbstractPlugin, PLUGIN_NEW_CHAT_MEMBER
-from entities.delayed_response import DelayedResponseQueue
-
-_CAS_HOST = "https://api.cas.chat/check"
+from storage import KickDeadline, UserState
 
 
 class MemberPlugin(AbstractPlugin):
@@ -22,43 +23,73 @@ class MemberPlugin(AbstractPlugin):
     plugin_type = PLUGIN_NEW_CHAT_MEMBER
 
 
+def lookup_cas_index(index: CASIndex | None, user_id: int, http_fallback: bool) -> bool | None:
+    """
+    Returns whether user is in loaded local ban list. Returns None when user has to
+    be checked in api: list is not given or not loaded yet, or user is not in list
+    and http_fallback is set
+    """
+    if index is None or not index.loaded:
+        return None
+    if user_id in index:
+        return True
+    return None if http_fallback else False
+
+
 class CASBan(MemberPlugin):
     """
-    Check if member is already banned by combot service
+    Check if member is already banned by combot service. All new members are checked
+    concurrently. When local index of ban list is given and loaded, members are
+    checked in memory only, api is asked for members not found in index when
+    http_fallback is set. Members who could not be checked are let in
     """
 
-    req_timeout = 3
+    def __init__(
+        self,
+        logger,
+        index: CASIndex = None,
+        http_fallback: bool = False,
+        client: CASClient = None,
+    ) -> None:
+        super().__init__(logger)
+        self.index = index
+        self.http_fallback = http_fallback
+        self.client = client or CASClient()
 
     def execute(
         self, engine: bot.Engine, message: telebot.types.Message
     ) -> None | bool:
-        for new_member in message.new_chat_members:
-            self._logger.info(
-                f"Checking CAS ban for user {new_member.id} in group {message.chat.id}"
-            )
-            response = requests.get(
-                _CAS_HOST, params={"user_id": new_member.id}, timeout=self.req_timeout
-            )
-            if response.status_code != 200:
-                return None
-
-            json = response.json()
-            if not json.get("ok", False):
-                return None
+        members = message.new_chat_members
+        self.log(
+            f"Checking CAS ban for users {[x.id for x in members]} in group {message.chat.id}"
+        )
+        results = {}
+        for new_member in members:
+            banned = lookup_cas_index(self.index, new_member.id, self.http_fallback)
+            if banned is not None:
+                results[new_member.id] = banned
+        results.update(
+            self.client.check_many([x.id for x in members if x.id not in results])
+        )
 
-            self._logger.info(
-                f"CAS ban for {new_member.username}, {new_member.full_name}",
-                module_name="CASBan",
-            )
+        banned = False
+        for new_member in members:
+            result = results[new_member.id]
+            if isinstance(result, Exception):
+                self.log(f"CAS check for user {new_member.id} failed: {result}", "error")
+                continue
+            if not result:
+                continue
+            self.log(f"CAS ban for {new_member.username}, {new_member.full_name}")
             engine.ban_user(message.chat.id, new_member.id)
+            banned = True
+        return banned or None
 
-            return True
 
-
-class AntispamVerification(MemberPlugin):
+class CaptchaMixin:
     """
-    Performs antispam verification. Kicks user from group if they not passed verification
-    through emoji
+    Emoji captcha shared by thread and asyncio versions of verification plugin.
+    Plugins only read and write storage and call api in their own way
     """
 
     emojies = {
@@ -70,121 +101,219 @@ class AntispamVerification(MemberPlugin):
         "🐶": "Песик",
     }
 
-    def __init__(self, logger, engine: bot.Engine, kick_after_sec: int = 180) -> None:
-        super().__init__(logger)
-        self.engine = engine
-        self.kick_after_sec = kick_after_sec
+    def _generate_confirm_code(self) -> str:
+        seed()
+        return choice(list(self.emojies))
 
-        self.engine.add_callback_query_handler(self._user_selected_answer, func=None)
+    def _get_emoji_keyboard(self) -> telebot.types.InlineKeyboardMarkup:
+        variants = list(self.emojies)
+        shuffle(variants)
+        return telebot.types.InlineKeyboardMarkup(
+            [
+                [
+                    telebot.types.InlineKeyboardButton(x, callback_data=f"verify_{x}")
+                    for x in variants
+                ]
+            ]
+        )
 
-    def execute(
-        self, engine: bot.Engine, message: telebot.types.Message
-    ) -> None | bool:
+    def _parse_answer(self, data: str) -> str | None:
+        """Returns emoji selected by user, or None when callback is not an answer"""
+        member_answer = data.split("_")
+        if len(member_answer) != 2:
+            self.log(f"Error parsing reply callback data: {data}")
+            return None
+
+        if member_answer[0] != "verify":
+            return None
+
+        return member_answer[1]
+
+    def _split_new_members(
+        self, engine, message: telebot.types.Message
+    ) -> tuple[bool, list[telebot.types.User]]:
+        """Returns True when bot itself was added to group, and the rest of members"""
+        bot_added = False
+        new_members = []
         for new_member in message.new_chat_members:
             if new_member.username == engine.bot_username:
-                engine.on_bot_added_to_group(message.chat.id)
                 self.log(f"The bot was added to group: {message.chat.title}")
+                bot_added = True
                 continue
-
-            if engine.storage.is_user_confirmed(message.chat.id, new_member.id):
+            new_members.append(new_member)
+        return bot_added, new_members
+
+    def _select_confirm_codes(
+        self, new_members: list[telebot.types.User], states: dict[int, UserState]
+    ) -> tuple[dict[int, str], list[tuple[telebot.types.User, str]]]:
+        """
+        Returns confirm codes generated for members who have no code yet, and
+        unconfirmed members with their codes
+        """
+        confirm_codes = {}
+        unconfirmed = []
+        for new_member in new_members:
+            state = states[new_member.id]
+            if state.confirmed:
                 self.log(
                     f"User {new_member.id} -> {new_member.full_name} is already confirmed."
                     + "Skip Verification"
                 )
                 continue
 
-            confirm_text = None
-            confirm_code = engine.storage.get_user_confirm_code(
-                message.chat.id, new_member.id
-            )
-            if confirm_code is None or not confirm_code:
+            confirm_code = state.confirm_code
+            if not confirm_code:
                 confirm_code = self._generate_confirm_code()
-                engine.storage.set_user_confirm_code(
-                    message.chat.id, new_member.id, confirm_code
-                )
-            if not confirm_text:
-                confirm_text = self.emojies[confirm_code]
-
-            response = engine.send_message(
-                reply_to=DelayedResponseQueue(),
-                chat_id=message.chat.id,
-                text=messages.render_new_member_joined_message(
-                    {
-                        "new_member": new_member,
-                        "confirm_text": confirm_text,
-                    },
-                ),
-                parse_mode="markdownV2",
-                reply_markup=self._get_emoji_keyboard(),
+                confirm_codes[new_member.id] = confirm_code
+            unconfirmed.append((new_member, confirm_code))
+        return confirm_codes, unconfirmed
+
+    def _captcha_message(
+        self, group_id: int, new_member: telebot.types.User, confirm_code: str
+    ) -> dict:
+        """Returns arguments of send_message sending captcha to new member"""
+        return {
+            "chat_id": group_id,
+            "text": messages.render_new_member_joined_message(
+                {
+                    "new_member": new_member,
+                    "confirm_text": self.emojies[confirm_code],
+                },
+            ),
+            "parse_mode": "markdownV2",
+            "reply_markup": self._get_emoji_keyboard(),
+        }
+
+    def _kick_deadline(self, group_id: int, user_id: int, message_id: int) -> KickDeadline:
+        """Returns deadline of user who was sent captcha just now"""
+        return KickDeadline(group_id, user_id, time.time() + self.kick_after_sec, message_id)
+
+    def _schedule_kick(self, engine, deadline: KickDeadline) -> None:
+        engine.scheduler.schedule(
+            ("kick", deadline.group_id, deadline.user_id),
+            deadline.kick_at,
+            self.kick_inactive,
+            engine,
+            deadline.group_id,
+            deadline.user_id,
+            deadline.message_id,
+        )
+
+    def _is_solved(
+        self, callback: telebot.types.CallbackQuery, state: UserState, answer: str
+    ) -> bool:
+        """Returns True when user selected emoji of their captcha"""
+        user = callback.from_user
+        if not state.confirmed and state.confirm_code == answer:
+            self.log(f"User {user.id}: {user.full_name} solved captha")
+            return True
+        self.log(f"User {user.id}:  {user.full_name} selected incorrect value {answer}")
+        return False
+
+    def _log_kicked(self, group_id: int, user_id: int) -> None:
+        self._logger.info(
+            f"User {user_id} was kicked from group {group_id} because not confirmed"
+        )
+
+
+class AntispamVerification(CaptchaMixin, MemberPlugin):
+    """
+    Performs antispam verification. Kicks user from group if they not passed verification
+    through emoji
+    """
+
+    def __init__(self, logger, engine: bot.Engine, kick_after_sec: int = 180) -> None:
+        super().__init__(logger)
+        self.engine = engine
+        self.kick_after_sec = kick_after_sec
+
+        self.engine.add_callback_query_handler(self._user_selected_answer, func=None)
+        self._restore_kick_deadlines()
+
+    def execute(
+        self, engine: bot.Engine, message: telebot.types.Message
+    ) -> None | bool:
+        bot_added, new_members = self._split_new_members(engine, message)
+        if bot_added:
+            engine.on_bot_added_to_group(message.chat.id)
+
+        # Raids add many members in one update, so their state is read and
+        # written with one storage call
+        states = engine.storage.get_users_state(
+            message.chat.id, [x.id for x in new_members]
+        )
+        confirm_codes, unconfirmed = self._select_confirm_codes(new_members, states)
+        if confirm_codes:
+            engine.storage.set_users_confirm_code(message.chat.id, confirm_codes)
+
+        for new_member, confirm_code in unconfirmed:
+            # Handler does not wait for captcha to be sent, kick is scheduled when
+            # reply worker knows id of captcha message
+            sent = engine.send_message(
+                **self._captcha_message(message.chat.id, new_member, confirm_code)
+            )
+            sent.add_done_callback(
+                partial(self._captcha_sent, engine, message.chat.id, new_member.id)
             )
 
-            timer = Timer(
-                self.kick_after_sec,
-                self.kick_inactive,
-                args=(engine, message.chat.id, new_member.id, response.get().id),
+    def _captcha_sent(
+        self, engine: bot.Engine, group_id: int, user_id: int, sent: Future
+    ) -> None:
+        if sent.cancelled() or sent.exception() is not None:
+            self.log(
+                f"Captcha for user {user_id} in group {group_id} was not sent: "
+                + f"{None if sent.cancelled() else sent.exception()}",
+                "error",
             )
-            timer.start()
+            return
 
-    def _generate_confirm_code(self) -> str:
-        seed()
-        return choice(list(self.emojies))
+        deadline = self._kick_deadline(group_id, user_id, sent.result().id)
+        # Deadline is saved, so user is kicked even if bot is restarted
+        engine.storage.add_kick_deadlines([deadline])
+        self._schedule_kick(engine, deadline)
 
-    def _get_emoji_keyboard(self) -> telebot.types.InlineKeyboardMarkup:
-        variants = list(self.emojies)
-        shuffle(variants)
-        return telebot.types.InlineKeyboardMarkup(
-            [
-                [
-                    telebot.types.InlineKeyboardButton(x, callback_data=f"verify_{x}")
-                    for x in variants
-                ]
-            ]
-        )
+    def _restore_kick_deadlines(self) -> None:
+        deadlines = list(self.engine.storage.get_kick_deadlines())
+        for deadline in deadlines:
+            self._schedule_kick(self.engine, deadline)
+        if deadlines:
+            self.log(f"Restored {len(deadlines)} kick deadlines")
 
     def _user_selected_answer(self, callback: telebot.types.CallbackQuery) -> None:
         chat_id = callback.message.chat.id
         user_id = callback.from_user.id
 
-        member_answer = callback.data.split("_")
-        if len(member_answer) != 2:
-            self.log(f"Error parsing reply callback data: {callback.data}")
+        answer = self._parse_answer(callback.data)
+        if answer is None:
             return
 
-        if member_answer[0] != "verify":
+        state = self.engine.storage.get_user_state(chat_id, user_id)
+        if not self._is_solved(callback, state, answer):
             return
-
-        answer = member_answer[1]
-
-        if (
-            not self.engine.storage.is_user_confirmed(chat_id, user_id)
-            and self.engine.storage.get_user_confirm_code(chat_id, user_id) == answer
-        ):
-            self.log(f"User {user_id}: {callback.from_user.full_name} solved captha")
-            self.engine.storage.set_user_confirmed(chat_id, user_id)
-            self.engine.delete_message(chat_id=chat_id, message_id=callback.message.id)
-            self.engine.metrics.inc_captha_solved_total(answer)
-        else:
-            self.log(
-                f"User {user_id}:  {callback.from_user.full_name} selected "
-                + f"incorrect value {answer}"
-            )
+        self.engine.storage.set_user_confirmed(chat_id, user_id)
+        self.engine.scheduler.cancel(("kick", chat_id, user_id))
+        self.engine.storage.remove_kick_deadline(chat_id, user_id)
+        self.engine.delete_message(chat_id=chat_id, message_id=callback.message.id)
+        self.engine.metrics.inc_captha_solved_total(answer)
 
     def kick_inactive(
         self, engine: bot.Engine, group_id: int, user_id: int, captha_msg_id: int
     ) -> None:
         """Removes chat member if they does not pressed validation button"""
+        engine.storage.remove_kick_deadline(group_id, user_id)
         if engine.storage.is_user_confirmed(group_id, user_id):
             return
 
         engine.kick_chat_member(group_id, user_id)
-        self._logger.info(
-            f"User {user_id} was kicked from group {group_id} because not confirmed"
-        )
+        self._log_kicked(group_id, user_id)
         engine.delete_message(group_id, captha_msg_id)
 
 
 class RemoveMemberJoinedMessage(MemberPlugin):
-    """Performs removing message about new member joined"""
+    """
+    Performs removing message about new member joined. Plugin is ordered, so
+    message is left when member was banned by plugin before
+    """
 
     def execute(
         self, engine: bot.Engine, message: telebot.types.Message
@@ -0,0 +1,112 @@
+"""
+This module contains executor of plugins used by bot engine
+"""
+from __future__ import annotations
+
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import time
+import traceback
+from typing import TYPE_CHECKING
+
+import telebot
+
+from logger import Logger
+from metrics import BotMetrics
+
+if TYPE_CHECKING:
+    # Plugins package imports engine, which imports this module
+    from plugins import AbstractPlugin
+
+
+class PluginRunner:
+    """
+    Runs plugins of one event. Ordered plugins are run one by one and the first of
+    them returning True stops the rest. Concurrent plugins are started on pool
+    before ordered ones and do not wait for them. Every plugin is stopped waiting
+    for after its timeout, plugin itself can not be interrupted and keeps working
+    on pool
+    """
+
+    def __init__(
+        self,
+        engine,
+        metrics: BotMetrics,
+        logger: Logger,
+        workers: int = 8,
+        default_timeout: float | None = 10.0,
+    ) -> None:
+        self.engine = engine
+        self.default_timeout = default_timeout
+        self._metrics = metrics
+        self._logger = logger
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="plugin")
+
+    def run(self, plugins: list[AbstractPlugin], message: telebot.types.Message) -> bool:
+        """
+        Runs plugins for message. Returns True when any of them returned True
+        """
+        started = [
+            (x, self._executor.submit(self._execute, x, message))
+            for x in plugins
+            if x.concurrent
+        ]
+
+        result = False
+        for plugin in plugins:
+            if plugin.concurrent:
+                continue
+            timeout = self._timeout(plugin)
+            if timeout is None:
+                handled = self._execute(plugin, message)
+            else:
+                handled = self._wait(
+                    plugin, self._executor.submit(self._execute, plugin, message), timeout
+                )
+            if handled:
+                result = True
+                break
+
+        for plugin, future in started:
+            if self._wait(plugin, future, self._timeout(plugin)):
+                result = True
+        return result
+
+    def close(self) -> None:
+        """Stops pool, plugins which are running are not waited for"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _timeout(self, plugin: AbstractPlugin) -> float | None:
+        return plugin.timeout if plugin.timeout is not None else self.default_timeout
+
+    def _wait(self, plugin: AbstractPlugin, future: Future, timeout: float | None) -> bool:
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            cls_name = plugin.__class__.__name__
+            self._log(f"Plugin {cls_name} is not finished in {timeout}s", "error")
+            self._metrics.inc_plugin_timeouts_total(cls_name)
+            return False
+
+    def _execute(self, plugin: AbstractPlugin, message: telebot.types.Message) -> bool:
+        cls_name = plugin.__class__.__name__
+        started = time.monotonic()
+        try:
+            return bool(plugin.execute(self.engine, message))
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            self._log(
+                f"Unhandled error in plugin {cls_name}:\n{exc}\n{traceback.format_exc()}",
+                "error",
+            )
+            self._metrics.inc_plugin_errors_total(cls_name, exc.__class__.__name__)
+            return False
+        finally:
+            self._metrics.observe_plugin_execution_seconds(
+                cls_name, time.monotonic() - started
+            )
+
+    def _log(self, msg: str, severity: str = "info") -> None:
+        match severity:
+            case "error":
+                self._logger.error(msg)
+            case _:
+                self._logger.info(msg)
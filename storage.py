@@ -3,15 +3,53 @@ Data storage layer. Contains classes for managing bot data, which be used to per
 operations
 """
 
+import asyncio
 import os
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Iterable, NamedTuple
 import codecs
+import time
+import traceback
+
+from entities.int_set import IntSet
+from logger import Logger
+from metrics import BotMetrics
+
+_MISSING = object()
+
+
+class UserState(NamedTuple):
+    """
+    Verification state of user in group. Confirm code is None for confirmed users
+    """
+
+    confirmed: bool
+    confirm_code: str | None
+
+
+class KickDeadline(NamedTuple):
+    """
+    Time when user who has not solved captcha is kicked, and the captcha message
+    which is removed at the same time
+    """
+
+    group_id: int
+    user_id: int
+    kick_at: float
+    message_id: int
 
 
 class AbstractStorage(ABC):
     """
     Interface describing storage class. If you want to add new storage class, you need
-    to subclass it from this class and implement all the methods below
+    to subclass it from this class and implement all the abstract methods below.
+    Batch methods are implemented through single-user methods and should be overridden
+    when storage can do the same in one round trip
     """
 
     @abstractmethod
@@ -36,6 +74,57 @@ class AbstractStorage(ABC):
     def on_added_to_group(self, group_id: int) -> None:
         pass
 
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        """Returns confirmed status and confirm code of user at once"""
+        if self.is_user_confirmed(group_id, user_id):
+            return UserState(True, None)
+        return UserState(False, self.get_user_confirm_code(group_id, user_id))
+
+    def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        """Returns states of many users of one group"""
+        return {x: self.get_user_state(group_id, x) for x in user_ids}
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        """Saves confirm codes of many users of one group"""
+        for user_id, confirm_code in confirm_codes.items():
+            self.set_user_confirm_code(group_id, user_id, confirm_code)
+
+    @abstractmethod
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        """Returns ids of all confirmed users of group"""
+
+    @abstractmethod
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        """
+        Removes at most limit confirm codes set before older_than unix timestamp.
+        Returns (group_id, user_id) of removed codes
+        """
+
+    @abstractmethod
+    def count_pending_confirm_codes(self) -> int:
+        """Returns number of stored confirm codes"""
+
+    @abstractmethod
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        """Saves kick deadlines, replacing existing deadlines of the same users"""
+
+    @abstractmethod
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        """Removes kick deadline of user when it is fired or cancelled"""
+
+    @abstractmethod
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        """Returns all saved kick deadlines"""
+
+    def close(self) -> None:
+        """Writes pending changes and releases resources used by storage"""
+
 
 def convert_path(path: str) -> str:
     """
@@ -65,16 +154,25 @@ class FileSystem(AbstractStorage):
 
     confirmed_dir = "confirmed"
     confirm_codes_dir = "confirm_codes"
+    kick_deadlines_dir = "kick_deadlines"
 
     groups_list_file = "groups.txt"
 
-    required_dirs = (confirmed_dir, confirm_codes_dir)
+    required_dirs = (confirmed_dir, confirm_codes_dir, kick_deadlines_dir)
+
+    # Groups list file is append-only journal, it is rewritten in background
+    # after this number of appends
+    compact_groups_after = 100
 
     def __init__(self, path: str, groups_list: set[str] = None):
         self.storage_dir = convert_path(path)
         self.groups_list = set(
-            [] if groups_list is None else [str(x) for x in groups_list]
+            [] if groups_list is None else [int(x) for x in groups_list]
         )
+        self._groups_lock = Lock()
+        self._groups_appended = 0
+        self._expire_cursor = 0
+        self._compaction_thread: Thread | None = None
 
         self._load_groups_list()
         self._create_storage_dir()
@@ -82,10 +180,13 @@ class FileSystem(AbstractStorage):
 
     def _load_groups_list(self) -> None:
         if os.path.exists(to_path(self.storage_dir, self.groups_list_file)):
-            with codecs.open(
-                to_path(self.storage_dir, self.groups_list_file), "r"
-            ) as file:
-                self.groups_list = {int(x) for x in file.readlines()}
+            self.groups_list = self._read_groups_list()
+
+    def _read_groups_list(self) -> set[int]:
+        with codecs.open(
+            to_path(self.storage_dir, self.groups_list_file), "r", encoding="utf-8"
+        ) as file:
+            return {int(x) for x in file.readlines() if x.strip()}
 
     def _create_storage_dir(self) -> None:
         if not os.path.exists(self.storage_dir):
@@ -122,17 +223,171 @@ class FileSystem(AbstractStorage):
         except FileNotFoundError:
             return None
 
+    def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        confirmed_dir = to_path(self.storage_dir, group_id, self.confirmed_dir)
+        codes_dir = to_path(self.storage_dir, group_id, self.confirm_codes_dir)
+        states = {}
+        for user_id in user_ids:
+            if os.path.exists(to_path(confirmed_dir, user_id)):
+                states[user_id] = UserState(True, None)
+                continue
+            try:
+                with open(to_path(codes_dir, user_id), "r", encoding="utf-8") as file:
+                    states[user_id] = UserState(False, file.read())
+            except FileNotFoundError:
+                states[user_id] = UserState(False, None)
+        return states
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        return self.get_users_state(group_id, [user_id])[user_id]
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        confirmed_dir = to_path(self.storage_dir, group_id, self.confirmed_dir)
+        if not os.path.isdir(confirmed_dir):
+            return []
+        with os.scandir(confirmed_dir) as entries:
+            return [int(x.name) for x in entries]
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        # Groups are walked round-robin starting from the group where previous call
+        # has stopped, so every call does a small amount of work
+        groups = sorted(self.groups_list)
+        removed = []
+        for step in range(len(groups)):
+            idx = (self._expire_cursor + step) % len(groups)
+            removed += self._expire_group_confirm_codes(
+                groups[idx], older_than, limit - len(removed)
+            )
+            if len(removed) >= limit:
+                self._expire_cursor = idx
+                return removed
+        self._expire_cursor = 0
+        return removed
+
+    def _expire_group_confirm_codes(
+        self, group_id: int, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        codes_dir = to_path(self.storage_dir, group_id, self.confirm_codes_dir)
+        removed = []
+        try:
+            with os.scandir(codes_dir) as entries:
+                for entry in entries:
+                    if len(removed) >= limit:
+                        break
+                    try:
+                        if entry.stat().st_mtime >= older_than:
+                            continue
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        # Code was removed because user was confirmed
+                        continue
+                    removed.append((group_id, int(entry.name)))
+        except FileNotFoundError:
+            pass
+        return removed
+
+    def count_pending_confirm_codes(self) -> int:
+        count = 0
+        for group_id in list(self.groups_list):
+            codes_dir = to_path(self.storage_dir, group_id, self.confirm_codes_dir)
+            if os.path.isdir(codes_dir):
+                count += len(os.listdir(codes_dir))
+        return count
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        for deadline in deadlines:
+            deadlines_dir = to_path(
+                self.storage_dir, deadline.group_id, self.kick_deadlines_dir
+            )
+            # Groups created by previous versions have no deadlines directory
+            create_storage_dir(deadlines_dir)
+            with open(
+                to_path(deadlines_dir, deadline.user_id), "w", encoding="utf-8"
+            ) as file:
+                file.write(f"{deadline.kick_at} {deadline.message_id}")
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        try:
+            os.unlink(to_path(self.storage_dir, group_id, self.kick_deadlines_dir, user_id))
+        except FileNotFoundError:
+            pass
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        deadlines = []
+        for group_id in list(self.groups_list):
+            deadlines_dir = to_path(self.storage_dir, group_id, self.kick_deadlines_dir)
+            if not os.path.isdir(deadlines_dir):
+                continue
+            with os.scandir(deadlines_dir) as entries:
+                for entry in entries:
+                    try:
+                        with open(entry.path, "r", encoding="utf-8") as file:
+                            kick_at, message_id = file.read().split()
+                    except (FileNotFoundError, ValueError):
+                        # Removed meanwhile or torn by crash
+                        continue
+                    deadlines.append(
+                        KickDeadline(
+                            group_id, int(entry.name), float(kick_at), int(message_id)
+                        )
+                    )
+        return deadlines
+
     def on_added_to_group(self, group_id: int) -> None:
-        self._create_group_dir(group_id)
-        self.groups_list.add(group_id)
+        # Called for every update, so known groups must not touch filesystem
+        if group_id in self.groups_list:
+            return
 
-        self._save_groups_list()
+        with self._groups_lock:
+            if group_id in self.groups_list:
+                return
+            self._create_group_dir(group_id)
+            self._append_groups_list(group_id)
+            self.groups_list.add(group_id)
+            self._groups_appended += 1
 
-    def _save_groups_list(self) -> None:
-        with codecs.open(
-            to_path(self.storage_dir, self.groups_list_file), "w", encoding="utf-8"
+            if self._groups_appended >= self.compact_groups_after and (
+                self._compaction_thread is None
+                or not self._compaction_thread.is_alive()
+            ):
+                self._compaction_thread = Thread(
+                    target=self.compact_groups_list, daemon=True
+                )
+                self._compaction_thread.start()
+
+    def compact_groups_list(self) -> None:
+        """
+        Rewrites groups list journal without duplicates and empty lines
+        """
+        with self._groups_lock:
+            groups = set(self.groups_list)
+            if os.path.exists(to_path(self.storage_dir, self.groups_list_file)):
+                groups |= self._read_groups_list()
+            self._save_groups_list(groups)
+            self._groups_appended = 0
+
+    def _append_groups_list(self, group_id: int) -> None:
+        with open(
+            to_path(self.storage_dir, self.groups_list_file), "a+b"
         ) as handle:
-            handle.writelines([f"{x}\n" for x in self.groups_list])
+            # File can be written by hand or by previous versions without trailing
+            # line break, so line must not be glued to the last one
+            prefix = b""
+            if handle.tell() > 0:
+                handle.seek(-1, os.SEEK_END)
+                if handle.read(1) != b"\n":
+                    prefix = b"\n"
+            handle.write(prefix + f"{group_id}\n".encode("utf-8"))
+
+    def _save_groups_list(self, groups: set[int]) -> None:
+        tmp_file = to_path(self.storage_dir, self.groups_list_file + ".tmp")
+        with codecs.open(tmp_file, "w", encoding="utf-8") as handle:
+            handle.writelines([f"{x}\n" for x in groups])
+        os.replace(tmp_file, to_path(self.storage_dir, self.groups_list_file))
 
     def _create_groups_dir(self) -> None:
         for group_id in self.groups_list:
@@ -141,3 +396,641 @@ class FileSystem(AbstractStorage):
     def _create_group_dir(self, group_id: int) -> None:
         for dir_path in self.required_dirs:
             create_storage_dir(to_path(self.storage_dir, group_id, dir_path))
+
+
+class LRUCache:
+    """
+    Bounded mapping which evicts least recently used keys when it is full.
+    Not thread safe, callers must hold their own lock
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Any) -> Any:
+        """Returns cached value or _MISSING sentinel if key is not cached"""
+        value = self._items.get(key, _MISSING)
+        if value is not _MISSING:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: Any, value: Any) -> None:
+        """Stores value and evicts the oldest entry when cache is overflowed"""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        """Removes key from cache if it exists"""
+        self._items.pop(key, None)
+
+
+class CachedStorage(AbstractStorage):
+    """
+    Write-through cache around another storage. Both positive and negative answers are
+    cached, so all writes for cached groups must go through this object
+    """
+
+    def __init__(
+        self,
+        storage: AbstractStorage,
+        max_size: int = 100_000,
+        metrics: BotMetrics = None,
+    ) -> None:
+        self.storage = storage
+        self._metrics = metrics
+        self._confirmed = LRUCache(max_size)
+        self._confirm_codes = LRUCache(max_size)
+        self._lock = Lock()
+        # Incremented on every write, used to prevent caching of values which were
+        # read from underlying storage concurrently with a write
+        self._version = 0
+
+    def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        return self._get_cached(
+            "is_user_confirmed",
+            self._confirmed,
+            (group_id, user_id),
+            self.storage.is_user_confirmed,
+        )
+
+    def set_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        result = self.storage.set_user_confirmed(group_id, user_id)
+        with self._lock:
+            self._version += 1
+            self._confirmed.put((group_id, user_id), True)
+            self._confirm_codes.put((group_id, user_id), None)
+        return result
+
+    def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        self.storage.set_user_confirm_code(group_id, user_id, confirm_code)
+        with self._lock:
+            self._version += 1
+            self._confirm_codes.put((group_id, user_id), confirm_code)
+
+    def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        return self._get_cached(
+            "get_user_confirm_code",
+            self._confirm_codes,
+            (group_id, user_id),
+            self.storage.get_user_confirm_code,
+        )
+
+    def on_added_to_group(self, group_id: int) -> None:
+        self.storage.on_added_to_group(group_id)
+
+    def close(self) -> None:
+        self.storage.close()
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        return self.storage.get_confirmed_users(group_id)
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        removed = self.storage.expire_confirm_codes(older_than, limit)
+        with self._lock:
+            self._version += 1
+            for key in removed:
+                self._confirm_codes.pop(key)
+        return removed
+
+    def count_pending_confirm_codes(self) -> int:
+        return self.storage.count_pending_confirm_codes()
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        self.storage.add_kick_deadlines(deadlines)
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        self.storage.remove_kick_deadline(group_id, user_id)
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        return self.storage.get_kick_deadlines()
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        return self.get_users_state(group_id, [user_id])[user_id]
+
+    def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        states = {}
+        missed = []
+        with self._lock:
+            version = self._version
+            for user_id in user_ids:
+                state = self._get_cached_state((group_id, user_id))
+                if state is None:
+                    missed.append(user_id)
+                else:
+                    states[user_id] = state
+
+        self._count("get_user_state", hit=True, amount=len(states))
+        self._count("get_user_state", hit=False, amount=len(missed))
+        if not missed:
+            return states
+
+        loaded = self.storage.get_users_state(group_id, missed)
+        with self._lock:
+            if version == self._version:
+                for user_id, state in loaded.items():
+                    self._confirmed.put((group_id, user_id), state.confirmed)
+                    self._confirm_codes.put((group_id, user_id), state.confirm_code)
+        states.update(loaded)
+        return states
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        self.storage.set_users_confirm_code(group_id, confirm_codes)
+        with self._lock:
+            self._version += 1
+            for user_id, confirm_code in confirm_codes.items():
+                self._confirm_codes.put((group_id, user_id), confirm_code)
+
+    def _get_cached_state(self, key: tuple) -> UserState | None:
+        confirmed = self._confirmed.get(key)
+        if confirmed is True:
+            return UserState(True, None)
+        if confirmed is _MISSING:
+            return None
+        confirm_code = self._confirm_codes.get(key)
+        if confirm_code is _MISSING:
+            return None
+        return UserState(False, confirm_code)
+
+    def _get_cached(
+        self, method_name: str, cache: LRUCache, key: tuple, loader: callable
+    ) -> Any:
+        with self._lock:
+            value = cache.get(key)
+            version = self._version
+
+        if value is not _MISSING:
+            self._count(method_name, hit=True)
+            return value
+
+        self._count(method_name, hit=False)
+        value = loader(*key)
+        with self._lock:
+            if version == self._version:
+                cache.put(key, value)
+        return value
+
+    def _count(self, method_name: str, hit: bool, amount: int = 1) -> None:
+        if self._metrics is None or not amount:
+            return
+        if hit:
+            self._metrics.inc_storage_cache_hits_total(method_name, amount)
+        else:
+            self._metrics.inc_storage_cache_misses_total(method_name, amount)
+
+
+class WriteBehindStorage(AbstractStorage):
+    """
+    Makes writes to another storage asynchronous. Changes are put into bounded pending
+    map, where repeated writes of the same user are coalesced, and background thread
+    writes them in batches. Reads see pending changes. Confirm codes set for users
+    with pending confirmation are dropped
+    """
+
+    def __init__(
+        self,
+        storage: AbstractStorage,
+        max_pending: int = 10_000,
+        batch_size: int = 500,
+        commit_delay: float = 0.05,
+        logger: Logger = None,
+    ) -> None:
+        self.storage = storage
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.commit_delay = commit_delay
+        self._logger = logger
+
+        self._pending: dict[tuple[int, int], UserState] = {}
+        self._flushing: dict[tuple[int, int], UserState] = {}
+        self._cond = Condition()
+        self._closed = False
+        self._thread = Thread(target=self._flush_loop, daemon=True)
+        self._thread.start()
+
+    def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        state = self._get_pending((group_id, user_id))
+        if state is not None and state.confirmed:
+            return True
+        return self.storage.is_user_confirmed(group_id, user_id)
+
+    def set_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        self._enqueue((group_id, user_id), UserState(True, None))
+
+    def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        self._enqueue((group_id, user_id), UserState(False, confirm_code))
+
+    def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        state = self._get_pending((group_id, user_id))
+        if state is not None:
+            return state.confirm_code
+        return self.storage.get_user_confirm_code(group_id, user_id)
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        return self.get_users_state(group_id, [user_id])[user_id]
+
+    def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        states = {}
+        for user_id in user_ids:
+            state = self._get_pending((group_id, user_id))
+            if state is not None:
+                states[user_id] = state
+        missed = [x for x in user_ids if x not in states]
+        if missed:
+            states.update(self.storage.get_users_state(group_id, missed))
+        return states
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        for user_id, confirm_code in confirm_codes.items():
+            self._enqueue((group_id, user_id), UserState(False, confirm_code))
+
+    def on_added_to_group(self, group_id: int) -> None:
+        self.storage.on_added_to_group(group_id)
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        with self._cond:
+            pending = [
+                user_id
+                for (pending_group_id, user_id), state in (
+                    *self._pending.items(),
+                    *self._flushing.items(),
+                )
+                if pending_group_id == group_id and state.confirmed
+            ]
+        return [*self.storage.get_confirmed_users(group_id), *pending]
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        # Pending codes are newer than any expired one and will be written after
+        return self.storage.expire_confirm_codes(older_than, limit)
+
+    def count_pending_confirm_codes(self) -> int:
+        return self.storage.count_pending_confirm_codes()
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        self.storage.add_kick_deadlines(deadlines)
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        self.storage.remove_kick_deadline(group_id, user_id)
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        return self.storage.get_kick_deadlines()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """
+        Waits until all pending changes are written. Returns False on timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._flushing, timeout
+            )
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.storage.close()
+
+    def _get_pending(self, key: tuple[int, int]) -> UserState | None:
+        with self._cond:
+            state = self._pending.get(key)
+            if state is None:
+                state = self._flushing.get(key)
+            return state
+
+    def _enqueue(self, key: tuple[int, int], state: UserState) -> None:
+        with self._cond:
+            # Writers are blocked while pending map is full, which gives backpressure
+            # instead of unbounded memory growth
+            self._cond.wait_for(
+                lambda: len(self._pending) < self.max_pending
+                or key in self._pending
+                or self._closed
+            )
+            if self._closed:
+                raise RuntimeError("Write to closed storage")
+
+            current = self._pending.get(key)
+            if current is not None and current.confirmed and not state.confirmed:
+                return
+            self._pending[key] = state
+            self._cond.notify_all()
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                full = len(self._pending) >= self.batch_size
+
+            # Waiting a bit lets more writes to join the batch
+            if not full and not self._closed:
+                time.sleep(self.commit_delay)
+
+            with self._cond:
+                keys = list(islice(self._pending, self.batch_size))
+                self._flushing = {x: self._pending.pop(x) for x in keys}
+                batch = self._flushing
+                self._cond.notify_all()
+
+            try:
+                self._write_batch(batch)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                self._log_error(exc)
+                with self._cond:
+                    self._flushing = {}
+                    if self._closed:
+                        # Do not hang on shutdown when storage is broken
+                        self._pending.clear()
+                        self._cond.notify_all()
+                        return
+                    for key, state in batch.items():
+                        self._pending.setdefault(key, state)
+                    self._cond.wait(self.commit_delay)
+                continue
+
+            with self._cond:
+                self._flushing = {}
+                self._cond.notify_all()
+
+    def _write_batch(self, batch: dict[tuple[int, int], UserState]) -> None:
+        confirm_codes: dict[int, dict[int, str]] = {}
+        for (group_id, user_id), state in batch.items():
+            if state.confirmed:
+                self.storage.set_user_confirmed(group_id, user_id)
+            else:
+                confirm_codes.setdefault(group_id, {})[user_id] = state.confirm_code
+
+        for group_id, codes in confirm_codes.items():
+            self.storage.set_users_confirm_code(group_id, codes)
+
+    def _log_error(self, exc: Exception) -> None:
+        if self._logger is not None:
+            self._logger.error(
+                f"Error writing pending changes: {exc}\n{traceback.format_exc()}"
+            )
+
+
+class ConfirmedSetStorage(AbstractStorage):
+    """
+    Keeps confirmed users of every group in memory as compact sets of ids, so checking
+    confirmation does not touch underlying storage. Set of a group is loaded on the
+    first access to the group instead of startup
+    """
+
+    def __init__(self, storage: AbstractStorage, metrics: BotMetrics = None) -> None:
+        self.storage = storage
+        self._metrics = metrics
+        self._groups: dict[int, IntSet] = {}
+        self._lock = Lock()
+        self._users = 0
+        self._memory_usage = 0
+
+    def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        return user_id in self._get_group(group_id)
+
+    def set_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        result = self.storage.set_user_confirmed(group_id, user_id)
+        self._add(group_id, user_id)
+        return result
+
+    def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        self.storage.set_user_confirm_code(group_id, user_id, confirm_code)
+
+    def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        return self.storage.get_user_confirm_code(group_id, user_id)
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        return self.get_users_state(group_id, [user_id])[user_id]
+
+    def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        confirmed = self._get_group(group_id)
+        states = {x: UserState(True, None) for x in user_ids if x in confirmed}
+        missed = [x for x in user_ids if x not in states]
+        if missed:
+            states.update(self.storage.get_users_state(group_id, missed))
+        return states
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        self.storage.set_users_confirm_code(group_id, confirm_codes)
+
+    def on_added_to_group(self, group_id: int) -> None:
+        self.storage.on_added_to_group(group_id)
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        return list(self._get_group(group_id))
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        return self.storage.expire_confirm_codes(older_than, limit)
+
+    def count_pending_confirm_codes(self) -> int:
+        return self.storage.count_pending_confirm_codes()
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        self.storage.add_kick_deadlines(deadlines)
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        self.storage.remove_kick_deadline(group_id, user_id)
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        return self.storage.get_kick_deadlines()
+
+    def close(self) -> None:
+        self.storage.close()
+
+    def memory_usage(self) -> int:
+        """Returns approximate number of bytes used by loaded sets"""
+        return self._memory_usage
+
+    def _get_group(self, group_id: int) -> IntSet:
+        users = self._groups.get(group_id)
+        if users is not None:
+            return users
+
+        with self._lock:
+            users = self._groups.get(group_id)
+            if users is None:
+                users = IntSet(self.storage.get_confirmed_users(group_id))
+                self._groups[group_id] = users
+                self._users += len(users)
+                self._memory_usage += users.memory_usage()
+                self._report()
+        return users
+
+    def _add(self, group_id: int, user_id: int) -> None:
+        users = self._get_group(group_id)
+        with self._lock:
+            size = len(users)
+            memory_usage = users.memory_usage()
+            users.add(user_id)
+            self._users += len(users) - size
+            self._memory_usage += users.memory_usage() - memory_usage
+            self._report()
+
+    def _report(self) -> None:
+        if self._metrics is not None:
+            self._metrics.set_confirmed_sets_size(
+                len(self._groups), self._users, self._memory_usage
+            )
+
+
+class AsyncStorage:
+    """
+    Adapter of storage for asyncio engine. Methods of wrapped storage are run in
+    thread pool, so disk and network calls do not block event loop
+    """
+
+    def __init__(self, storage: AbstractStorage, max_workers: int = 8) -> None:
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="storage")
+
+    async def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        return await self._run(self.storage.is_user_confirmed, group_id, user_id)
+
+    async def set_user_confirmed(self, group_id: int, user_id: int) -> None:
+        await self._run(self.storage.set_user_confirmed, group_id, user_id)
+
+    async def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        await self._run(
+            self.storage.set_user_confirm_code, group_id, user_id, confirm_code
+        )
+
+    async def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        return await self._run(self.storage.get_user_confirm_code, group_id, user_id)
+
+    async def on_added_to_group(self, group_id: int) -> None:
+        await self._run(self.storage.on_added_to_group, group_id)
+
+    async def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        return await self._run(self.storage.get_user_state, group_id, user_id)
+
+    async def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        return await self._run(self.storage.get_users_state, group_id, user_ids)
+
+    async def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        await self._run(self.storage.set_users_confirm_code, group_id, confirm_codes)
+
+    async def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        await self._run(self.storage.add_kick_deadlines, list(deadlines))
+
+    async def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        await self._run(self.storage.remove_kick_deadline, group_id, user_id)
+
+    async def get_kick_deadlines(self) -> list[KickDeadline]:
+        return await self._run(lambda: list(self.storage.get_kick_deadlines()))
+
+    async def close(self) -> None:
+        """Closes wrapped storage and stops thread pool"""
+        await self._run(self.storage.close)
+        self._executor.shutdown()
+
+    async def _run(self, method: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, partial(method, *args)
+        )
+
+
+class ConfirmCodeSweeper:
+    """
+    Removes confirm codes of users who did not solve captcha in time. Without it codes
+    of kicked and left users are kept forever. Expired codes are removed by small
+    batches in background thread, so storage is never locked for long time
+    """
+
+    def __init__(
+        self,
+        storage: AbstractStorage,
+        ttl: float,
+        interval: float = 60,
+        batch_size: int = 100,
+        metrics: BotMetrics = None,
+        logger: Logger = None,
+    ) -> None:
+        self.storage = storage
+        self.ttl = ttl
+        self.interval = interval
+        self.batch_size = batch_size
+        self._metrics = metrics
+        self._logger = logger
+        self._stop = Event()
+        self._thread = Thread(target=self._sweep_loop, daemon=True)
+
+    def start(self) -> None:
+        """Starts background sweeping"""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops background sweeping"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def sweep(self) -> int:
+        """
+        Removes expired codes batch by batch until there is nothing to remove.
+        Returns number of removed codes
+        """
+        swept = 0
+        while not self._stop.is_set():
+            removed = self.storage.expire_confirm_codes(
+                time.time() - self.ttl, self.batch_size
+            )
+            swept += len(removed)
+            if self._metrics is not None and removed:
+                self._metrics.inc_confirm_codes_swept_total(len(removed))
+            if len(removed) < self.batch_size:
+                break
+        if self._metrics is not None:
+            self._metrics.set_pending_confirm_codes(
+                self.storage.count_pending_confirm_codes()
+            )
+        return swept
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                swept = self.sweep()
+                if swept and self._logger is not None:
+                    self._logger.info(f"Removed {swept} expired confirm codes")
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                if self._logger is not None:
+                    self._logger.error(
+                        f"Error removing expired confirm codes: {exc}\n"
+                        + traceback.format_exc()
+                    )
@@ -0,0 +1,4 @@
+"""
+Alternative storage backends. Each module contains one AbstractStorage implementation
+which can be used instead of storage.FileSystem
+"""
@@ -0,0 +1,445 @@
+"""
+Log-structured storage backend. Every change is appended as a record to a segment file
+of a shard, and all lookups are served from in-memory index rebuilt from segments
+at startup
+"""
+
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from itertools import islice
+from threading import Event, Lock, Thread
+from typing import Iterable
+
+from entities.int_set import IntSet
+from storage import (
+    AbstractStorage,
+    KickDeadline,
+    UserState,
+    create_storage_dir,
+    to_path,
+)
+
+RECORD_CONFIRM_CODE = 1
+RECORD_CONFIRMED = 2
+RECORD_GROUP = 3
+RECORD_CONFIRM_CODE_EXPIRED = 4
+RECORD_KICK_DEADLINE = 5
+RECORD_KICK_DEADLINE_REMOVED = 6
+
+# crc32, record type, group_id, user_id, payload length. Payload bytes are following
+# the header. Checksum covers everything after itself
+RECORD_HEADER = struct.Struct("<IBqqH")
+RECORD_CRC = struct.Struct("<I")
+# Payload of RECORD_CONFIRM_CODE is creation time followed by confirm code
+CODE_TIME = struct.Struct("<d")
+# Payload of RECORD_KICK_DEADLINE is kick time and id of captcha message
+KICK_DEADLINE = struct.Struct("<dq")
+
+_USER_MASK = (1 << 64) - 1
+
+
+def make_key(group_id: int, user_id: int) -> int:
+    """Packs group and user ids into one int, which is cheaper than tuple as dict key"""
+    return (group_id << 64) | (user_id & _USER_MASK)
+
+
+def split_key(key: int) -> tuple[int, int]:
+    """Unpacks key made by make_key"""
+    return key >> 64, key & _USER_MASK
+
+
+def pack_record(
+    record_type: int,
+    group_id: int,
+    user_id: int,
+    code: str = "",
+    created_at: float = 0.0,
+) -> bytes:
+    """Serializes one log record"""
+    payload = code.encode("utf-8")
+    if record_type == RECORD_CONFIRM_CODE:
+        payload = CODE_TIME.pack(created_at) + payload
+    return pack_payload(record_type, group_id, user_id, payload)
+
+
+def pack_deadline_record(deadline: KickDeadline) -> bytes:
+    """Serializes kick deadline record"""
+    return pack_payload(
+        RECORD_KICK_DEADLINE,
+        deadline.group_id,
+        deadline.user_id,
+        KICK_DEADLINE.pack(deadline.kick_at, deadline.message_id),
+    )
+
+
+def pack_payload(record_type: int, group_id: int, user_id: int, payload: bytes) -> bytes:
+    """Serializes record with already encoded payload"""
+    body = RECORD_HEADER.pack(0, record_type, group_id, user_id, len(payload))
+    body = body[RECORD_CRC.size:] + payload
+    return RECORD_CRC.pack(zlib.crc32(body)) + body
+
+
+def unpack_payload(record_type: int, payload: bytes) -> tuple[str, float]:
+    """Returns confirm code and its creation time from record payload"""
+    if record_type == RECORD_CONFIRM_CODE:
+        code = payload[CODE_TIME.size:].decode("utf-8")
+        return sys.intern(code), CODE_TIME.unpack_from(payload)[0]
+    return "", 0.0
+
+
+class LogStructured(AbstractStorage):
+    """
+    Implements data storage as append-only segment files, one per shard. Groups are
+    spread between shards by their id. Superseded records are dropped by compaction,
+    which rewrites segment of a shard when it has enough garbage
+    """
+
+    segment_name = "shard-{}.log"
+
+    def __init__(
+        self,
+        path: str,
+        shards: int = 16,
+        fsync: bool = False,
+        compact_interval: float = 600,
+        compact_min_garbage: int = 10_000,
+    ) -> None:
+        self.storage_dir = path
+        self.shards = shards
+        self.fsync = fsync
+        self.compact_min_garbage = compact_min_garbage
+
+        self._confirmed: dict[int, IntSet] = {}
+        # Confirm code and its creation time. Updated codes are moved to the end,
+        # so dict is ordered by age and expired codes are always at its beginning
+        self._codes: dict[int, tuple[str, float]] = {}
+        self._groups: set[int] = set()
+        # Kick time and captcha message id
+        self._deadlines: dict[int, tuple[float, int]] = {}
+        self._records = [0] * shards
+        self._live = [0] * shards
+        self._locks = [Lock() for _ in range(shards)]
+        self._files = []
+
+        create_storage_dir(path)
+        for shard in range(shards):
+            self._records[shard] = self._replay(shard)
+            self._files.append(open(self._segment_path(shard), "ab", buffering=0))
+        # Shards are replayed one by one, so codes are ordered by age again
+        self._codes = dict(sorted(self._codes.items(), key=lambda x: x[1][1]))
+
+        self._stop = Event()
+        self._compaction_thread = None
+        if compact_interval > 0:
+            self._compaction_thread = Thread(
+                target=self._compaction_loop, args=(compact_interval,), daemon=True
+            )
+            self._compaction_thread.start()
+
+    def close(self) -> None:
+        """Stops compaction and closes segment files"""
+        self._stop.set()
+        if self._compaction_thread is not None:
+            self._compaction_thread.join()
+        for shard, file in enumerate(self._files):
+            with self._locks[shard]:
+                file.close()
+
+    def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        users = self._confirmed.get(group_id)
+        return users is not None and user_id in users
+
+    def set_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        self._write(RECORD_CONFIRMED, group_id, user_id)
+
+    def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        self._write(RECORD_CONFIRM_CODE, group_id, user_id, confirm_code)
+
+    def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        code = self._codes.get(make_key(group_id, user_id))
+        return None if code is None else code[0]
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        if self.is_user_confirmed(group_id, user_id):
+            return UserState(True, None)
+        return UserState(False, self.get_user_confirm_code(group_id, user_id))
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        return list(self._confirmed.get(group_id, ()))
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        shard = self._shard(group_id)
+        now = time.time()
+        records = b"".join(
+            pack_record(RECORD_CONFIRM_CODE, group_id, user_id, code, now)
+            for user_id, code in confirm_codes.items()
+        )
+        with self._locks[shard]:
+            self._append(shard, records)
+            for user_id, code in confirm_codes.items():
+                self._apply(
+                    shard, RECORD_CONFIRM_CODE, group_id, user_id, code, now
+                )
+            self._records[shard] += len(confirm_codes)
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        # Taking the oldest codes is done without releasing GIL, so it is safe while
+        # other threads are writing
+        expired: dict[int, list[tuple[int, int, float]]] = {}
+        for key, (_, created_at) in list(islice(self._codes.items(), limit)):
+            if created_at >= older_than:
+                break
+            group_id, user_id = split_key(key)
+            expired.setdefault(self._shard(group_id), []).append(
+                (group_id, user_id, created_at)
+            )
+
+        removed = []
+        for shard, codes in expired.items():
+            with self._locks[shard]:
+                # Code could be confirmed or replaced while lock was not held
+                codes = [
+                    (group_id, user_id)
+                    for group_id, user_id, created_at in codes
+                    if self._codes.get(make_key(group_id, user_id), (None, None))[1]
+                    == created_at
+                ]
+                self._append(
+                    shard,
+                    b"".join(
+                        pack_record(RECORD_CONFIRM_CODE_EXPIRED, group_id, user_id)
+                        for group_id, user_id in codes
+                    ),
+                )
+                for group_id, user_id in codes:
+                    self._apply(shard, RECORD_CONFIRM_CODE_EXPIRED, group_id, user_id)
+                self._records[shard] += len(codes)
+            removed += codes
+        return removed
+
+    def count_pending_confirm_codes(self) -> int:
+        return len(self._codes)
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        by_shard: dict[int, list[KickDeadline]] = {}
+        for deadline in deadlines:
+            by_shard.setdefault(self._shard(deadline.group_id), []).append(deadline)
+        for shard, shard_deadlines in by_shard.items():
+            with self._locks[shard]:
+                self._append(
+                    shard, b"".join(pack_deadline_record(x) for x in shard_deadlines)
+                )
+                for deadline in shard_deadlines:
+                    self._apply_deadline(shard, RECORD_KICK_DEADLINE, *deadline)
+                self._records[shard] += len(shard_deadlines)
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        shard = self._shard(group_id)
+        with self._locks[shard]:
+            if make_key(group_id, user_id) not in self._deadlines:
+                return
+            self._append(
+                shard, pack_payload(RECORD_KICK_DEADLINE_REMOVED, group_id, user_id, b"")
+            )
+            self._apply_deadline(shard, RECORD_KICK_DEADLINE_REMOVED, group_id, user_id)
+            self._records[shard] += 1
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        return [
+            KickDeadline(*split_key(key), kick_at, message_id)
+            for key, (kick_at, message_id) in list(self._deadlines.items())
+        ]
+
+    def on_added_to_group(self, group_id: int) -> None:
+        if group_id in self._groups:
+            return
+        self._write(RECORD_GROUP, group_id, 0)
+
+    def garbage(self, shard: int) -> int:
+        """Returns number of superseded records in segment of the shard"""
+        return self._records[shard] - self._live[shard]
+
+    def compact(self, shard: int) -> None:
+        """
+        Rewrites segment of the shard keeping only the latest state of every key
+        """
+        with self._locks[shard]:
+            tmp_path = self._segment_path(shard) + ".compact"
+            records = 0
+            # Index is shared between shards and can be changed by writers of other
+            # shards, so it is iterated over snapshots
+            with open(tmp_path, "wb") as file:
+                for group_id in list(self._groups):
+                    if self._shard(group_id) == shard:
+                        file.write(pack_record(RECORD_GROUP, group_id, 0))
+                        records += 1
+                # Confirmed users sets of this shard are changed only under its lock
+                for group_id, users in list(self._confirmed.items()):
+                    if self._shard(group_id) != shard:
+                        continue
+                    for user_id in users:
+                        file.write(pack_record(RECORD_CONFIRMED, group_id, user_id))
+                        records += 1
+                for key, (code, created_at) in list(self._codes.items()):
+                    group_id, user_id = split_key(key)
+                    if self._shard(group_id) == shard:
+                        file.write(
+                            pack_record(
+                                RECORD_CONFIRM_CODE,
+                                group_id,
+                                user_id,
+                                code,
+                                created_at,
+                            )
+                        )
+                        records += 1
+                for key, (kick_at, message_id) in list(self._deadlines.items()):
+                    group_id, user_id = split_key(key)
+                    if self._shard(group_id) == shard:
+                        file.write(
+                            pack_deadline_record(
+                                KickDeadline(group_id, user_id, kick_at, message_id)
+                            )
+                        )
+                        records += 1
+                file.flush()
+                os.fsync(file.fileno())
+
+            self._files[shard].close()
+            os.replace(tmp_path, self._segment_path(shard))
+            self._files[shard] = open(self._segment_path(shard), "ab", buffering=0)
+            self._records[shard] = records
+            self._live[shard] = records
+
+    def _compaction_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            for shard in range(self.shards):
+                if self.garbage(shard) >= self.compact_min_garbage:
+                    self.compact(shard)
+
+    def _write(
+        self, record_type: int, group_id: int, user_id: int, code: str = ""
+    ) -> None:
+        shard = self._shard(group_id)
+        now = time.time()
+        record = pack_record(record_type, group_id, user_id, code, now)
+        with self._locks[shard]:
+            self._append(shard, record)
+            self._apply(shard, record_type, group_id, user_id, code, now)
+            self._records[shard] += 1
+
+    def _append(self, shard: int, data: bytes) -> None:
+        file = self._files[shard]
+        file.write(data)
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def _apply(
+        self,
+        shard: int,
+        record_type: int,
+        group_id: int,
+        user_id: int,
+        code: str = "",
+        created_at: float = 0.0,
+    ) -> None:
+        key = make_key(group_id, user_id)
+        if record_type == RECORD_CONFIRM_CODE:
+            if self.is_user_confirmed(group_id, user_id):
+                return
+            if self._codes.pop(key, None) is None:
+                self._live[shard] += 1
+            self._codes[key] = (code, created_at)
+        elif record_type == RECORD_CONFIRM_CODE_EXPIRED:
+            if self._codes.pop(key, None) is not None:
+                self._live[shard] -= 1
+        elif record_type == RECORD_CONFIRMED:
+            if self.is_user_confirmed(group_id, user_id):
+                return
+            if self._codes.pop(key, None) is None:
+                self._live[shard] += 1
+            users = self._confirmed.get(group_id)
+            if users is None:
+                users = self._confirmed[group_id] = IntSet()
+            users.add(user_id)
+        elif record_type == RECORD_GROUP:
+            if group_id not in self._groups:
+                self._live[shard] += 1
+            self._groups.add(group_id)
+
+    def _apply_deadline(
+        self,
+        shard: int,
+        record_type: int,
+        group_id: int,
+        user_id: int,
+        kick_at: float = 0.0,
+        message_id: int = 0,
+    ) -> None:
+        key = make_key(group_id, user_id)
+        if record_type == RECORD_KICK_DEADLINE:
+            if key not in self._deadlines:
+                self._live[shard] += 1
+            self._deadlines[key] = (kick_at, message_id)
+        elif self._deadlines.pop(key, None) is not None:
+            self._live[shard] -= 1
+
+    def _replay(self, shard: int) -> int:
+        """
+        Loads segment of the shard into index. Torn record at the end of segment, which
+        could be left after crash, is truncated. Returns number of loaded records
+        """
+        path = self._segment_path(shard)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+
+        records = 0
+        offset = 0
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                while offset + RECORD_HEADER.size <= size:
+                    crc, record_type, group_id, user_id, length = (
+                        RECORD_HEADER.unpack_from(data, offset)
+                    )
+                    end = offset + RECORD_HEADER.size + length
+                    if end > size or zlib.crc32(data[offset + RECORD_CRC.size:end]) != crc:
+                        break
+                    payload = data[offset + RECORD_HEADER.size:end]
+                    if record_type == RECORD_KICK_DEADLINE:
+                        self._apply_deadline(
+                            shard,
+                            record_type,
+                            group_id,
+                            user_id,
+                            *KICK_DEADLINE.unpack(payload),
+                        )
+                    elif record_type == RECORD_KICK_DEADLINE_REMOVED:
+                        self._apply_deadline(shard, record_type, group_id, user_id)
+                    else:
+                        code, created_at = unpack_payload(record_type, payload)
+                        self._apply(
+                            shard, record_type, group_id, user_id, code, created_at
+                        )
+                    records += 1
+                    offset = end
+
+        if offset < size:
+            os.truncate(path, offset)
+        return records
+
+    def _shard(self, group_id: int) -> int:
+        return group_id % self.shards
+
+    def _segment_path(self, shard: int) -> str:
+        return to_path(self.storage_dir, self.segment_name.format(shard))
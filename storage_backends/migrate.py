@@ -0,0 +1,95 @@
+"""
+One-shot migration of data saved by storage.FileSystem into another storage backend.
+
+Usage: python -m storage_backends.migrate <filesystem storage dir> <sqlite database file>
+"""
+
+import argparse
+import codecs
+import os
+from typing import Iterator
+
+from storage import FileSystem, to_path
+from storage_backends.sqlite import SQLite
+
+
+def read_groups(path: str) -> set[int]:
+    """Returns ids of groups found in groups list file and in storage directory"""
+    groups = set()
+    groups_file = to_path(path, FileSystem.groups_list_file)
+    if os.path.exists(groups_file):
+        with codecs.open(groups_file, "r", encoding="utf-8") as file:
+            groups = {int(x) for x in file.readlines() if x.strip()}
+
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name.lstrip("-").isdigit():
+                groups.add(int(entry.name))
+    return groups
+
+
+def read_users(
+    path: str, group_ids: set[int]
+) -> Iterator[tuple[int, int, bool, str | None]]:
+    """
+    Walks FileSystem storage tree and yields (group_id, user_id, confirmed, confirm_code)
+    """
+    for group_id in group_ids:
+        confirmed_dir = to_path(path, group_id, FileSystem.confirmed_dir)
+        confirmed = set()
+        if os.path.isdir(confirmed_dir):
+            with os.scandir(confirmed_dir) as entries:
+                for entry in entries:
+                    confirmed.add(int(entry.name))
+                    yield group_id, int(entry.name), True, None
+
+        codes_dir = to_path(path, group_id, FileSystem.confirm_codes_dir)
+        if not os.path.isdir(codes_dir):
+            continue
+        with os.scandir(codes_dir) as entries:
+            for entry in entries:
+                if int(entry.name) in confirmed:
+                    continue
+                with codecs.open(entry.path, "r", encoding="utf-8") as file:
+                    yield group_id, int(entry.name), False, file.read()
+
+
+def migrate_to_sqlite(source_dir: str, db_path: str, batch_size: int = 5000) -> int:
+    """
+    Imports FileSystem storage tree into SQLite database. Pending kicks are imported
+    too, so users who have not solved captcha are still kicked. Returns number of
+    users
+    """
+    storage = SQLite(db_path)
+    try:
+        groups = read_groups(source_dir)
+        storage.import_groups(groups)
+        imported = storage.import_users(read_users(source_dir, groups), batch_size)
+        source = FileSystem(source_dir, groups)
+        try:
+            storage.add_kick_deadlines(source.get_kick_deadlines())
+        finally:
+            source.close()
+        return imported
+    finally:
+        storage.close()
+
+
+def main():
+    """
+    Migration command entrypoint
+    """
+    parser = argparse.ArgumentParser(
+        description="Migrates FileSystem storage into SQLite database"
+    )
+    parser.add_argument("source", help="FileSystem storage directory")
+    parser.add_argument("target", help="SQLite database file")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    imported = migrate_to_sqlite(args.source, args.target, args.batch_size)
+    print(f"Imported {imported} users into {args.target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Redis storage backend. State is kept on the server, so several bot processes can
+serve the same groups
+"""
+
+from typing import Iterable
+import time
+
+import redis
+
+from storage import AbstractStorage, KickDeadline, UserState
+
+
+class RedisStorage(AbstractStorage):
+    """
+    Implements data storage in Redis or any server speaking its protocol. Confirmed
+    users of a group are kept in one set and every confirm code is a separate key,
+    which is removed by the server when its ttl expires. Expiration times of codes
+    are kept in sorted set too, so pending codes are counted without scanning keys
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        confirm_code_ttl: int = 86400,
+        prefix: str = "antispam",
+    ) -> None:
+        self.client = client
+        self.confirm_code_ttl = confirm_code_ttl
+        self.prefix = prefix
+        self._groups: set[int] = set()
+
+    @classmethod
+    def from_url(
+        cls,
+        url: str,
+        pool_size: int = 16,
+        pool_timeout: float = 5.0,
+        **kwargs,
+    ) -> "RedisStorage":
+        """
+        Creates storage connected to server by url. Threads are waiting for free
+        connection when all connections of the pool are busy
+        """
+        pool = redis.BlockingConnectionPool.from_url(
+            url, max_connections=pool_size, timeout=pool_timeout
+        )
+        return cls(redis.Redis(connection_pool=pool), **kwargs)
+
+    def close(self) -> None:
+        self.client.close()
+        self.client.connection_pool.disconnect()
+
+    def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        return bool(self.client.sismember(self._confirmed_key(group_id), user_id))
+
+    def set_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        with self.client.pipeline() as pipe:
+            pipe.sadd(self._confirmed_key(group_id), user_id)
+            pipe.delete(self._code_key(group_id, user_id))
+            pipe.zrem(self._codes_key(), f"{group_id}:{user_id}")
+            pipe.execute()
+
+    def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        self.set_users_confirm_code(group_id, {user_id: confirm_code})
+
+    def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        return self._decode(self.client.get(self._code_key(group_id, user_id)))
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.sismember(self._confirmed_key(group_id), user_id)
+            pipe.get(self._code_key(group_id, user_id))
+            confirmed, code = pipe.execute()
+        if confirmed:
+            return UserState(True, None)
+        return UserState(False, self._decode(code))
+
+    def get_users_state(
+        self, group_id: int, user_ids: Iterable[int]
+    ) -> dict[int, UserState]:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        with self.client.pipeline(transaction=False) as pipe:
+            pipe.smismember(self._confirmed_key(group_id), user_ids)
+            pipe.mget([self._code_key(group_id, x) for x in user_ids])
+            confirmed, codes = pipe.execute()
+        return {
+            user_id: UserState(True, None)
+            if is_confirmed
+            else UserState(False, self._decode(code))
+            for user_id, is_confirmed, code in zip(user_ids, confirmed, codes)
+        }
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        if not confirm_codes:
+            return
+        expires_at = time.time() + self.confirm_code_ttl
+        with self.client.pipeline() as pipe:
+            for user_id, code in confirm_codes.items():
+                pipe.set(
+                    self._code_key(group_id, user_id), code, ex=self.confirm_code_ttl
+                )
+            pipe.zadd(
+                self._codes_key(), {f"{group_id}:{x}": expires_at for x in confirm_codes}
+            )
+            pipe.execute()
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        return [int(x) for x in self.client.sscan_iter(self._confirmed_key(group_id))]
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        # Confirm codes are removed by server when their ttl expires
+        return []
+
+    def count_pending_confirm_codes(self) -> int:
+        # Codes expired by server are dropped from sorted set here
+        with self.client.pipeline() as pipe:
+            pipe.zremrangebyscore(self._codes_key(), "-inf", time.time())
+            pipe.zcard(self._codes_key())
+            return pipe.execute()[1]
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        mapping = {
+            f"{x.group_id}:{x.user_id}": f"{x.kick_at}:{x.message_id}" for x in deadlines
+        }
+        if mapping:
+            self.client.hset(self._kick_deadlines_key(), mapping=mapping)
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        self.client.hdel(self._kick_deadlines_key(), f"{group_id}:{user_id}")
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        deadlines = []
+        for field, value in self.client.hscan_iter(self._kick_deadlines_key()):
+            group_id, user_id = self._decode(field).split(":")
+            kick_at, message_id = self._decode(value).split(":")
+            deadlines.append(
+                KickDeadline(int(group_id), int(user_id), float(kick_at), int(message_id))
+            )
+        return deadlines
+
+    def on_added_to_group(self, group_id: int) -> None:
+        if group_id in self._groups:
+            return
+        self.client.sadd(f"{self.prefix}:groups", group_id)
+        self._groups.add(group_id)
+
+    def _confirmed_key(self, group_id: int) -> str:
+        return f"{self.prefix}:confirmed:{group_id}"
+
+    def _codes_key(self) -> str:
+        return f"{self.prefix}:codes"
+
+    def _kick_deadlines_key(self) -> str:
+        return f"{self.prefix}:kick_deadlines"
+
+    def _code_key(self, group_id: int | str, user_id: int | str) -> str:
+        return f"{self.prefix}:code:{group_id}:{user_id}"
+
+    @staticmethod
+    def _decode(value: bytes | str | None) -> str | None:
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
@@ -0,0 +1,266 @@
+"""
+SQLite storage backend. Keeps all groups and users in one database file
+"""
+
+import sqlite3
+import time
+from threading import Lock
+from typing import Iterable
+
+from storage import AbstractStorage, KickDeadline, UserState
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS groups (group_id INTEGER PRIMARY KEY)",
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        confirmed INTEGER NOT NULL DEFAULT 0,
+        confirm_code TEXT,
+        confirm_code_at REAL,
+        PRIMARY KEY (group_id, user_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS users_confirm_code_at ON users (confirm_code_at)
+    WHERE confirm_code IS NOT NULL
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS kick_deadlines (
+        group_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        kick_at REAL NOT NULL,
+        message_id INTEGER NOT NULL,
+        PRIMARY KEY (group_id, user_id)
+    ) WITHOUT ROWID
+    """,
+)
+
+SQL_IS_USER_CONFIRMED = "SELECT confirmed FROM users WHERE group_id = ? AND user_id = ?"
+SQL_GET_USER_CONFIRM_CODE = (
+    "SELECT confirm_code FROM users WHERE group_id = ? AND user_id = ?"
+)
+SQL_SET_USER_CONFIRMED = """
+    INSERT INTO users (group_id, user_id, confirmed) VALUES (?, ?, 1)
+    ON CONFLICT (group_id, user_id) DO UPDATE SET
+        confirmed = 1, confirm_code = NULL, confirm_code_at = NULL
+"""
+SQL_SET_USER_CONFIRM_CODE = """
+    INSERT INTO users (group_id, user_id, confirm_code, confirm_code_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (group_id, user_id) DO UPDATE SET
+        confirm_code = excluded.confirm_code, confirm_code_at = excluded.confirm_code_at
+"""
+SQL_GET_EXPIRED_CONFIRM_CODES = """
+    SELECT group_id, user_id FROM users
+    WHERE confirm_code IS NOT NULL AND confirm_code_at < ? LIMIT ?
+"""
+SQL_DELETE_USER = "DELETE FROM users WHERE group_id = ? AND user_id = ?"
+SQL_COUNT_CONFIRM_CODES = "SELECT count(*) FROM users WHERE confirm_code IS NOT NULL"
+SQL_GET_USER_STATE = (
+    "SELECT confirmed, confirm_code FROM users WHERE group_id = ? AND user_id = ?"
+)
+SQL_GET_USERS_STATE = """
+    SELECT user_id, confirmed, confirm_code FROM users
+    WHERE group_id = ? AND user_id IN ({})
+"""
+SQL_GET_CONFIRMED_USERS = (
+    "SELECT user_id FROM users WHERE group_id = ? AND confirmed = 1"
+)
+SQL_ADD_GROUP = "INSERT OR IGNORE INTO groups (group_id) VALUES (?)"
+SQL_ADD_KICK_DEADLINE = """
+    INSERT OR REPLACE INTO kick_deadlines (group_id, user_id, kick_at, message_id)
+    VALUES (?, ?, ?, ?)
+"""
+SQL_REMOVE_KICK_DEADLINE = "DELETE FROM kick_deadlines WHERE group_id = ? AND user_id = ?"
+SQL_GET_KICK_DEADLINES = "SELECT group_id, user_id, kick_at, message_id FROM kick_deadlines"
+SQL_IMPORT_USER = """
+    INSERT INTO users (group_id, user_id, confirmed, confirm_code, confirm_code_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (group_id, user_id) DO UPDATE SET
+        confirmed = max(confirmed, excluded.confirmed),
+        confirm_code = CASE WHEN max(confirmed, excluded.confirmed) = 1
+            THEN NULL ELSE excluded.confirm_code END,
+        confirm_code_at = CASE WHEN max(confirmed, excluded.confirmed) = 1
+            THEN NULL ELSE excluded.confirm_code_at END
+"""
+
+
+class SQLite(AbstractStorage):
+    """
+    Implements data storage in SQLite database. Database works in WAL mode, so readers
+    are not blocked by writers. One connection is shared between all threads of the bot
+    (polling thread, reply workers and timers) and is guarded by a lock
+    """
+
+    # Keeps number of bound parameters below SQLITE_MAX_VARIABLE_NUMBER
+    max_batch_size = 500
+
+    def __init__(self, path: str, busy_timeout: float = 5.0) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(
+            path,
+            timeout=busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64,
+        )
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+        self._groups = {
+            x[0] for x in self._conn.execute("SELECT group_id FROM groups").fetchall()
+        }
+
+    def close(self) -> None:
+        """Closes database connection"""
+        with self._lock:
+            self._conn.close()
+
+    def is_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        row = self._fetch_one(SQL_IS_USER_CONFIRMED, (group_id, user_id))
+        return row is not None and bool(row[0])
+
+    def set_user_confirmed(self, group_id: int, user_id: int) -> bool:
+        with self._lock:
+            self._conn.execute(SQL_SET_USER_CONFIRMED, (group_id, user_id))
+
+    def set_user_confirm_code(
+        self, group_id: int, user_id: int, confirm_code: str
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                SQL_SET_USER_CONFIRM_CODE, (group_id, user_id, confirm_code, time.time())
+            )
+
+    def get_user_confirm_code(self, group_id: int, user_id: int) -> str | None:
+        row = self._fetch_one(SQL_GET_USER_CONFIRM_CODE, (group_id, user_id))
+        return None if row is None else row[0]
+
+    def get_user_state(self, group_id: int, user_id: int) -> UserState:
+        row = self._fetch_one(SQL_GET_USER_STATE, (group_id, user_id))
+        if row is None:
+            return UserState(False, None)
+        return UserState(bool(row[0]), None if row[0] else row[1])
+
+    def get_users_state(
+        self, group_id: int, user_ids: list[int]
+    ) -> dict[int, UserState]:
+        states = {x: UserState(False, None) for x in user_ids}
+        user_ids = list(states)
+        with self._lock:
+            for offset in range(0, len(user_ids), self.max_batch_size):
+                chunk = user_ids[offset:offset + self.max_batch_size]
+                sql = SQL_GET_USERS_STATE.format(", ".join("?" * len(chunk)))
+                for user_id, confirmed, confirm_code in self._conn.execute(
+                    sql, (group_id, *chunk)
+                ):
+                    states[user_id] = UserState(
+                        bool(confirmed), None if confirmed else confirm_code
+                    )
+        return states
+
+    def set_users_confirm_code(
+        self, group_id: int, confirm_codes: dict[int, str]
+    ) -> None:
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.executemany(
+                SQL_SET_USER_CONFIRM_CODE,
+                (
+                    (group_id, user_id, code, now)
+                    for user_id, code in confirm_codes.items()
+                ),
+            )
+
+    def get_confirmed_users(self, group_id: int) -> Iterable[int]:
+        with self._lock:
+            return [
+                x[0] for x in self._conn.execute(SQL_GET_CONFIRMED_USERS, (group_id,))
+            ]
+
+    def expire_confirm_codes(
+        self, older_than: float, limit: int
+    ) -> list[tuple[int, int]]:
+        # Rows with confirm code always belong to not confirmed users, so whole row
+        # is removed
+        with self._lock, self._transaction():
+            removed = self._conn.execute(
+                SQL_GET_EXPIRED_CONFIRM_CODES, (older_than, limit)
+            ).fetchall()
+            self._conn.executemany(SQL_DELETE_USER, removed)
+        return removed
+
+    def count_pending_confirm_codes(self) -> int:
+        return self._fetch_one(SQL_COUNT_CONFIRM_CODES, ())[0]
+
+    def add_kick_deadlines(self, deadlines: Iterable[KickDeadline]) -> None:
+        with self._lock, self._transaction():
+            self._conn.executemany(SQL_ADD_KICK_DEADLINE, deadlines)
+
+    def remove_kick_deadline(self, group_id: int, user_id: int) -> None:
+        with self._lock:
+            self._conn.execute(SQL_REMOVE_KICK_DEADLINE, (group_id, user_id))
+
+    def get_kick_deadlines(self) -> Iterable[KickDeadline]:
+        with self._lock:
+            return [
+                KickDeadline(*x) for x in self._conn.execute(SQL_GET_KICK_DEADLINES)
+            ]
+
+    def on_added_to_group(self, group_id: int) -> None:
+        if group_id in self._groups:
+            return
+        with self._lock:
+            self._conn.execute(SQL_ADD_GROUP, (group_id,))
+            self._groups.add(group_id)
+
+    def import_groups(self, group_ids: Iterable[int]) -> None:
+        """Bulk inserts known groups in a single transaction"""
+        group_ids = set(group_ids)
+        with self._lock, self._transaction():
+            self._conn.executemany(SQL_ADD_GROUP, ((x,) for x in group_ids))
+            self._groups |= group_ids
+
+    def import_users(
+        self, rows: Iterable[tuple[int, int, bool, str | None]], batch_size: int = 5000
+    ) -> int:
+        """
+        Bulk inserts (group_id, user_id, confirmed, confirm_code) rows using one
+        transaction per batch. Returns number of imported rows
+        """
+        imported = 0
+        batch = []
+        now = time.time()
+        for group_id, user_id, confirmed, confirm_code in rows:
+            batch.append(
+                (
+                    group_id,
+                    user_id,
+                    int(confirmed),
+                    confirm_code,
+                    None if confirmed else now,
+                )
+            )
+            if len(batch) >= batch_size:
+                imported += self._import_batch(batch)
+                batch = []
+        if batch:
+            imported += self._import_batch(batch)
+        return imported
+
+    def _import_batch(self, batch: list[tuple]) -> int:
+        with self._lock, self._transaction():
+            self._conn.executemany(SQL_IMPORT_USER, batch)
+        return len(batch)
+
+    def _transaction(self):
+        # Connection works in autocommit mode, so bulk operations open transaction
+        # explicitly. Connection context manager commits or rolls it back
+        self._conn.execute("BEGIN")
+        return self._conn
+
+    def _fetch_one(self, sql: str, params: tuple) -> tuple | None:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
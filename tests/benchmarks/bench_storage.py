@@ -0,0 +1,284 @@
+"""
+Benchmarks for storage backends under workloads produced by the bot.
+
+Usage: python -m tests.benchmarks.bench_storage --groups 10,100 --users 1000,100000
+    --backends filesystem,sqlite,log --output storage_bench.json
+
+Redis backend is benchmarked when BENCH_REDIS_URL is set. Keys are written under
+unique prefix and removed after benchmark
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from storage import AbstractStorage, CachedStorage, FileSystem
+from storage_backends.log_structured import LogStructured
+from storage_backends.redis import RedisStorage
+from storage_backends.sqlite import SQLite
+
+CONFIRM_CODES = ("❤️", "🙈", "💋", "😭", "😡", "🐶")
+
+BACKENDS: dict[str, Callable[[str], AbstractStorage]] = {
+    "filesystem": FileSystem,
+    "sqlite": lambda path: SQLite(os.path.join(path, "bot.sqlite3")),
+    "log": lambda path: LogStructured(path, compact_interval=0),
+}
+
+
+class BenchRedisStorage(RedisStorage):
+    """Redis storage removing its keys when it is closed"""
+
+    def close(self) -> None:
+        for key in self.client.scan_iter(match=f"{self.prefix}:*", count=1000):
+            self.client.delete(key)
+        super().close()
+
+
+if os.getenv("BENCH_REDIS_URL"):
+    BACKENDS["redis"] = lambda path: BenchRedisStorage.from_url(
+        os.getenv("BENCH_REDIS_URL"), prefix=f"bench-{uuid.uuid4().hex}"
+    )
+
+
+class Population:
+    """
+    Users stored before benchmark. Most of users are confirmed, the rest have
+    pending confirm codes
+    """
+
+    confirmed_ratio = 0.9
+
+    def __init__(self, groups: int, users: int, seed: int = 1) -> None:
+        self.random = random.Random(seed)
+        self.group_ids = [-1000000000000 - x for x in range(groups)]
+        self.users_per_group = max(1, users // groups)
+        self.next_user_id = self.users_per_group + 1
+
+    def fill(self, storage: AbstractStorage, batch_size: int = 1000) -> None:
+        """Writes population into storage"""
+        confirmed = int(self.users_per_group * self.confirmed_ratio)
+        for group_id in self.group_ids:
+            storage.on_added_to_group(group_id)
+            for offset in range(1, self.users_per_group + 1, batch_size):
+                user_ids = range(offset, min(offset + batch_size, self.users_per_group + 1))
+                storage.set_users_confirm_code(
+                    group_id, {x: self.random.choice(CONFIRM_CODES) for x in user_ids}
+                )
+                for user_id in user_ids:
+                    if user_id <= confirmed:
+                        storage.set_user_confirmed(group_id, user_id)
+
+    def random_member(self) -> tuple[int, int]:
+        """Returns random existing (group_id, user_id)"""
+        return (
+            self.random.choice(self.group_ids),
+            self.random.randint(1, self.users_per_group),
+        )
+
+    def new_user_ids(self, count: int) -> list[int]:
+        """Returns ids of users who are not stored yet"""
+        user_ids = list(range(self.next_user_id, self.next_user_id + count))
+        self.next_user_id += count
+        return user_ids
+
+
+def read_heavy(storage: AbstractStorage, population: Population) -> None:
+    """Message received: one state read per message"""
+    group_id, user_id = population.random_member()
+    storage.on_added_to_group(group_id)
+    storage.get_user_state(group_id, user_id)
+
+
+def join_burst(storage: AbstractStorage, population: Population) -> None:
+    """Raid: many members added with one update"""
+    group_id = population.random.choice(population.group_ids)
+    user_ids = population.new_user_ids(50)
+    storage.on_added_to_group(group_id)
+    states = storage.get_users_state(group_id, user_ids)
+    storage.set_users_confirm_code(
+        group_id,
+        {x: population.random.choice(CONFIRM_CODES) for x, y in states.items() if not y.confirmed},
+    )
+
+
+def confirm_flow(storage: AbstractStorage, population: Population) -> None:
+    """Member joined, got captha and solved it"""
+    group_id = population.random.choice(population.group_ids)
+    user_id = population.new_user_ids(1)[0]
+    storage.set_user_confirm_code(group_id, user_id, CONFIRM_CODES[0])
+    storage.get_user_state(group_id, user_id)
+    storage.set_user_confirmed(group_id, user_id)
+
+
+WORKLOADS = {
+    "read_heavy": read_heavy,
+    "join_burst": join_burst,
+    "confirm_flow": confirm_flow,
+}
+
+
+def percentile(latencies: list[int], quantile: float) -> float:
+    """Returns percentile of sorted latencies in microseconds"""
+    if not latencies:
+        return 0.0
+    return latencies[int(quantile * (len(latencies) - 1))] / 1000
+
+
+def disk_footprint(path: str) -> tuple[int, int]:
+    """Returns total size and number of files and directories under path"""
+    size = 0
+    files = 0
+    for root, dirs, names in os.walk(path):
+        files += len(dirs) + len(names)
+        for name in names:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return size, files
+
+
+def run_workload(
+    storage: AbstractStorage,
+    population: Population,
+    workload: Callable,
+    operations: int,
+    threads: int = 1,
+) -> dict:
+    """Runs workload and returns throughput and latency figures"""
+
+    def worker(count: int) -> list[int]:
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter_ns()
+            workload(storage, population)
+            latencies.append(time.perf_counter_ns() - started)
+        return latencies
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        chunks = [operations // threads] * threads
+        latencies = sorted(x for chunk in executor.map(worker, chunks) for x in chunk)
+    seconds = time.perf_counter() - started
+
+    return {
+        "operations": len(latencies),
+        "threads": threads,
+        "seconds": round(seconds, 6),
+        "ops_per_sec": round(len(latencies) / seconds, 2) if seconds else 0,
+        "p50_us": percentile(latencies, 0.5),
+        "p99_us": percentile(latencies, 0.99),
+    }
+
+
+def run_benchmarks(
+    backends: list[str],
+    groups: list[int],
+    users: list[int],
+    operations: int,
+    threads: int,
+    cache_size: int = 0,
+) -> list[dict]:
+    """Runs every workload for every backend and population size"""
+    results = []
+    for backend in backends:
+        for group_count in groups:
+            for user_count in users:
+                path = tempfile.mkdtemp(prefix=f"bench-{backend}-")
+                try:
+                    storage = BACKENDS[backend](path)
+                    if cache_size:
+                        storage = CachedStorage(storage, cache_size)
+                    population = Population(group_count, user_count)
+
+                    started = time.perf_counter()
+                    population.fill(storage)
+                    fill_seconds = time.perf_counter() - started
+
+                    for name, workload in WORKLOADS.items():
+                        results.append(
+                            {
+                                "backend": backend,
+                                "cache_size": cache_size,
+                                "groups": group_count,
+                                "users": user_count,
+                                "workload": name,
+                                **run_workload(storage, population, workload, operations),
+                            }
+                        )
+                    results.append(
+                        {
+                            "backend": backend,
+                            "cache_size": cache_size,
+                            "groups": group_count,
+                            "users": user_count,
+                            "workload": "concurrent_read_heavy",
+                            **run_workload(
+                                storage, population, read_heavy, operations, threads
+                            ),
+                        }
+                    )
+                    storage.close()
+
+                    disk_bytes, disk_files = disk_footprint(path)
+                    for result in results:
+                        if (
+                            result["backend"] == backend
+                            and result["groups"] == group_count
+                            and result["users"] == user_count
+                        ):
+                            result["fill_seconds"] = round(fill_seconds, 6)
+                            result["disk_bytes"] = disk_bytes
+                            result["disk_files"] = disk_files
+                finally:
+                    shutil.rmtree(path, ignore_errors=True)
+    return results
+
+
+def main():
+    """
+    Benchmark entrypoint
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks storage backends")
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--groups", default="10", help="Comma separated group counts")
+    parser.add_argument("--users", default="10000", help="Comma separated user counts")
+    parser.add_argument("--operations", type=int, default=10000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--cache-size", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for results, stdout by default")
+    args = parser.parse_args()
+
+    report = {
+        "python": sys.version,
+        "platform": platform.platform(),
+        "started_at": time.time(),
+        "results": run_benchmarks(
+            args.backends.split(","),
+            [int(x) for x in args.groups.split(",")],
+            [int(x) for x in args.users.split(",")],
+            args.operations,
+            args.threads,
+            args.cache_size,
+        ),
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+import unittest
+
+from tests.benchmarks.bench_storage import BACKENDS, WORKLOADS, percentile, run_benchmarks
+
+
+class TestStorageBenchmark(unittest.TestCase):
+    def test_percentile(self):
+        latencies = list(range(1000, 101000, 1000))
+
+        self.assertEqual(50.0, percentile(latencies, 0.5))
+        self.assertEqual(99.0, percentile(latencies, 0.99))
+        self.assertEqual(0.0, percentile([], 0.5))
+
+    def test_runs_every_workload_for_every_backend(self):
+        results = run_benchmarks(list(BACKENDS), [2], [20], operations=8, threads=2)
+
+        self.assertEqual(len(BACKENDS) * (len(WORKLOADS) + 1), len(results))
+        for result in results:
+            self.assertEqual(8, result["operations"])
+            if result["backend"] != "redis":
+                # Redis keeps data on server
+                self.assertGreater(result["disk_bytes"], 0)
+            self.assertLessEqual(result["p50_us"], result["p99_us"])
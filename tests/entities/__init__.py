@@ -0,0 +1,8 @@
+class Clock:
+    """Fake monotonic clock moved by tests"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
@@ -0,0 +1,57 @@
+import re
+import random
+import unittest
+
+from entities.aho_corasick import AhoCorasick, normalize_text
+
+
+class TestAhoCorasick(unittest.TestCase):
+    def test_overlapping_patterns_found(self):
+        matcher = AhoCorasick(["he", "she", "his", "hers", ""])
+
+        self.assertEqual(
+            [(3, "she"), (3, "he"), (5, "hers")], list(matcher.find_all("ushers"))
+        )
+        self.assertEqual(4, len(matcher))
+
+    def test_find_first(self):
+        matcher = AhoCorasick(["t.me/joinchat", "@spam"])
+
+        self.assertEqual("@spam", matcher.find_first("write to @spam_bot"))
+        self.assertIsNone(matcher.find_first("hello"))
+        self.assertIsNone(AhoCorasick([]).find_first("hello"))
+
+    def test_same_result_as_naive_search(self):
+        rnd = random.Random(1)
+        patterns = ["".join(rnd.choices("abc", k=rnd.randint(1, 4))) for _ in range(30)]
+        matcher = AhoCorasick(patterns)
+        for _ in range(20):
+            text = "".join(rnd.choices("abcd", k=50))
+            expected = sorted(
+                (m.start() + len(p) - 1, p)
+                for p in set(patterns)
+                for m in re.finditer(f"(?={re.escape(p)})", text)
+            )
+
+            self.assertEqual(expected, sorted(matcher.find_all(text)))
+
+
+class TestNormalizeText(unittest.TestCase):
+    def test_case_and_compatibility_forms(self):
+        self.assertEqual("free money", normalize_text("ＦＲＥＥ Money"))
+
+    def test_zero_width_characters_removed(self):
+        self.assertEqual("casino", normalize_text("ca\u200bsi\u00adno\ufeff"))
+
+    def test_homoglyphs_replaced(self):
+        # Cyrillic "е", "а" and "о" inside latin words
+        self.assertEqual(normalize_text("earn cocoa"), normalize_text("еаrn cоcоа"))
+
+    def test_words_of_one_script_kept(self):
+        self.assertEqual("я сам приду, ххх", normalize_text("Я сам приду, ХХХ"))
+
+    def test_russian_text_not_matched_by_latin_patterns(self):
+        matcher = AhoCorasick([normalize_text(x) for x in ("cam", "xxx", "earn")])
+
+        self.assertIsNone(matcher.find_first(normalize_text("Я сам приду, ххх")))
+        self.assertEqual("earn", matcher.find_first(normalize_text("Еаrn here")))
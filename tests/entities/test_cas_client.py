@@ -0,0 +1,103 @@
+import unittest
+from threading import Barrier
+from unittest.mock import Mock, patch
+
+import requests
+
+from entities.cas_client import CASClient, CircuitBreaker, CircuitOpenError
+from tests.entities import Clock
+
+
+def cas_response(banned: bool) -> Mock:
+    return Mock(status_code=200, **{"json.return_value": {"ok": banned}})
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opened_after_failures_and_closed_after_trial(self):
+        clock = Clock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+        # Only one trial request is let through
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.is_open)
+
+    def test_failed_trial_opens_circuit_again(self):
+        clock = Clock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        clock.now = 10
+        self.assertTrue(breaker.allow())
+
+        breaker.record_failure()
+
+        self.assertFalse(breaker.allow())
+        clock.now = 20
+        self.assertTrue(breaker.allow())
+
+
+class TestCASClient(unittest.TestCase):
+    def test_results_cached_with_separate_ttl(self):
+        clock = Clock()
+        metrics = Mock()
+        client = CASClient(positive_ttl=100, negative_ttl=10, clock=clock, metrics=metrics)
+        with patch(
+            "requests.Session.get", side_effect=lambda url, params, timeout: cas_response(
+                params["user_id"] == 1
+            )
+        ) as get_mock:
+            self.assertTrue(client.is_banned(1))
+            self.assertFalse(client.is_banned(2))
+            self.assertTrue(client.is_banned(1))
+            self.assertFalse(client.is_banned(2))
+            self.assertEqual(2, get_mock.call_count)
+
+            clock.now = 50
+            client.is_banned(1)
+            client.is_banned(2)
+            self.assertEqual(3, get_mock.call_count)
+
+        metrics.inc_cas_cache_lookups_total.assert_any_call("hit")
+        metrics.observe_cas_request_seconds.assert_called()
+        client.close()
+
+    def test_fails_fast_when_circuit_is_open(self):
+        client = CASClient(breaker=CircuitBreaker(failure_threshold=2))
+        with patch(
+            "requests.Session.get", side_effect=requests.ConnectionError("down")
+        ) as get_mock:
+            for user_id in (1, 2):
+                with self.assertRaises(requests.ConnectionError):
+                    client.is_banned(user_id)
+            with self.assertRaises(CircuitOpenError):
+                client.is_banned(3)
+
+        self.assertEqual(2, get_mock.call_count)
+        client.close()
+
+    def test_users_checked_concurrently(self):
+        client = CASClient(pool_size=3)
+        # Every request waits for others, so they pass only when sent at once
+        barrier = Barrier(3, timeout=5)
+
+        def get(url, params, timeout):
+            barrier.wait()
+            if params["user_id"] == 3:
+                raise requests.Timeout("slow")
+            return cas_response(params["user_id"] == 2)
+
+        with patch("requests.Session.get", side_effect=get):
+            results = client.check_many([1, 2, 3])
+
+        self.assertEqual(False, results[1])
+        self.assertEqual(True, results[2])
+        self.assertIsInstance(results[3], requests.Timeout)
+        client.close()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, Mock, patch
+
+from entities.cas_index import CASIndex, parse_cas_export
+
+
+class TestCASIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "export.csv")
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def write_export(self, content: str) -> None:
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(content)
+
+    def test_parse_export(self):
+        banned = parse_cas_export(["user_id\n", "12\n", "\n", "7,2024-01-01\n", "broken\n"])
+
+        self.assertEqual([7, 12], list(banned))
+
+    def test_refresh_from_local_file(self):
+        self.write_export("100\n200\n")
+        metrics = Mock()
+        index = CASIndex(self.path, metrics=metrics)
+
+        self.assertFalse(index.loaded)
+        self.assertNotIn(100, index)
+        self.assertEqual(2, index.refresh())
+
+        self.assertTrue(index.loaded)
+        self.assertIn(100, index)
+        self.assertNotIn(300, index)
+        metrics.set_cas_index_size.assert_called_once_with(2)
+
+        self.write_export("300\n")
+        index.refresh()
+
+        self.assertNotIn(100, index)
+        self.assertIn(300, index)
+
+    def test_empty_export_does_not_replace_list(self):
+        self.write_export("100\n")
+        index = CASIndex(self.path)
+        index.refresh()
+        self.write_export("")
+
+        with self.assertRaises(ValueError):
+            index.refresh()
+        self.assertIn(100, index)
+
+    def test_refresh_from_url(self):
+        response = MagicMock()
+        response.__enter__.return_value.iter_lines.return_value = [b"5", b"6"]
+        with patch("requests.get", return_value=response) as get_mock:
+            index = CASIndex("https://example.com/export.csv")
+            index.refresh()
+
+        get_mock.assert_called_once()
+        self.assertIn(5, index)
+
+    def test_background_refresh(self):
+        self.write_export("100\n")
+        logger = Mock()
+        index = CASIndex(self.path, refresh_interval=0.01, logger=logger)
+
+        index.start()
+        for _ in range(500):
+            if index.loaded:
+                break
+            time.sleep(0.01)
+        index.stop()
+
+        self.assertIn(100, index)
+        logger.error.assert_not_called()
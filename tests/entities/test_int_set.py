@@ -0,0 +1,31 @@
+import unittest
+
+from entities.int_set import IntSet
+
+
+class TestIntSet(unittest.TestCase):
+    def test_contains(self):
+        users = IntSet([5, 1, 3, 1])
+
+        self.assertEqual(3, len(users))
+        self.assertIn(1, users)
+        self.assertIn(5, users)
+        self.assertNotIn(2, users)
+        self.assertNotIn(6, users)
+
+    def test_add_merges_buffer(self):
+        users = IntSet()
+        users.merge_threshold = 4
+        for user_id in (9, 7, 7, 2**62, -1, 3):
+            users.add(user_id)
+
+        self.assertEqual(5, len(users))
+        self.assertEqual([-1, 3, 7, 9, 2**62], list(users))
+        for user_id in (9, 7, 2**62, -1, 3):
+            self.assertIn(user_id, users)
+
+    def test_memory_usage_grows_by_item_size(self):
+        small = IntSet(range(1000))
+        large = IntSet(range(101000))
+
+        self.assertLess(large.memory_usage() - small.memory_usage(), 100000 * 9)
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from entities.journal import JournalRecord, TaskJournal
+
+
+class TestTaskJournal(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "tasks.journal")
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def test_pending_tasks_restored(self):
+        journal = TaskJournal(self.path)
+        first = journal.append("ban_chat_member", {"chat_id": 1, "user_id": 2})
+        second = journal.append("delete_message", {"chat_id": 1, "message_id": 3}, 2)
+        journal.ack(first)
+        journal.close()
+
+        journal = TaskJournal(self.path)
+
+        self.assertEqual(
+            [JournalRecord(second, "delete_message", {"chat_id": 1, "message_id": 3}, 2)],
+            journal.pending(),
+        )
+        self.assertGreater(journal.append("kick_chat_member", {}), second)
+        journal.close()
+
+    def test_pending_tasks_restored_after_crash(self):
+        journal = TaskJournal(self.path)
+        journal.append("ban_chat_member", {"chat_id": 1, "user_id": 2})
+        acked = journal.append("ban_chat_member", {"chat_id": 1, "user_id": 3})
+        journal.ack(acked)
+        # Journal is not closed and its last line is written partially
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write('{"op": "add", "id": 5, "meth')
+
+        restored = TaskJournal(self.path)
+
+        self.assertEqual([2], [x.kwargs["user_id"] for x in restored.pending()])
+        restored.close()
+        journal.close()
+
+    def test_compaction(self):
+        journal = TaskJournal(self.path, compact_every=10)
+        kept = journal.append("ban_chat_member", {"chat_id": 1, "user_id": 1})
+        for user_id in range(2, 12):
+            journal.ack(journal.append("ban_chat_member", {"chat_id": 1, "user_id": user_id}))
+
+        with open(self.path, encoding="utf-8") as file:
+            lines = file.readlines()
+        self.assertEqual(1, len(lines))
+        self.assertEqual([kept], [x.journal_id for x in journal.pending()])
+        journal.close()
+
+    def test_ack_of_unknown_task_ignored(self):
+        journal = TaskJournal(self.path)
+        journal.ack(100)
+
+        self.assertEqual(0, len(journal))
+        journal.close()
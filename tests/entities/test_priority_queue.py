@@ -0,0 +1,55 @@
+import unittest
+from queue import Empty, Full
+from threading import Thread
+
+from entities.priority_queue import LaneQueue
+from tests.entities import Clock
+
+
+class TestLaneQueue(unittest.TestCase):
+    def test_higher_lane_taken_first(self):
+        queue = LaneQueue(3)
+        queue.put("send", 2)
+        queue.put("delete", 1)
+        queue.put("ban", 0)
+        queue.put("kick", 0)
+
+        self.assertEqual(
+            ["ban", "kick", "delete", "send"], [queue.get()[1] for _ in range(4)]
+        )
+        self.assertEqual(0, queue.qsize())
+
+    def test_starving_item_taken_first(self):
+        clock = Clock()
+        queue = LaneQueue(2, starvation_after=5, clock=clock)
+        queue.put("send", 1)
+        clock.now = 3
+        queue.put("ban 1", 0)
+        clock.now = 6
+        queue.put("ban 2", 0)
+
+        self.assertEqual((1, "send", 6), queue.get())
+        self.assertEqual((0, "ban 1", 3), queue.get())
+        self.assertEqual((0, "ban 2", 0), queue.get())
+
+    def test_get_timeout(self):
+        with self.assertRaises(Empty):
+            LaneQueue(2).get(timeout=0.01)
+
+    def test_lanes_limited_separately(self):
+        queue = LaneQueue(2, maxsize=1)
+        queue.put("send", 1)
+        queue.put("ban", 0)
+
+        with self.assertRaises(Full):
+            queue.put("send", 1, timeout=0.01)
+
+    def test_put_waits_for_free_place(self):
+        queue = LaneQueue(1, maxsize=1)
+        queue.put("a", 0)
+        thread = Thread(target=queue.put, args=("b", 0, 5))
+        thread.start()
+
+        self.assertEqual("a", queue.get(timeout=5)[1])
+        thread.join(5)
+        self.assertEqual("b", queue.get(timeout=5)[1])
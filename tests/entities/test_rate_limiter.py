@@ -0,0 +1,60 @@
+import unittest
+
+from entities.rate_limiter import RateLimiter
+from tests.entities import Clock
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_global_rate(self):
+        clock = Clock()
+        limiter = RateLimiter(global_rate=2, clock=clock)
+
+        self.assertEqual(0, limiter.reserve(None))
+        self.assertEqual(0, limiter.reserve(None))
+        self.assertAlmostEqual(0.5, limiter.reserve(None))
+        self.assertAlmostEqual(1.0, limiter.reserve(None))
+
+        clock.now = 10
+        self.assertEqual(0, limiter.reserve(None))
+
+    def test_group_rate(self):
+        clock = Clock()
+        limiter = RateLimiter(group_rate=1, group_burst=1, clock=clock)
+
+        self.assertEqual(0, limiter.reserve(-100))
+        self.assertAlmostEqual(1.0, limiter.reserve(-100))
+        self.assertEqual(0, limiter.reserve(-200))
+        # Chat limit is not applied to requests, which are not messages
+        self.assertEqual(0, limiter.reserve(-100, per_chat=False))
+
+    def test_private_chat_rate(self):
+        clock = Clock()
+        limiter = RateLimiter(private_rate=0.5, clock=clock)
+
+        self.assertEqual(0, limiter.reserve(100))
+        self.assertAlmostEqual(2.0, limiter.reserve(100))
+
+    def test_pause(self):
+        clock = Clock()
+        limiter = RateLimiter(clock=clock)
+
+        limiter.pause(-100, 7)
+
+        self.assertEqual(7, limiter.paused_for(-100))
+        self.assertEqual(0, limiter.paused_for(-200))
+        self.assertGreaterEqual(limiter.reserve(-100), 7)
+        self.assertGreaterEqual(limiter.reserve(-100, per_chat=False), 7)
+
+        clock.now = 8
+        self.assertEqual(0, limiter.paused_for(-100))
+
+    def test_idle_buckets_removed(self):
+        clock = Clock()
+        limiter = RateLimiter(clock=clock)
+        limiter.cleanup_every = 2
+
+        limiter.reserve(-1)
+        clock.now = 100
+        limiter.reserve(-2)
+
+        self.assertEqual([-2], list(limiter._chats))
@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from entities.retry import Backoff, DelayQueue, JsonLinesDeadLetterSink, OrderedDelayQueue
+from tests.entities import Clock
+
+
+class TestBackoff(unittest.TestCase):
+    def test_delay_grows_exponentially(self):
+        backoff = Backoff(base=1, max_delay=10)
+
+        for tries, (low, high) in enumerate([(0.5, 1), (1, 2), (2, 4), (4, 8)], 1):
+            delay = backoff.delay(tries)
+            self.assertTrue(low <= delay <= high, (tries, delay))
+
+        self.assertLessEqual(backoff.delay(20), 10)
+
+
+class TestDelayQueue(unittest.TestCase):
+    def test_items_ordered_by_time_and_insertion(self):
+        clock = Clock()
+        queue = DelayQueue(clock)
+        self.assertIsNone(queue.next_delay())
+
+        queue.put("late", 5)
+        queue.put("first", 1)
+        queue.put("second", 1)
+
+        self.assertEqual(3, len(queue))
+        self.assertEqual(1, queue.next_delay())
+        clock.now = 2
+        self.assertEqual(0, queue.next_delay())
+        self.assertEqual(["first", "second"], [queue.pop(), queue.pop()])
+        self.assertEqual(3, queue.next_delay())
+        self.assertEqual("late", queue.pop())
+
+
+class TestOrderedDelayQueue(unittest.TestCase):
+    def test_items_wait_for_deferred_item_of_key(self):
+        queue = OrderedDelayQueue(lambda x: x[0] or None, Clock())
+
+        queue.put(("a", 1), 1)
+        self.assertTrue(queue.is_held(("a", 2)))
+        self.assertFalse(queue.is_held(("b", 1)))
+        self.assertFalse(queue.is_held(("", 1)))
+        queue.wait(("a", 2))
+        queue.wait(("a", 3))
+        self.assertEqual(3, len(queue))
+
+        item = queue.pop()
+        # Item is deferred again, e.g. when it is retried
+        queue.put(item, 1)
+        self.assertTrue(queue.is_held(("a", 4)))
+        self.assertEqual([], queue.done(item))
+
+        item = queue.pop()
+        self.assertTrue(queue.is_held(("a", 4)))
+        self.assertEqual([("a", 2), ("a", 3)], queue.done(item))
+        self.assertFalse(queue.is_held(("a", 4)))
+        self.assertEqual(0, len(queue))
+
+
+class TestJsonLinesDeadLetterSink(unittest.TestCase):
+    def test_put(self):
+        path = os.path.join(tempfile.mkdtemp(), "dead.jsonl")
+        sink = JsonLinesDeadLetterSink(path)
+        task = Mock(method_name="ban_chat_member", kwargs={"chat_id": 1}, tries=3)
+
+        sink.put(task, ValueError("boom"))
+        sink.put(task, ValueError("boom"))
+
+        with open(path, encoding="utf-8") as file:
+            records = [json.loads(x) for x in file]
+        self.assertEqual(2, len(records))
+        self.assertEqual("ban_chat_member", records[0]["method_name"])
+        self.assertEqual({"chat_id": 1}, records[0]["kwargs"])
+        self.assertEqual("ValueError: boom", records[0]["error"])
@@ -0,0 +1,123 @@
+import asyncio
+import time
+import unittest
+from threading import Event
+from unittest.mock import Mock
+
+from entities.scheduler import AsyncScheduler, Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    def test_jobs_fired_in_order(self):
+        scheduler = Scheduler()
+        fired = []
+        done = Event()
+        now = time.time()
+        scheduler.schedule("b", now + 0.02, fired.append, "b")
+        scheduler.schedule("a", now, fired.append, "a")
+        scheduler.schedule("c", now + 0.04, lambda: done.set())
+
+        scheduler.start()
+
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        self.assertEqual(["a", "b"], fired)
+        self.assertEqual(0, len(scheduler))
+
+    def test_cancel(self):
+        scheduler = Scheduler()
+        callback = Mock()
+        done = Event()
+        scheduler.start()
+
+        scheduler.schedule("a", time.time() + 0.02, callback)
+        scheduler.schedule("b", time.time() + 0.04, done.set)
+
+        self.assertTrue(scheduler.cancel("a"))
+        self.assertFalse(scheduler.cancel("a"))
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        callback.assert_not_called()
+
+    def test_schedule_replaces_job_with_same_key(self):
+        scheduler = Scheduler()
+        fired = []
+        done = Event()
+        scheduler.schedule("a", time.time() + 10, fired.append, 1)
+        scheduler.schedule("a", time.time(), fired.append, 2)
+        scheduler.schedule("b", time.time() + 0.02, done.set)
+
+        scheduler.start()
+
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        self.assertEqual([2], fired)
+
+    def test_error_in_job_logged(self):
+        logger = Mock()
+        scheduler = Scheduler(logger)
+        done = Event()
+        scheduler.schedule("a", time.time(), Mock(side_effect=ValueError("boom")))
+        scheduler.schedule("b", time.time() + 0.02, done.set)
+
+        scheduler.start()
+
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        logger.error.assert_called_once()
+
+    def test_cancelled_jobs_removed_from_heap(self):
+        scheduler = Scheduler()
+        for key in range(100):
+            scheduler.schedule(key, time.time() + 60, Mock())
+        for key in range(90):
+            scheduler.cancel(key)
+
+        self.assertEqual(10, len(scheduler))
+        self.assertLess(len(scheduler._heap), 100)
+
+
+class TestAsyncScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_jobs_fired_in_order(self):
+        scheduler = AsyncScheduler()
+        fired = []
+        done = asyncio.Event()
+        now = time.time()
+
+        async def finish():
+            fired.append("c")
+            done.set()
+
+        scheduler.schedule("c", now + 0.06, finish)
+        scheduler.schedule("a", now + 0.02, fired.append, "a")
+        scheduler.schedule("b", now + 0.04, fired.append, "b")
+
+        await asyncio.wait_for(done.wait(), 5)
+        self.assertEqual(["a", "b", "c"], fired)
+        self.assertEqual(0, len(scheduler))
+
+    async def test_cancel_and_replace(self):
+        scheduler = AsyncScheduler()
+        fired = []
+        now = time.time()
+
+        scheduler.schedule("a", now + 0.02, fired.append, "a")
+        scheduler.schedule("b", now + 0.02, fired.append, "b")
+        scheduler.schedule("b", now + 0.03, fired.append, "b2")
+        self.assertTrue(scheduler.cancel("a"))
+        self.assertFalse(scheduler.cancel("missing"))
+
+        await asyncio.sleep(0.1)
+        self.assertEqual(["b2"], fired)
+
+    async def test_error_in_job_logged(self):
+        logger = Mock()
+        scheduler = AsyncScheduler(logger)
+
+        async def broken():
+            raise ValueError("broken")
+
+        scheduler.schedule("a", time.time(), broken)
+
+        await asyncio.sleep(0.05)
+        logger.error.assert_called_once()
@@ -0,0 +1,87 @@
+import random
+import unittest
+
+from entities.simhash import DuplicateIndex, simhash
+from tests.entities import Clock
+
+SPAM = "Earn $500 a day from home! Write to @crypto_signals_bot for details, only today"
+
+
+class TestSimhash(unittest.TestCase):
+    def test_near_duplicates_have_close_fingerprints(self):
+        fingerprint = simhash(SPAM)
+
+        self.assertEqual(fingerprint, simhash(SPAM.upper().replace(" ", "  ")))
+        self.assertLessEqual((fingerprint ^ simhash(SPAM + " 42")).bit_count(), 10)
+        self.assertGreater(
+            (fingerprint ^ simhash("Does anyone know when the next meetup is?")).bit_count(),
+            20,
+        )
+
+    def test_short_text(self):
+        self.assertEqual(simhash("hi"), simhash("HI"))
+        self.assertIsInstance(simhash(""), int)
+
+
+class TestDuplicateIndex(unittest.TestCase):
+    def test_flagged_after_min_chats(self):
+        index = DuplicateIndex(min_chats=3)
+
+        self.assertFalse(index.add(simhash(SPAM), 1, 10, 100).flagged)
+        self.assertFalse(index.add(simhash(SPAM), 1, 10, 101).flagged)
+        self.assertFalse(index.add(simhash(SPAM + " 1"), 2, 11, 200).flagged)
+        duplicate = index.add(simhash(SPAM + " 2"), 3, 12, 300)
+
+        self.assertEqual(3, duplicate.chats)
+        self.assertEqual(3, duplicate.users)
+        self.assertEqual(
+            [(1, 100, 10), (1, 101, 10), (2, 200, 11), (3, 300, 12)], duplicate.copies
+        )
+        self.assertEqual([(4, 400, 13)], index.add(simhash(SPAM), 4, 13, 400).copies)
+        self.assertEqual(1, len(index))
+
+    def test_different_texts_not_merged(self):
+        index = DuplicateIndex(min_chats=2)
+
+        index.add(simhash(SPAM), 1, 10, 100)
+        duplicate = index.add(simhash("Does anyone know when the next meetup is?"), 2, 11, 200)
+
+        self.assertFalse(duplicate.flagged)
+        self.assertEqual(2, len(index))
+
+    def test_text_forgotten_after_window(self):
+        clock = Clock()
+        index = DuplicateIndex(window=60, min_chats=2, clock=clock)
+
+        index.add(simhash(SPAM), 1, 10, 100)
+        clock.now = 61
+        self.assertFalse(index.add(simhash(SPAM), 2, 11, 200).flagged)
+        self.assertEqual(1, len(index))
+
+    def test_duplicate_found_under_background_traffic(self):
+        index = DuplicateIndex(min_chats=3, max_entries=10000)
+        rnd = random.Random(1)
+
+        index.add(simhash(SPAM), 1, 10, 100)
+        index.add(simhash(SPAM + " 1"), 2, 11, 200)
+        for i in range(4000):
+            index.add(rnd.getrandbits(64), 100 + i, i, i)
+        self.assertTrue(index.add(simhash(SPAM), 3, 12, 300).flagged)
+
+        index.add(simhash(SPAM + " 2"), 4, 13, 400)
+        for i in range(4000):
+            index.add(rnd.getrandbits(64), 100 + i, i, i)
+        self.assertEqual(5, index.add(simhash(SPAM + " 3"), 5, 14, 500).chats)
+
+    def test_memory_bounded(self):
+        index = DuplicateIndex(max_entries=10, bucket_size=2, max_copies=5)
+
+        for i in range(1000):
+            index.add(simhash(f"message number {i} " * 3), i % 7, i, i)
+        for i in range(100):
+            index.add(simhash(SPAM), i, i, i)
+
+        self.assertLessEqual(len(index), 10)
+        self.assertLessEqual(len(index._buckets), index.bands << index._band_bits)
+        self.assertTrue(all(len(x) <= 2 for x in index._buckets.values()))
+        self.assertTrue(all(len(x.chats) <= 5 for x in index._clusters.values()))
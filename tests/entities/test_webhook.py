@@ -0,0 +1,131 @@
+import json
+import unittest
+from contextlib import contextmanager
+from http.client import HTTPConnection
+from threading import Event
+from unittest.mock import Mock
+
+import telebot
+
+from entities.webhook import SECRET_TOKEN_HEADER, WebhookServer
+
+SECRET = "secret-token"
+
+# Updates recorded from telegram, ids are changed
+JOIN_UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 10,
+        "from": {"id": 42, "is_bot": False, "first_name": "Spam"},
+        "chat": {"id": -100500, "title": "Group", "type": "supergroup"},
+        "date": 1700000000,
+        "new_chat_members": [{"id": 42, "is_bot": False, "first_name": "Spam"}],
+    },
+}
+TEXT_UPDATE = {
+    "update_id": 1002,
+    "message": {
+        "message_id": 11,
+        "from": {"id": 42, "is_bot": False, "first_name": "Spam"},
+        "chat": {"id": -100500, "title": "Group", "type": "supergroup"},
+        "date": 1700000001,
+        "text": "buy now",
+    },
+}
+
+
+@contextmanager
+def create_server(bot, **kwargs):
+    server = WebhookServer(bot, SECRET, "127.0.0.1", 0, **kwargs)
+    server.start()
+    try:
+        yield server
+    finally:
+        server.stop()
+
+
+def post(server, body, token=SECRET, path="/webhook", length=None) -> int:
+    connection = HTTPConnection(*server.address, timeout=5)
+    headers = {"Content-Type": "application/json"}
+    if length is not None:
+        headers["Content-Length"] = length
+    if token is not None:
+        headers[SECRET_TOKEN_HEADER] = token
+    data = body if isinstance(body, bytes) else json.dumps(body).encode()
+    connection.request("POST", path, data, headers)
+    status = connection.getresponse().status
+    connection.close()
+    return status
+
+
+class TestWebhookServer(unittest.TestCase):
+    def test_updates_passed_to_handlers_in_order(self):
+        bot = telebot.TeleBot("1:token", threaded=False)
+        received = []
+        done = Event()
+        bot.register_message_handler(
+            lambda m: received.append("join"), content_types=["new_chat_members"]
+        )
+
+        def on_text(message):
+            received.append(message.text)
+            done.set()
+
+        bot.register_message_handler(on_text, content_types=["text"])
+
+        with create_server(bot) as server:
+            self.assertEqual(200, post(server, JOIN_UPDATE))
+            self.assertEqual(200, post(server, TEXT_UPDATE))
+            self.assertTrue(done.wait(5))
+
+        self.assertEqual(["join", "buy now"], received)
+
+    def test_wrong_secret_rejected(self):
+        bot = Mock()
+        with create_server(bot) as server:
+            self.assertEqual(403, post(server, TEXT_UPDATE, token="wrong"))
+            self.assertEqual(403, post(server, TEXT_UPDATE, token=None))
+
+        bot.process_new_updates.assert_not_called()
+
+    def test_bad_requests(self):
+        bot = Mock()
+        with create_server(bot) as server:
+            self.assertEqual(404, post(server, TEXT_UPDATE, path="/other"))
+            self.assertEqual(400, post(server, b"not json"))
+            self.assertEqual(400, post(server, b"null"))
+            self.assertEqual(400, post(server, b"", length="abc"))
+            self.assertEqual(400, post(server, b"", length="-1"))
+            self.assertEqual(413, post(server, b"", length=str(10 ** 9)))
+
+        bot.process_new_updates.assert_not_called()
+
+    def test_full_queue_rejects_updates(self):
+        release = Event()
+        bot = Mock()
+        bot.process_new_updates.side_effect = lambda updates: release.wait(5)
+        metrics = Mock()
+
+        with create_server(
+            bot, workers=1, queue_size=1, put_timeout=0.05, metrics=metrics
+        ) as server:
+            # First update is taken by worker, second one waits in queue
+            self.assertEqual(200, post(server, JOIN_UPDATE))
+            statuses = [post(server, TEXT_UPDATE) for _ in range(3)]
+            release.set()
+
+        self.assertEqual(503, statuses[-1])
+        metrics.inc_webhook_updates_total.assert_any_call("rejected")
+
+    def test_webhook_registered_when_url_set(self):
+        bot = Mock()
+        with create_server(bot, url="https://example.com/webhook"):
+            pass
+
+        bot.set_webhook.assert_called_once_with(
+            url="https://example.com/webhook", secret_token=SECRET, max_connections=40
+        )
+
+    def test_secret_is_required(self):
+        with self.assertRaises(ValueError):
+            WebhookServer(Mock(), "", "127.0.0.1", 0)
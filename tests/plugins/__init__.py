@@ -0,0 +1,8 @@
+from unittest.mock import MagicMock
+
+
+def create_index(banned: set[int], loaded: bool = True) -> MagicMock:
+    """Returns local CAS ban list having given users"""
+    index = MagicMock(loaded=loaded)
+    index.__contains__.side_effect = lambda user_id: loaded and user_id in banned
+    return index
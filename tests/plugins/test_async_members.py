@@ -0,0 +1,165 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+from entities.cas_client import CircuitBreaker, CircuitOpenError
+from plugins.async_members import AsyncAntispamVerification, AsyncCASBan, AsyncCASClient
+from storage import KickDeadline, UserState
+from tests.plugins import create_index
+
+
+def create_session(banned: bool = False, error: Exception = None) -> MagicMock:
+    response = Mock(
+        raise_for_status=Mock(side_effect=error),
+        json=AsyncMock(return_value={"ok": banned}),
+    )
+    session = MagicMock()
+    session.get.return_value.__aenter__.return_value = response
+    return session
+
+
+class TestAsyncCASClient(unittest.IsolatedAsyncioTestCase):
+    async def test_result_cached(self):
+        metrics = Mock()
+        client = AsyncCASClient(metrics=metrics)
+        client._session = create_session(banned=True)
+
+        self.assertTrue(await client.is_banned(1))
+        self.assertTrue(await client.is_banned(1))
+
+        client._session.get.assert_called_once()
+        metrics.inc_cas_cache_lookups_total.assert_any_call("hit")
+        metrics.observe_cas_request_seconds.assert_called_once()
+
+    async def test_failing_service_not_asked(self):
+        client = AsyncCASClient(breaker=CircuitBreaker(failure_threshold=2))
+        client._session = create_session(error=ValueError("down"))
+
+        for user_id in (1, 2):
+            with self.assertRaises(ValueError):
+                await client.is_banned(user_id)
+        with self.assertRaises(CircuitOpenError):
+            await client.is_banned(3)
+
+        self.assertEqual(2, client._session.get.call_count)
+
+
+class TestAsyncCASBan(unittest.IsolatedAsyncioTestCase):
+    async def test_banned_members_are_banned(self):
+        client = Mock(is_banned=AsyncMock(side_effect=[True, False, ValueError("down")]))
+        plugin = AsyncCASBan(Mock(), client)
+        engine_mock = Mock()
+        message_mock = Mock(
+            chat=Mock(id=100), new_chat_members=[Mock(id=1), Mock(id=2), Mock(id=3)]
+        )
+
+        self.assertTrue(await plugin.execute(engine_mock, message_mock))
+
+        self.assertEqual(3, client.is_banned.await_count)
+        engine_mock.ban_user.assert_called_once_with(100, 1)
+
+    async def test_not_banned_member(self):
+        client = Mock(is_banned=AsyncMock(return_value=False))
+        plugin = AsyncCASBan(Mock(), client)
+        engine_mock = Mock()
+
+        self.assertIsNone(
+            await plugin.execute(engine_mock, Mock(new_chat_members=[Mock(id=1)]))
+        )
+
+        engine_mock.ban_user.assert_not_called()
+
+    async def test_index_trusted_when_loaded(self):
+        client = Mock(is_banned=AsyncMock(return_value=True))
+        plugin = AsyncCASBan(Mock(), client, index=create_index({1}))
+        engine_mock = Mock()
+
+        await plugin.execute(
+            engine_mock, Mock(chat=Mock(id=100), new_chat_members=[Mock(id=1), Mock(id=2)])
+        )
+
+        client.is_banned.assert_not_awaited()
+        engine_mock.ban_user.assert_called_once_with(100, 1)
+
+    async def test_api_asked_until_index_loaded(self):
+        client = Mock(is_banned=AsyncMock(return_value=True))
+        plugin = AsyncCASBan(Mock(), client, index=create_index(set(), loaded=False))
+        engine_mock = Mock()
+
+        await plugin.execute(engine_mock, Mock(chat=Mock(id=100), new_chat_members=[Mock(id=1)]))
+
+        client.is_banned.assert_awaited_once_with(1)
+        engine_mock.ban_user.assert_called_once_with(100, 1)
+
+
+def create_engine():
+    engine_mock = Mock(bot_username="test_bot")
+    engine_mock.storage = AsyncMock()
+    engine_mock.create_task = asyncio.ensure_future
+    return engine_mock
+
+
+class TestAsyncAntispamVerification(unittest.IsolatedAsyncioTestCase):
+    @patch("plugins.members.messages.render_new_member_joined_message", return_value="")
+    async def test_execute_sends_captcha_and_schedules_kick(self, _):
+        engine_mock = create_engine()
+        engine_mock.send_message = AsyncMock(return_value=Mock(id=10))
+        engine_mock.storage.get_users_state.return_value = {
+            1: UserState(True, None),
+            2: UserState(False, None),
+        }
+        plugin = AsyncAntispamVerification(Mock(), engine_mock, 60)
+        message_mock = Mock(chat=Mock(id=100), new_chat_members=[Mock(id=1), Mock(id=2)])
+
+        await plugin.execute(engine_mock, message_mock)
+        await asyncio.sleep(0)
+
+        engine_mock.storage.get_users_state.assert_awaited_once_with(100, [1, 2])
+        engine_mock.storage.set_users_confirm_code.assert_awaited_once()
+        engine_mock.send_message.assert_awaited_once()
+        [deadline] = engine_mock.storage.add_kick_deadlines.await_args.args[0]
+        self.assertEqual(
+            (100, 2, 10), (deadline.group_id, deadline.user_id, deadline.message_id)
+        )
+        engine_mock.scheduler.schedule.assert_called_once()
+
+    async def test_restore_kick_deadlines(self):
+        engine_mock = create_engine()
+        engine_mock.storage.get_kick_deadlines.return_value = [
+            KickDeadline(100, 1, 0, 10)
+        ]
+        plugin = AsyncAntispamVerification(Mock(), engine_mock)
+
+        await plugin.restore_kick_deadlines()
+
+        engine_mock.scheduler.schedule.assert_called_once_with(
+            ("kick", 100, 1), 0, plugin.kick_inactive, engine_mock, 100, 1, 10
+        )
+
+    async def test_correct_answer_cancels_kick(self):
+        engine_mock = create_engine()
+        engine_mock.storage.get_user_state.return_value = UserState(False, "❤️")
+        plugin = AsyncAntispamVerification(Mock(), engine_mock)
+        callback = Mock(
+            data="verify_❤️",
+            message=Mock(chat=Mock(id=100), id=10),
+            from_user=Mock(id=1),
+        )
+
+        await plugin._user_selected_answer(callback)
+
+        engine_mock.storage.set_user_confirmed.assert_awaited_once_with(100, 1)
+        engine_mock.scheduler.cancel.assert_called_once_with(("kick", 100, 1))
+        engine_mock.storage.remove_kick_deadline.assert_awaited_once_with(100, 1)
+        engine_mock.delete_message.assert_called_once_with(chat_id=100, message_id=10)
+
+    async def test_kick_inactive(self):
+        engine_mock = create_engine()
+        engine_mock.storage.is_user_confirmed.return_value = False
+        plugin = AsyncAntispamVerification(Mock(), engine_mock)
+
+        await plugin.kick_inactive(engine_mock, 100, 1, 10)
+
+        engine_mock.storage.remove_kick_deadline.assert_awaited_once_with(100, 1)
+        engine_mock.kick_chat_member.assert_called_once_with(100, 1)
+        engine_mock.delete_message.assert_called_once_with(100, 10)
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, call
+
+from entities.simhash import DuplicateIndex
+from plugins.chat_message import DuplicateFloodFilter, SpamPhraseFilter
+
+
+def create_message(text, entities=None):
+    return Mock(
+        id=5,
+        text=text,
+        caption=None,
+        entities=entities,
+        caption_entities=None,
+        chat=Mock(id=100),
+        from_user=Mock(id=1),
+    )
+
+
+class TestSpamPhraseFilter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "phrases.txt")
+        self.write_phrases("# comment\nt.me/joinchat\n!@Crypto_Signals\n\nEarn from home\n")
+
+    def tearDown(self) -> None:
+        self.dir.cleanup()
+
+    def write_phrases(self, content: str, mtime: float = 1000) -> None:
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write(content)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_message_with_phrase_deleted(self):
+        plugin = SpamPhraseFilter(Mock(), self.path)
+        engine_mock = Mock()
+
+        self.assertTrue(
+            plugin.execute(engine_mock, create_message("E\u0430rn fr\u200bom HOME now"))
+        )
+
+        engine_mock.delete_message.assert_called_once_with(100, 5)
+        engine_mock.ban_user.assert_not_called()
+
+    def test_author_banned_for_ban_phrase(self):
+        plugin = SpamPhraseFilter(Mock(), self.path)
+        engine_mock = Mock()
+
+        plugin.execute(engine_mock, create_message("join t.me/joinchat and @crypto_signals"))
+
+        engine_mock.delete_message.assert_called_once_with(100, 5)
+        engine_mock.ban_user.assert_called_once_with(100, 1)
+
+    def test_hidden_link_checked(self):
+        plugin = SpamPhraseFilter(Mock(), self.path)
+        engine_mock = Mock()
+        link = Mock(type="text_link", url="https://t.me/joinchat/abc")
+
+        self.assertTrue(plugin.execute(engine_mock, create_message("click", [link])))
+
+    def test_clean_message_passed(self):
+        plugin = SpamPhraseFilter(Mock(), self.path)
+        engine_mock = Mock()
+
+        self.assertIsNone(plugin.execute(engine_mock, create_message("hello everyone")))
+        self.assertIsNone(plugin.execute(engine_mock, create_message(None)))
+
+        engine_mock.delete_message.assert_not_called()
+
+    def test_reloaded_when_file_changed(self):
+        plugin = SpamPhraseFilter(Mock(), self.path)
+        engine_mock = Mock()
+
+        self.assertFalse(plugin.reload())
+        self.write_phrases("hello\n", mtime=2000)
+        self.assertTrue(plugin.reload())
+
+        self.assertTrue(plugin.execute(engine_mock, create_message("hello everyone")))
+        self.assertIsNone(plugin.execute(engine_mock, create_message("earn from home")))
+
+
+class TestDuplicateFloodFilter(unittest.TestCase):
+    text = "Earn $500 a day from home! Write to @crypto_signals_bot for details"
+
+    def create_message(self, text, chat_id, message_id):
+        message = create_message(text)
+        message.chat.id = chat_id
+        message.id = message_id
+        message.from_user.id = chat_id * 10
+        return message
+
+    def test_copies_deleted_from_all_groups(self):
+        plugin = DuplicateFloodFilter(Mock(), DuplicateIndex(min_chats=2), ban=True)
+        engine_mock = Mock()
+
+        self.assertIsNone(plugin.execute(engine_mock, self.create_message(self.text, 1, 5)))
+        self.assertTrue(plugin.execute(engine_mock, self.create_message(self.text, 2, 6)))
+
+        self.assertEqual(
+            [call(1, 5), call(2, 6)], engine_mock.delete_message.call_args_list
+        )
+        self.assertEqual(
+            [call(1, 10), call(2, 20)], engine_mock.ban_user.call_args_list
+        )
+
+    def test_short_messages_skipped(self):
+        plugin = DuplicateFloodFilter(Mock(), DuplicateIndex(min_chats=2))
+        engine_mock = Mock()
+
+        for chat_id in range(5):
+            plugin.execute(engine_mock, self.create_message("hello", chat_id, 1))
+        plugin.execute(engine_mock, self.create_message(None, 1, 1))
+
+        engine_mock.delete_message.assert_not_called()
+        self.assertEqual(0, len(plugin.index))
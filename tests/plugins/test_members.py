@@ -1,11 +1,15 @@
 import unittest
+from concurrent.futures import Future
 from unittest.mock import Mock, patch
-from plugins.members import CASBan
+from plugins.members import CASBan, AntispamVerification, RemoveMemberJoinedMessage
+from plugins.runner import PluginRunner
+from storage import KickDeadline, UserState
+from tests.plugins import create_index
 
 
 class TestCASBan(unittest.TestCase):
     @patch(
-        "requests.get",
+        "requests.Session.get",
         return_value=Mock(status_code=200, **{"json.return_value": {"ok": True}}),
     )
     def test_check_cas_ban_user_banned(self, requests_mock):
@@ -19,7 +23,7 @@ class TestCASBan(unittest.TestCase):
         engine_mock.ban_user.assert_called()
 
     @patch(
-        "requests.get",
+        "requests.Session.get",
         return_value=Mock(status_code=200, **{"json.return_value": {"ok": False}}),
     )
     def test_check_cas_ban_user_not_banned(self, requests_mock):
@@ -34,5 +38,173 @@ class TestCASBan(unittest.TestCase):
 
 
 class TestAntispamVerification(unittest.TestCase):
-    # TODO: Implement
-    pass
\ No newline at end of file
+    @patch("plugins.members.messages.render_new_member_joined_message", return_value="")
+    def test_execute_uses_batch_storage_calls(self, _):
+        engine_mock = Mock(bot_username="test_bot")
+        engine_mock.storage.get_kick_deadlines.return_value = []
+        sent = [Future(), Future()]
+        engine_mock.send_message.side_effect = sent
+        engine_mock.storage.get_users_state.return_value = {
+            1: UserState(True, None),
+            2: UserState(False, "❤️"),
+            3: UserState(False, None),
+        }
+        plugin = AntispamVerification(Mock(), engine_mock)
+        message_mock = Mock(
+            chat=Mock(id=100),
+            new_chat_members=[Mock(id=1), Mock(id=2), Mock(id=3)],
+        )
+
+        plugin.execute(engine_mock, message_mock)
+
+        engine_mock.storage.get_users_state.assert_called_once_with(100, [1, 2, 3])
+        engine_mock.storage.set_users_confirm_code.assert_called_once()
+        self.assertEqual(
+            [3], list(engine_mock.storage.set_users_confirm_code.call_args.args[1])
+        )
+        self.assertEqual(2, engine_mock.send_message.call_count)
+        # Kicks are scheduled only when captcha messages are sent
+        engine_mock.scheduler.schedule.assert_not_called()
+
+        sent[0].set_result(Mock(id=10))
+        sent[1].set_result(Mock(id=11))
+
+        self.assertEqual(2, engine_mock.scheduler.schedule.call_count)
+        deadlines = [
+            x.args[0][0] for x in engine_mock.storage.add_kick_deadlines.call_args_list
+        ]
+        self.assertEqual(
+            [(100, 2, 10), (100, 3, 11)],
+            [(x.group_id, x.user_id, x.message_id) for x in deadlines],
+        )
+
+    @patch("plugins.members.messages.render_new_member_joined_message", return_value="")
+    def test_kick_not_scheduled_when_captcha_not_sent(self, _):
+        engine_mock = Mock(bot_username="test_bot")
+        engine_mock.storage.get_kick_deadlines.return_value = []
+        engine_mock.storage.get_users_state.return_value = {1: UserState(False, None)}
+        sent = Future()
+        engine_mock.send_message.return_value = sent
+        plugin = AntispamVerification(Mock(), engine_mock)
+
+        plugin.execute(engine_mock, Mock(chat=Mock(id=100), new_chat_members=[Mock(id=1)]))
+        sent.set_exception(ValueError("chat not found"))
+
+        engine_mock.scheduler.schedule.assert_not_called()
+        engine_mock.storage.add_kick_deadlines.assert_not_called()
+
+    def test_kick_deadlines_restored(self):
+        engine_mock = Mock()
+        engine_mock.storage.get_kick_deadlines.return_value = [
+            KickDeadline(100, 1, 1000.0, 5)
+        ]
+
+        plugin = AntispamVerification(Mock(), engine_mock)
+
+        engine_mock.scheduler.schedule.assert_called_once_with(
+            ("kick", 100, 1), 1000.0, plugin.kick_inactive, engine_mock, 100, 1, 5
+        )
+
+    def test_kick_inactive(self):
+        engine_mock = Mock()
+        engine_mock.storage.get_kick_deadlines.return_value = []
+        engine_mock.storage.is_user_confirmed.return_value = False
+        plugin = AntispamVerification(Mock(), engine_mock)
+
+        plugin.kick_inactive(engine_mock, 100, 1, 5)
+
+        engine_mock.storage.remove_kick_deadline.assert_called_once_with(100, 1)
+        engine_mock.kick_chat_member.assert_called_once_with(100, 1)
+        engine_mock.delete_message.assert_called_once_with(100, 5)
+
+    def test_user_selected_answer(self):
+        engine_mock = Mock()
+        engine_mock.storage.get_kick_deadlines.return_value = []
+        engine_mock.storage.get_user_state.return_value = UserState(False, "❤️")
+        plugin = AntispamVerification(Mock(), engine_mock)
+        callback_mock = Mock(
+            data="verify_❤️", message=Mock(id=5, chat=Mock(id=100)), from_user=Mock(id=1)
+        )
+
+        plugin._user_selected_answer(callback_mock)
+
+        engine_mock.storage.set_user_confirmed.assert_called_once_with(100, 1)
+        engine_mock.scheduler.cancel.assert_called_once_with(("kick", 100, 1))
+        engine_mock.storage.remove_kick_deadline.assert_called_once_with(100, 1)
+        engine_mock.delete_message.assert_called_once_with(chat_id=100, message_id=5)
+
+
+class TestCASBanIndex(unittest.TestCase):
+    @patch("requests.Session.get")
+    def test_banned_member_found_in_index(self, requests_mock):
+        plugin = CASBan(Mock(), index=create_index({123}), http_fallback=True)
+        engine_mock = Mock()
+
+        self.assertTrue(
+            plugin.execute(engine_mock, Mock(chat=Mock(id=1), new_chat_members=[Mock(id=123)]))
+        )
+
+        requests_mock.assert_not_called()
+        engine_mock.ban_user.assert_called_once_with(1, 123)
+
+    @patch("requests.Session.get")
+    def test_api_not_asked_without_fallback(self, requests_mock):
+        plugin = CASBan(Mock(), index=create_index({123}))
+        engine_mock = Mock()
+
+        plugin.execute(engine_mock, Mock(new_chat_members=[Mock(id=5)]))
+
+        requests_mock.assert_not_called()
+        engine_mock.ban_user.assert_not_called()
+
+    @patch(
+        "requests.Session.get",
+        return_value=Mock(status_code=200, **{"json.return_value": {"ok": True}}),
+    )
+    def test_api_asked_for_member_missing_in_index(self, requests_mock):
+        plugin = CASBan(Mock(), index=create_index({123}), http_fallback=True)
+        engine_mock = Mock()
+
+        plugin.execute(engine_mock, Mock(new_chat_members=[Mock(id=5)]))
+
+        requests_mock.assert_called_once()
+        engine_mock.ban_user.assert_called_once()
+
+    def test_api_asked_until_index_loaded(self):
+        client = Mock(**{"check_many.return_value": {5: True}})
+        plugin = CASBan(Mock(), index=create_index(set(), loaded=False), client=client)
+        engine_mock = Mock()
+
+        plugin.execute(engine_mock, Mock(chat=Mock(id=1), new_chat_members=[Mock(id=5)]))
+
+        client.check_many.assert_called_once_with([5])
+        engine_mock.ban_user.assert_called_once_with(1, 5)
+
+    def test_join_message_left_when_member_banned(self):
+        engine_mock = Mock()
+        runner = PluginRunner(engine_mock, Mock(), Mock())
+        client = Mock(**{"check_many.return_value": {5: True}})
+        plugins = [CASBan(Mock(), client=client), RemoveMemberJoinedMessage(Mock())]
+
+        self.assertTrue(
+            runner.run(plugins, Mock(id=10, chat=Mock(id=1), new_chat_members=[Mock(id=5)]))
+        )
+        runner.close()
+
+        engine_mock.ban_user.assert_called_once_with(1, 5)
+        engine_mock.delete_message.assert_not_called()
+
+    def test_all_members_checked(self):
+        client = Mock(**{"check_many.return_value": {5: False, 6: True, 7: ValueError()}})
+        plugin = CASBan(Mock(), client=client)
+        engine_mock = Mock()
+
+        self.assertTrue(
+            plugin.execute(
+                engine_mock,
+                Mock(chat=Mock(id=1), new_chat_members=[Mock(id=5), Mock(id=6), Mock(id=7)]),
+            )
+        )
+
+        client.check_many.assert_called_once_with([5, 6, 7])
+        engine_mock.ban_user.assert_called_once_with(1, 6)
@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from plugins import AbstractPlugin
+from plugins.runner import PluginRunner
+
+
+class Plugin(AbstractPlugin):
+    def __init__(self, result=None, delay=0.0, concurrent=False, timeout=None) -> None:
+        super().__init__(Mock())
+        self.result = result
+        self.delay = delay
+        self.concurrent = concurrent
+        self.timeout = timeout
+        self.calls = []
+
+    def execute(self, engine, message):
+        self.calls.append(threading.current_thread().name)
+        if isinstance(self.delay, threading.Barrier):
+            self.delay.wait()
+        else:
+            time.sleep(self.delay)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class TestPluginRunner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.metrics = Mock()
+        self.runner = PluginRunner(Mock(), self.metrics, Mock(), workers=4)
+
+    def tearDown(self) -> None:
+        self.runner.close()
+
+    def test_first_plugin_returning_true_stops_others(self):
+        first, second, third = Plugin(), Plugin(True), Plugin()
+
+        self.assertTrue(self.runner.run([first, second, third], Mock()))
+
+        self.assertEqual(1, len(first.calls))
+        self.assertEqual(1, len(second.calls))
+        self.assertEqual([], third.calls)
+        self.assertEqual(2, self.metrics.observe_plugin_execution_seconds.call_count)
+
+    def test_error_in_plugin_does_not_stop_others(self):
+        broken, second = Plugin(ValueError("broken")), Plugin()
+
+        self.assertFalse(self.runner.run([broken, second], Mock()))
+
+        self.assertEqual(1, len(second.calls))
+        self.metrics.inc_plugin_errors_total.assert_called_once_with("Plugin", "ValueError")
+
+    def test_slow_plugin_is_not_waited_for(self):
+        slow, second = Plugin(True, delay=0.5, timeout=0.05), Plugin()
+
+        self.assertFalse(self.runner.run([slow, second], Mock()))
+
+        self.assertEqual(1, len(second.calls))
+        self.metrics.inc_plugin_timeouts_total.assert_called_once_with("Plugin")
+
+    def test_concurrent_plugins_run_in_parallel(self):
+        # Plugins pass barrier only when they are executed at once
+        barrier = threading.Barrier(2, timeout=5)
+        first = Plugin(delay=barrier, concurrent=True)
+        second = Plugin(True, delay=barrier, concurrent=True)
+        ordered = Plugin(True)
+        skipped = Plugin()
+
+        self.assertTrue(self.runner.run([first, ordered, second, skipped], Mock()))
+
+        self.assertEqual(1, len(first.calls))
+        self.assertEqual(1, len(second.calls))
+        self.assertEqual([], skipped.calls)
+
+    def test_plugins_run_on_handler_thread_without_timeout(self):
+        runner = PluginRunner(Mock(), self.metrics, Mock(), default_timeout=None)
+        plugin = Plugin()
+
+        runner.run([plugin], Mock())
+
+        self.assertEqual([threading.current_thread().name], plugin.calls)
+        runner.close()
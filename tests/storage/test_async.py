@@ -0,0 +1,28 @@
+import tempfile
+import unittest
+
+from storage import AsyncStorage, FileSystem, KickDeadline, UserState
+
+
+class TestAsyncStorage(unittest.IsolatedAsyncioTestCase):
+    async def test_calls_are_delegated(self):
+        with tempfile.TemporaryDirectory() as path:
+            storage = AsyncStorage(FileSystem(path), max_workers=2)
+
+            await storage.on_added_to_group(1)
+            await storage.set_users_confirm_code(1, {2: "❤️", 3: "🐶"})
+            await storage.set_user_confirmed(1, 3)
+            await storage.add_kick_deadlines([KickDeadline(1, 2, 1000.0, 5)])
+
+            self.assertEqual(
+                {2: UserState(False, "❤️"), 3: UserState(True, None)},
+                await storage.get_users_state(1, [2, 3]),
+            )
+            self.assertTrue(await storage.is_user_confirmed(1, 3))
+            self.assertEqual(
+                [KickDeadline(1, 2, 1000.0, 5)], await storage.get_kick_deadlines()
+            )
+            await storage.remove_kick_deadline(1, 2)
+            self.assertEqual([], await storage.get_kick_deadlines())
+
+            await storage.close()
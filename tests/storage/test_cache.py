@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import Mock
+
+from storage import CachedStorage, LRUCache, UserState
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put(1, "a")
+        cache.put(2, "b")
+        cache.get(1)
+        cache.put(3, "c")
+
+        self.assertEqual("a", cache.get(1))
+        self.assertEqual("c", cache.get(3))
+        self.assertEqual(2, len(cache))
+        self.assertNotEqual("b", cache.get(2))
+
+
+class TestCachedStorage(unittest.TestCase):
+    def test_is_user_confirmed_cached(self):
+        storage_mock = Mock(**{"is_user_confirmed.return_value": False})
+        metrics_mock = Mock()
+        storage = CachedStorage(storage_mock, metrics=metrics_mock)
+
+        self.assertFalse(storage.is_user_confirmed(1, 1))
+        self.assertFalse(storage.is_user_confirmed(1, 1))
+
+        storage_mock.is_user_confirmed.assert_called_once_with(1, 1)
+        metrics_mock.inc_storage_cache_misses_total.assert_called_once_with(
+            "is_user_confirmed", 1
+        )
+        metrics_mock.inc_storage_cache_hits_total.assert_called_once_with(
+            "is_user_confirmed", 1
+        )
+
+    def test_negative_confirm_code_cached(self):
+        storage_mock = Mock(**{"get_user_confirm_code.return_value": None})
+        storage = CachedStorage(storage_mock)
+
+        self.assertIsNone(storage.get_user_confirm_code(1, 1))
+        self.assertIsNone(storage.get_user_confirm_code(1, 1))
+
+        storage_mock.get_user_confirm_code.assert_called_once_with(1, 1)
+
+    def test_set_user_confirm_code_invalidates(self):
+        storage_mock = Mock(**{"get_user_confirm_code.return_value": None})
+        storage = CachedStorage(storage_mock)
+
+        self.assertIsNone(storage.get_user_confirm_code(1, 1))
+        storage.set_user_confirm_code(1, 1, "❤️")
+
+        self.assertEqual("❤️", storage.get_user_confirm_code(1, 1))
+        storage_mock.set_user_confirm_code.assert_called_once_with(1, 1, "❤️")
+        storage_mock.get_user_confirm_code.assert_called_once()
+
+    def test_set_user_confirmed_invalidates(self):
+        storage_mock = Mock(
+            **{
+                "is_user_confirmed.return_value": False,
+                "get_user_confirm_code.return_value": "❤️",
+            }
+        )
+        storage = CachedStorage(storage_mock)
+
+        self.assertFalse(storage.is_user_confirmed(1, 1))
+        self.assertEqual("❤️", storage.get_user_confirm_code(1, 1))
+
+        storage.set_user_confirmed(1, 1)
+
+        self.assertTrue(storage.is_user_confirmed(1, 1))
+        self.assertIsNone(storage.get_user_confirm_code(1, 1))
+        storage_mock.set_user_confirmed.assert_called_once_with(1, 1)
+        storage_mock.is_user_confirmed.assert_called_once()
+
+    def test_get_users_state_loads_only_missed_users(self):
+        storage_mock = Mock(
+            **{
+                "is_user_confirmed.return_value": True,
+                "get_users_state.return_value": {2: UserState(False, "❤️")},
+            }
+        )
+        storage = CachedStorage(storage_mock)
+        storage.is_user_confirmed(1, 1)
+
+        states = storage.get_users_state(1, [1, 2])
+
+        self.assertEqual({1: UserState(True, None), 2: UserState(False, "❤️")}, states)
+        storage_mock.get_users_state.assert_called_once_with(1, [2])
+        self.assertEqual(UserState(False, "❤️"), storage.get_user_state(1, 2))
+        storage_mock.get_users_state.assert_called_once()
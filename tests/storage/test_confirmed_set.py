@@ -0,0 +1,49 @@
+import tempfile
+import unittest
+from unittest.mock import Mock
+
+from storage import ConfirmedSetStorage, FileSystem, UserState
+
+
+class TestConfirmedSetStorage(unittest.TestCase):
+    def test_group_loaded_lazily_once(self):
+        storage_mock = Mock(**{"get_confirmed_users.return_value": [1, 2]})
+        storage = ConfirmedSetStorage(storage_mock)
+        storage_mock.get_confirmed_users.assert_not_called()
+
+        self.assertTrue(storage.is_user_confirmed(100, 1))
+        self.assertFalse(storage.is_user_confirmed(100, 3))
+
+        storage_mock.get_confirmed_users.assert_called_once_with(100)
+        storage_mock.is_user_confirmed.assert_not_called()
+
+    def test_set_user_confirmed(self):
+        fs = FileSystem(tempfile.mkdtemp(), (100,))
+        fs.set_user_confirmed(100, 1)
+        metrics_mock = Mock()
+        storage = ConfirmedSetStorage(fs, metrics_mock)
+
+        self.assertFalse(storage.is_user_confirmed(100, 2))
+        storage.set_user_confirmed(100, 2)
+
+        self.assertTrue(storage.is_user_confirmed(100, 2))
+        self.assertTrue(fs.is_user_confirmed(100, 2))
+        self.assertEqual([1, 2], storage.get_confirmed_users(100))
+        groups, users, memory_usage = metrics_mock.set_confirmed_sets_size.call_args.args
+        self.assertEqual((1, 2), (groups, users))
+        self.assertEqual(storage.memory_usage(), memory_usage)
+
+    def test_get_users_state_reads_only_unconfirmed(self):
+        storage_mock = Mock(
+            **{
+                "get_confirmed_users.return_value": [1],
+                "get_users_state.return_value": {2: UserState(False, "❤️")},
+            }
+        )
+        storage = ConfirmedSetStorage(storage_mock)
+
+        self.assertEqual(
+            {1: UserState(True, None), 2: UserState(False, "❤️")},
+            storage.get_users_state(100, [1, 2]),
+        )
+        storage_mock.get_users_state.assert_called_once_with(100, [2])
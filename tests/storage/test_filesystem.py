@@ -3,8 +3,9 @@ import os
 import tempfile
 import unittest
 from contextlib import contextmanager
+from unittest.mock import patch
 
-from storage import FileSystem
+from storage import FileSystem, KickDeadline, UserState
 
 
 @contextmanager
@@ -99,6 +100,37 @@ class TestFileSystem(unittest.TestCase):
 
             self.assertEqual("❤️", fs.get_user_confirm_code(1, 1))
 
+    def test_get_users_state(self):
+        with create_file_system(("1",)) as fs:
+            fs.set_user_confirmed(1, 1)
+            fs.set_user_confirm_code(1, 2, "❤️")
+
+            self.assertEqual(
+                {
+                    1: UserState(True, None),
+                    2: UserState(False, "❤️"),
+                    3: UserState(False, None),
+                },
+                fs.get_users_state(1, [1, 2, 3]),
+            )
+            self.assertEqual(UserState(False, "❤️"), fs.get_user_state(1, 2))
+
+    def test_get_confirmed_users(self):
+        with create_file_system(("1",)) as fs:
+            fs.set_user_confirmed(1, 1)
+            fs.set_user_confirmed(1, 2)
+            fs.set_user_confirm_code(1, 3, "❤️")
+
+            self.assertEqual([1, 2], sorted(fs.get_confirmed_users(1)))
+            self.assertEqual([], fs.get_confirmed_users(2))
+
+    def test_set_users_confirm_code(self):
+        with create_file_system(("1",)) as fs:
+            fs.set_users_confirm_code(1, {1: "❤️", 2: "🐶"})
+
+            self.assertEqual("❤️", fs.get_user_confirm_code(1, 1))
+            self.assertEqual("🐶", fs.get_user_confirm_code(1, 2))
+
     def test_on_added_to_group_first_time(self):
         with create_file_system() as fs:
             fs.on_added_to_group(2)
@@ -138,3 +170,37 @@ class TestFileSystem(unittest.TestCase):
                 groups = [int(x) for x in f.readlines()]
                 self.assertIn(1, groups)
                 self.assertIn(2, groups)
+
+    def test_on_added_to_group_known_group_does_not_touch_filesystem(self):
+        with create_file_system(("1",), write_groups_file=False) as fs:
+            with patch("os.makedirs") as makedirs_mock, patch("builtins.open") as open_mock:
+                fs.on_added_to_group(1)
+
+                makedirs_mock.assert_not_called()
+                open_mock.assert_not_called()
+
+    def test_compact_groups_list(self):
+        with create_file_system() as fs:
+            fs.on_added_to_group(1)
+            fs.on_added_to_group(2)
+            with open(os.path.sep.join([fs.storage_dir, "groups.txt"]), "a") as f:
+                f.write("\n1\n3")
+
+            fs.compact_groups_list()
+
+            with open(os.path.sep.join([fs.storage_dir, "groups.txt"]), "r") as f:
+                lines = f.readlines()
+                self.assertEqual([1, 2, 3], sorted(int(x) for x in lines))
+
+    def test_kick_deadlines(self):
+        with create_file_system() as fs:
+            fs.on_added_to_group(-100)
+            fs.add_kick_deadlines(
+                [KickDeadline(-100, 1, 1000.5, 7), KickDeadline(-100, 2, 2000.0, 8)]
+            )
+            fs.remove_kick_deadline(-100, 2)
+            fs.remove_kick_deadline(-100, 3)
+
+            self.assertEqual(
+                [KickDeadline(-100, 1, 1000.5, 7)], list(fs.get_kick_deadlines())
+            )
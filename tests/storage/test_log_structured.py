@@ -0,0 +1,163 @@
+import os
+import tempfile
+import time
+import unittest
+from contextlib import contextmanager
+
+from storage import KickDeadline, UserState
+from storage_backends.log_structured import (
+    RECORD_CONFIRM_CODE,
+    LogStructured,
+    make_key,
+    pack_record,
+    split_key,
+)
+
+
+@contextmanager
+def create_log_structured(path=None, **kwargs):
+    storage = LogStructured(
+        path or tempfile.mkdtemp(), shards=4, compact_interval=0, **kwargs
+    )
+
+    yield storage
+
+    storage.close()
+
+
+class TestLogStructured(unittest.TestCase):
+    def test_make_key(self):
+        for group_id, user_id in ((1, 1), (-1001234567890, 7000000000), (0, 0)):
+            self.assertEqual((group_id, user_id), split_key(make_key(group_id, user_id)))
+
+    def test_confirm_flow(self):
+        with create_log_structured() as storage:
+            self.assertFalse(storage.is_user_confirmed(-100, 1))
+            self.assertIsNone(storage.get_user_confirm_code(-100, 1))
+
+            storage.set_user_confirm_code(-100, 1, "❤️")
+            self.assertEqual("❤️", storage.get_user_confirm_code(-100, 1))
+
+            storage.set_user_confirmed(-100, 1)
+            self.assertTrue(storage.is_user_confirmed(-100, 1))
+            self.assertIsNone(storage.get_user_confirm_code(-100, 1))
+
+    def test_set_users_confirm_code(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            storage.set_users_confirm_code(1, {1: "❤️", 2: "🐶"})
+            storage.set_user_confirmed(1, 2)
+
+        with create_log_structured(path) as storage:
+            self.assertEqual(
+                {1: UserState(False, "❤️"), 2: UserState(True, None)},
+                storage.get_users_state(1, [1, 2]),
+            )
+
+    def test_expire_confirm_codes(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            storage.set_user_confirm_code(1, 1, "❤️")
+            storage.set_user_confirm_code(2, 2, "🐶")
+            storage.set_user_confirm_code(1, 3, "🙈")
+            time.sleep(0.01)
+            older_than = time.time()
+            time.sleep(0.01)
+            storage.set_user_confirm_code(1, 1, "💋")
+
+            self.assertEqual([(2, 2)], storage.expire_confirm_codes(older_than, 1))
+            self.assertEqual([(1, 3)], storage.expire_confirm_codes(older_than, 10))
+            self.assertEqual(1, storage.count_pending_confirm_codes())
+
+        with create_log_structured(path) as storage:
+            self.assertIsNone(storage.get_user_confirm_code(2, 2))
+            self.assertIsNone(storage.get_user_confirm_code(1, 3))
+            self.assertEqual("💋", storage.get_user_confirm_code(1, 1))
+
+    def test_codes_of_all_shards_expired_by_age(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            storage._append(
+                storage._shard(1),
+                pack_record(RECORD_CONFIRM_CODE, 1, 1, "❤️", time.time()),
+            )
+            storage._append(
+                storage._shard(2), pack_record(RECORD_CONFIRM_CODE, 2, 2, "🐶", 1.0)
+            )
+            storage._append(
+                storage._shard(3), pack_record(RECORD_CONFIRM_CODE, 3, 3, "💋", 0.5)
+            )
+
+        with create_log_structured(path) as storage:
+            self.assertEqual(
+                [(3, 3), (2, 2)], storage.expire_confirm_codes(time.time() - 60, 10)
+            )
+            self.assertEqual("❤️", storage.get_user_confirm_code(1, 1))
+
+    def test_index_rebuilt_on_startup(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            storage.on_added_to_group(-100)
+            storage.set_user_confirmed(-100, 1)
+            storage.set_user_confirm_code(-100, 2, "🐶")
+
+        with create_log_structured(path) as storage:
+            self.assertIn(-100, storage._groups)
+            self.assertTrue(storage.is_user_confirmed(-100, 1))
+            self.assertEqual("🐶", storage.get_user_confirm_code(-100, 2))
+
+    def test_torn_record_truncated(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            storage.set_user_confirmed(1, 1)
+            segment = storage._segment_path(storage._shard(1))
+            size = os.path.getsize(segment)
+        with open(segment, "ab") as f:
+            f.write(b"\x01\x02\x03")
+
+        with create_log_structured(path) as storage:
+            self.assertTrue(storage.is_user_confirmed(1, 1))
+            self.assertEqual(size, os.path.getsize(segment))
+
+    def test_compact_drops_superseded_records(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            shard = storage._shard(1)
+            for code in ("❤️", "🙈", "💋"):
+                storage.set_user_confirm_code(1, 1, code)
+            storage.set_user_confirm_code(1, 2, "🐶")
+            storage.set_user_confirmed(1, 2)
+            self.assertEqual(3, storage.garbage(shard))
+
+            storage.compact(shard)
+            self.assertEqual(0, storage.garbage(shard))
+            storage.set_user_confirm_code(1, 3, "😡")
+
+        with create_log_structured(path) as storage:
+            self.assertEqual("💋", storage.get_user_confirm_code(1, 1))
+            self.assertTrue(storage.is_user_confirmed(1, 2))
+            self.assertEqual([2], storage.get_confirmed_users(1))
+            self.assertEqual("😡", storage.get_user_confirm_code(1, 3))
+            self.assertEqual(3, storage._records[storage._shard(1)])
+
+    def test_kick_deadlines_survive_restart_and_compaction(self):
+        path = tempfile.mkdtemp()
+        with create_log_structured(path) as storage:
+            storage.add_kick_deadlines(
+                [KickDeadline(-100, 1, 1000.5, 7), KickDeadline(-100, 2, 2000.0, 8)]
+            )
+            storage.remove_kick_deadline(-100, 2)
+            shard = storage._shard(-100)
+            self.assertEqual(2, storage.garbage(shard))
+
+        with create_log_structured(path) as storage:
+            self.assertEqual(
+                [KickDeadline(-100, 1, 1000.5, 7)], storage.get_kick_deadlines()
+            )
+            storage.compact(shard)
+
+        with create_log_structured(path) as storage:
+            self.assertEqual(
+                [KickDeadline(-100, 1, 1000.5, 7)], storage.get_kick_deadlines()
+            )
+            self.assertEqual(1, storage._records[shard])
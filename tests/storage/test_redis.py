@@ -0,0 +1,121 @@
+import os
+import time
+import unittest
+import uuid
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import redis
+
+from storage import KickDeadline, UserState
+from storage_backends.redis import RedisStorage
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@contextmanager
+def create_redis(**kwargs):
+    # Real server is used when REDIS_URL is set, in-process fake otherwise
+    if os.getenv("REDIS_URL"):
+        client = redis.Redis.from_url(os.getenv("REDIS_URL"))
+    else:
+        client = fakeredis.FakeRedis()
+    prefix = f"test-{uuid.uuid4().hex}"
+    storage = RedisStorage(client, prefix=prefix, **kwargs)
+
+    yield storage
+
+    for key in client.scan_iter(match=f"{prefix}:*"):
+        client.delete(key)
+    storage.close()
+
+
+@unittest.skipIf(
+    fakeredis is None and not os.getenv("REDIS_URL"),
+    "Neither fakeredis nor REDIS_URL available",
+)
+class TestRedisStorage(unittest.TestCase):
+    def test_confirm_flow(self):
+        with create_redis() as storage:
+            self.assertEqual(UserState(False, None), storage.get_user_state(1, 1))
+
+            storage.set_user_confirm_code(1, 1, "❤️")
+            self.assertEqual(UserState(False, "❤️"), storage.get_user_state(1, 1))
+            self.assertEqual("❤️", storage.get_user_confirm_code(1, 1))
+
+            storage.set_user_confirmed(1, 1)
+            self.assertTrue(storage.is_user_confirmed(1, 1))
+            self.assertIsNone(storage.get_user_confirm_code(1, 1))
+            self.assertEqual(UserState(True, None), storage.get_user_state(1, 1))
+            self.assertFalse(storage.is_user_confirmed(2, 1))
+
+    def test_confirm_code_has_ttl(self):
+        with create_redis(confirm_code_ttl=300) as storage:
+            storage.set_user_confirm_code(1, 1, "❤️")
+            storage.set_users_confirm_code(1, {2: "🐶"})
+
+            for user_id in (1, 2):
+                ttl = storage.client.ttl(storage._code_key(1, user_id))
+                self.assertTrue(0 < ttl <= 300)
+            self.assertEqual(2, storage.count_pending_confirm_codes())
+            self.assertEqual([], storage.expire_confirm_codes(float("inf"), 100))
+
+    def test_pending_confirm_codes_counted(self):
+        with create_redis(confirm_code_ttl=300) as storage:
+            storage.set_users_confirm_code(1, {1: "❤️", 2: "🐶", 3: "💋"})
+            storage.set_user_confirm_code(2, 1, "❤️")
+            storage.set_user_confirm_code(2, 1, "🐶")
+            storage.set_user_confirmed(1, 1)
+            storage.set_users_confirm_code(1, {})
+
+            self.assertEqual(3, storage.count_pending_confirm_codes())
+            with patch("storage_backends.redis.time.time", return_value=time.time() + 301):
+                self.assertEqual(0, storage.count_pending_confirm_codes())
+            self.assertEqual(0, storage.client.zcard(storage._codes_key()))
+
+    def test_get_users_state(self):
+        with create_redis() as storage:
+            storage.set_user_confirmed(1, 1)
+            storage.set_users_confirm_code(1, {2: "❤️", 3: "🐶"})
+
+            self.assertEqual(
+                {
+                    1: UserState(True, None),
+                    2: UserState(False, "❤️"),
+                    3: UserState(False, "🐶"),
+                    4: UserState(False, None),
+                },
+                storage.get_users_state(1, [1, 2, 3, 4]),
+            )
+            self.assertEqual({}, storage.get_users_state(1, []))
+
+    def test_get_confirmed_users(self):
+        with create_redis() as storage:
+            storage.set_user_confirmed(1, 1)
+            storage.set_user_confirmed(1, 2)
+            storage.set_user_confirmed(2, 3)
+
+            self.assertEqual([1, 2], sorted(storage.get_confirmed_users(1)))
+
+    def test_on_added_to_group(self):
+        with create_redis() as storage:
+            storage.on_added_to_group(-100)
+            storage.on_added_to_group(-100)
+
+            self.assertEqual(
+                {b"-100"}, storage.client.smembers(f"{storage.prefix}:groups")
+            )
+
+    def test_kick_deadlines(self):
+        with create_redis() as storage:
+            storage.add_kick_deadlines(
+                [KickDeadline(-100, 1, 1000.5, 7), KickDeadline(-100, 2, 2000.0, 8)]
+            )
+            storage.remove_kick_deadline(-100, 2)
+
+            self.assertEqual(
+                [KickDeadline(-100, 1, 1000.5, 7)], storage.get_kick_deadlines()
+            )
@@ -0,0 +1,147 @@
+import os
+import tempfile
+import time
+import unittest
+from contextlib import contextmanager
+
+from storage import FileSystem, KickDeadline, UserState
+from storage_backends.migrate import migrate_to_sqlite
+from storage_backends.sqlite import SQLite
+
+
+@contextmanager
+def create_sqlite():
+    sdir = tempfile.mkdtemp()
+    storage = SQLite(os.path.join(sdir, "bot.sqlite3"))
+
+    yield storage
+
+    storage.close()
+
+
+class TestSQLite(unittest.TestCase):
+    def test_wal_mode_enabled(self):
+        with create_sqlite() as storage:
+            mode = storage._conn.execute("PRAGMA journal_mode").fetchone()[0]
+            self.assertEqual("wal", mode)
+
+    def test_is_user_confirmed(self):
+        with create_sqlite() as storage:
+            self.assertFalse(storage.is_user_confirmed(1, 1))
+
+            storage.set_user_confirmed(1, 1)
+
+            self.assertTrue(storage.is_user_confirmed(1, 1))
+            self.assertFalse(storage.is_user_confirmed(2, 1))
+
+    def test_confirm_code(self):
+        with create_sqlite() as storage:
+            self.assertIsNone(storage.get_user_confirm_code(1, 1))
+
+            storage.set_user_confirm_code(1, 1, "❤️")
+            self.assertEqual("❤️", storage.get_user_confirm_code(1, 1))
+            self.assertFalse(storage.is_user_confirmed(1, 1))
+
+            storage.set_user_confirm_code(1, 1, "🐶")
+            self.assertEqual("🐶", storage.get_user_confirm_code(1, 1))
+
+    def test_set_user_confirmed_removes_confirm_code(self):
+        with create_sqlite() as storage:
+            storage.set_user_confirm_code(1, 1, "❤️")
+            storage.set_user_confirmed(1, 1)
+
+            self.assertIsNone(storage.get_user_confirm_code(1, 1))
+
+    def test_get_users_state(self):
+        with create_sqlite() as storage:
+            storage.max_batch_size = 2
+            storage.set_users_confirm_code(1, {1: "❤️", 2: "🐶", 3: "🙈"})
+            storage.set_user_confirmed(1, 3)
+
+            self.assertEqual(
+                {
+                    1: UserState(False, "❤️"),
+                    2: UserState(False, "🐶"),
+                    3: UserState(True, None),
+                    4: UserState(False, None),
+                },
+                storage.get_users_state(1, [1, 2, 3, 4]),
+            )
+            self.assertEqual(UserState(True, None), storage.get_user_state(1, 3))
+            self.assertEqual(UserState(False, None), storage.get_user_state(2, 1))
+
+    def test_get_confirmed_users(self):
+        with create_sqlite() as storage:
+            storage.set_user_confirmed(1, 1)
+            storage.set_user_confirmed(1, 2)
+            storage.set_user_confirm_code(1, 3, "❤️")
+            storage.set_user_confirmed(2, 4)
+
+            self.assertEqual([1, 2], sorted(storage.get_confirmed_users(1)))
+
+    def test_expire_confirm_codes(self):
+        with create_sqlite() as storage:
+            storage.set_users_confirm_code(1, {1: "❤️", 2: "🐶"})
+            storage.set_user_confirm_code(1, 3, "🙈")
+            storage._conn.execute(
+                "UPDATE users SET confirm_code_at = 0 WHERE user_id IN (1, 2)"
+            )
+            self.assertEqual(3, storage.count_pending_confirm_codes())
+
+            self.assertEqual([(1, 1)], storage.expire_confirm_codes(time.time() - 60, 1))
+            self.assertEqual([(1, 2)], storage.expire_confirm_codes(time.time() - 60, 10))
+
+            self.assertEqual(1, storage.count_pending_confirm_codes())
+            self.assertEqual(UserState(False, None), storage.get_user_state(1, 1))
+            self.assertEqual("🙈", storage.get_user_confirm_code(1, 3))
+
+    def test_on_added_to_group(self):
+        with create_sqlite() as storage:
+            storage.on_added_to_group(1)
+            storage.on_added_to_group(1)
+
+            rows = storage._conn.execute("SELECT group_id FROM groups").fetchall()
+            self.assertEqual([(1,)], rows)
+
+    def test_known_groups_loaded(self):
+        with create_sqlite() as storage:
+            storage.on_added_to_group(1)
+            reopened = SQLite(storage.path)
+
+            self.assertIn(1, reopened._groups)
+            reopened.close()
+
+
+class TestMigrate(unittest.TestCase):
+    def test_migrate_filesystem_tree(self):
+        sdir = tempfile.mkdtemp()
+        fs = FileSystem(sdir)
+        fs.on_added_to_group(1)
+        fs.on_added_to_group(-100)
+        fs.set_user_confirmed(1, 10)
+        fs.set_user_confirm_code(1, 11, "❤️")
+        fs.set_user_confirm_code(-100, 12, "🐶")
+        fs.add_kick_deadlines([KickDeadline(-100, 12, 1000.5, 7)])
+
+        db_path = os.path.join(tempfile.mkdtemp(), "bot.sqlite3")
+        self.assertEqual(3, migrate_to_sqlite(sdir, db_path, batch_size=2))
+
+        storage = SQLite(db_path)
+        self.assertTrue(storage.is_user_confirmed(1, 10))
+        self.assertEqual("❤️", storage.get_user_confirm_code(1, 11))
+        self.assertEqual("🐶", storage.get_user_confirm_code(-100, 12))
+        self.assertFalse(storage.is_user_confirmed(-100, 12))
+        self.assertEqual([KickDeadline(-100, 12, 1000.5, 7)], storage.get_kick_deadlines())
+        storage.close()
+
+    def test_kick_deadlines(self):
+        with create_sqlite() as storage:
+            storage.add_kick_deadlines(
+                [KickDeadline(-100, 1, 1000.5, 7), KickDeadline(-100, 2, 2000.0, 8)]
+            )
+            storage.add_kick_deadlines([KickDeadline(-100, 1, 1500.0, 9)])
+            storage.remove_kick_deadline(-100, 2)
+
+            self.assertEqual(
+                [KickDeadline(-100, 1, 1500.0, 9)], list(storage.get_kick_deadlines())
+            )
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import Mock
+
+from storage import CachedStorage, ConfirmCodeSweeper, FileSystem
+
+
+class TestConfirmCodeSweeper(unittest.TestCase):
+    def test_sweep_removes_expired_codes_by_batches(self):
+        fs = FileSystem(tempfile.mkdtemp(), (1, 2))
+        old = time.time() - 1000
+        for group_id, user_id in ((1, 1), (1, 2), (2, 3)):
+            fs.set_user_confirm_code(group_id, user_id, "❤️")
+            os.utime(
+                os.path.join(fs.storage_dir, str(group_id), "confirm_codes", str(user_id)),
+                (old, old),
+            )
+        fs.set_user_confirm_code(2, 4, "🐶")
+        metrics_mock = Mock()
+
+        sweeper = ConfirmCodeSweeper(fs, ttl=100, batch_size=2, metrics=metrics_mock)
+
+        self.assertEqual(3, sweeper.sweep())
+        self.assertIsNone(fs.get_user_confirm_code(1, 1))
+        self.assertIsNone(fs.get_user_confirm_code(2, 3))
+        self.assertEqual("🐶", fs.get_user_confirm_code(2, 4))
+        self.assertEqual(
+            3,
+            sum(x.args[0] for x in metrics_mock.inc_confirm_codes_swept_total.call_args_list),
+        )
+        metrics_mock.set_pending_confirm_codes.assert_called_once_with(1)
+
+    def test_cache_invalidated_on_expire(self):
+        storage_mock = Mock(
+            **{
+                "get_user_confirm_code.return_value": "❤️",
+                "expire_confirm_codes.return_value": [(1, 1)],
+            }
+        )
+        storage = CachedStorage(storage_mock)
+        storage.get_user_confirm_code(1, 1)
+
+        self.assertEqual([(1, 1)], storage.expire_confirm_codes(time.time(), 10))
+        storage.get_user_confirm_code(1, 1)
+
+        self.assertEqual(2, storage_mock.get_user_confirm_code.call_count)
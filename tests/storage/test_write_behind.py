@@ -0,0 +1,72 @@
+import tempfile
+import unittest
+from contextlib import contextmanager
+from threading import Event
+from unittest.mock import Mock
+
+from storage import FileSystem, UserState, WriteBehindStorage
+
+
+@contextmanager
+def create_write_behind(storage, **kwargs):
+    write_behind = WriteBehindStorage(storage, **kwargs)
+
+    yield write_behind
+
+    write_behind.close()
+
+
+class TestWriteBehindStorage(unittest.TestCase):
+    def test_reads_see_pending_writes(self):
+        written = Event()
+        storage_mock = Mock(
+            **{
+                "is_user_confirmed.return_value": False,
+                "set_users_confirm_code.side_effect": lambda *_: written.wait(),
+            }
+        )
+        with create_write_behind(storage_mock, commit_delay=0) as storage:
+            storage.set_user_confirm_code(1, 1, "❤️")
+            storage.set_user_confirmed(1, 2)
+
+            self.assertEqual("❤️", storage.get_user_confirm_code(1, 1))
+            self.assertTrue(storage.is_user_confirmed(1, 2))
+            self.assertEqual(UserState(True, None), storage.get_user_state(1, 2))
+            written.set()
+
+    def test_writes_coalesced_into_batch(self):
+        storage_mock = Mock()
+        with create_write_behind(storage_mock, commit_delay=1) as storage:
+            storage.set_user_confirm_code(1, 1, "❤️")
+            storage.set_user_confirm_code(1, 1, "🐶")
+            storage.set_user_confirm_code(1, 2, "🙈")
+            storage.set_user_confirm_code(1, 3, "💋")
+            storage.set_user_confirmed(1, 3)
+            storage.set_user_confirm_code(1, 3, "😡")
+
+        storage_mock.set_users_confirm_code.assert_called_once_with(
+            1, {1: "🐶", 2: "🙈"}
+        )
+        storage_mock.set_user_confirmed.assert_called_once_with(1, 3)
+        storage_mock.close.assert_called_once()
+
+    def test_flush_writes_to_storage(self):
+        fs = FileSystem(tempfile.mkdtemp(), (1,))
+        with create_write_behind(fs) as storage:
+            storage.set_users_confirm_code(1, {1: "❤️", 2: "🐶"})
+            storage.set_user_confirmed(1, 2)
+
+            self.assertTrue(storage.flush(timeout=5))
+            self.assertEqual("❤️", fs.get_user_confirm_code(1, 1))
+            self.assertTrue(fs.is_user_confirmed(1, 2))
+
+    def test_failed_batch_retried(self):
+        storage_mock = Mock(
+            **{"set_user_confirmed.side_effect": [OSError("disk full"), None]}
+        )
+        with create_write_behind(storage_mock, commit_delay=0.01) as storage:
+            storage.set_user_confirmed(1, 1)
+
+            self.assertTrue(storage.flush(timeout=5))
+
+        self.assertEqual(2, storage_mock.set_user_confirmed.call_count)
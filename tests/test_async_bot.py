@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, Mock
+
+from telebot.asyncio_helper import ApiTelegramException
+
+from async_bot import AsyncEngine
+from entities.rate_limiter import RateLimiter
+from entities.retry import Backoff
+from plugins import PLUGIN_NEW_CHAT_MESSAGE
+from storage import UserState
+
+
+def create_bot(**kwargs):
+    telebot_mock = Mock()
+    storage_mock = AsyncMock()
+    kwargs.setdefault("rate_limiter", RateLimiter(global_rate=1000, group_rate=1000))
+    kwargs.setdefault("backoff", Backoff(base=0.01))
+    bot = AsyncEngine("test_bot", telebot_mock, Mock(), storage_mock, Mock(), **kwargs)
+    return bot, telebot_mock, storage_mock
+
+
+def create_plugin(result):
+    return Mock(plugin_type=PLUGIN_NEW_CHAT_MESSAGE, execute=AsyncMock(return_value=result))
+
+
+class TestAsyncBot(unittest.IsolatedAsyncioTestCase):
+    async def test_methods(self):
+        bot, telebot_mock, storage_mock = create_bot()
+        telebot_mock.send_message = AsyncMock(return_value="sent")
+        telebot_mock.ban_chat_member = AsyncMock()
+        telebot_mock.kick_chat_member = AsyncMock()
+        telebot_mock.delete_message = AsyncMock()
+        telebot_mock.close_session = AsyncMock()
+
+        self.assertEqual("sent", await bot.send_message(chat_id=1, text="a"))
+        bot.ban_user(1, 1)
+        bot.kick_chat_member(1, 1)
+        bot.delete_message(1, 1)
+        await bot.stop()
+
+        telebot_mock.send_message.assert_awaited_once_with(chat_id=1, text="a")
+        telebot_mock.ban_chat_member.assert_awaited_once_with(chat_id=1, user_id=1)
+        telebot_mock.kick_chat_member.assert_awaited_once_with(chat_id=1, user_id=1)
+        telebot_mock.delete_message.assert_awaited_once_with(chat_id=1, message_id=1)
+        storage_mock.close.assert_awaited_once()
+        telebot_mock.close_session.assert_awaited_once()
+
+    async def test_calls_of_one_chat_keep_order(self):
+        bot, telebot_mock, _ = create_bot()
+        calls = []
+
+        async def send_message(**kwargs):
+            await asyncio.sleep(0.05)
+            calls.append("send")
+
+        async def kick_chat_member(**kwargs):
+            calls.append("kick")
+
+        telebot_mock.send_message = send_message
+        telebot_mock.kick_chat_member = kick_chat_member
+
+        await asyncio.gather(
+            bot.send_message(chat_id=1, text="captha"), bot.kick_chat_member(1, 2)
+        )
+
+        self.assertEqual(["send", "kick"], calls)
+
+    async def test_other_chats_are_not_blocked(self):
+        bot, telebot_mock, _ = create_bot()
+        release = asyncio.Event()
+
+        async def send_message(**kwargs):
+            await release.wait()
+
+        telebot_mock.send_message = send_message
+        telebot_mock.delete_message = AsyncMock()
+
+        sent = bot.send_message(chat_id=1, text="slow")
+        await asyncio.wait_for(bot.delete_message(2, 1), 5)
+
+        self.assertFalse(sent.done())
+        release.set()
+        await sent
+
+    async def test_too_many_requests_retried(self):
+        bot, telebot_mock, _ = create_bot()
+        error = ApiTelegramException(
+            "sendMessage",
+            None,
+            {"error_code": 429, "description": "", "parameters": {"retry_after": 0.01}},
+        )
+        telebot_mock.send_message = AsyncMock(side_effect=[error, "sent"])
+
+        self.assertEqual("sent", await bot.send_message(chat_id=1, text="a"))
+        self.assertEqual(2, telebot_mock.send_message.await_count)
+
+    async def test_bad_request_is_not_retried(self):
+        dead_letter = Mock()
+        bot, telebot_mock, _ = create_bot(dead_letter=dead_letter)
+        error = ApiTelegramException(
+            "sendMessage", None, {"error_code": 400, "description": "Bad Request"}
+        )
+        telebot_mock.send_message = AsyncMock(side_effect=error)
+
+        with self.assertRaises(ApiTelegramException):
+            await bot.send_message(chat_id=1, text="a")
+
+        telebot_mock.send_message.assert_awaited_once()
+        dead_letter.put.assert_not_called()
+
+    async def test_failed_task_dead_lettered(self):
+        dead_letter = Mock()
+        bot, telebot_mock, _ = create_bot(dead_letter=dead_letter)
+        telebot_mock.send_message = AsyncMock(side_effect=ConnectionError("down"))
+
+        with self.assertRaises(ConnectionError):
+            await bot.send_message(chat_id=1, text="a")
+
+        self.assertEqual(3, telebot_mock.send_message.await_count)
+        dead_letter.put.assert_called_once()
+
+    async def test_plugins_short_circuit(self):
+        bot, _, storage_mock = create_bot()
+        first, second = create_plugin(True), create_plugin(None)
+        bot.add_plugin(first)
+        bot.add_plugin(second)
+
+        await bot.on_chat_message(Mock(chat=Mock(id=1), from_user=Mock(id=2)))
+
+        first.execute.assert_awaited_once()
+        second.execute.assert_not_called()
+        storage_mock.get_user_state.assert_not_called()
+
+    async def test_message_of_unconfirmed_user_deleted(self):
+        bot, telebot_mock, storage_mock = create_bot()
+        telebot_mock.delete_message = AsyncMock()
+        storage_mock.get_user_state.return_value = UserState(False, "❤️")
+        failing = create_plugin(None)
+        failing.execute.side_effect = ValueError("broken")
+        bot.add_plugin(failing)
+
+        await bot.on_chat_message(Mock(chat=Mock(id=1), from_user=Mock(id=2), id=3))
+        await asyncio.gather(*bot._tasks)
+
+        telebot_mock.delete_message.assert_awaited_once_with(chat_id=1, message_id=3)
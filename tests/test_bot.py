@@ -1,17 +1,28 @@
+import os
+import tempfile
+import time
 import unittest
 from contextlib import contextmanager
-from unittest.mock import Mock
+from threading import Event
+from unittest.mock import MagicMock, Mock, patch
+
+from telebot.apihelper import ApiTelegramException
 
 from bot import Engine
+from entities.journal import TaskJournal
+from entities.rate_limiter import RateLimiter
+from entities.retry import Backoff
+from storage import UserState
 
 
 @contextmanager
-def create_bot():
+def create_bot(**kwargs):
     telebot_mock = Mock()
     storage_mock = Mock()
     logger = Mock()
     metrics = Mock()
-    bot = Engine("test_bot", telebot_mock, metrics, storage_mock, logger)
+    kwargs.setdefault("delete_batch_window", 0.05)
+    bot = Engine("test_bot", telebot_mock, metrics, storage_mock, logger, **kwargs)
 
     yield bot, telebot_mock, storage_mock
 
@@ -25,6 +36,27 @@ class TestBot(unittest.TestCase):
             telebot_mock.infinity_polling.assert_called_once()
             telebot_mock.stop_bot.assert_called_once()
 
+    def test_updates_stopped_before_storage_closed(self):
+        with create_bot() as (bot, telebot_mock, storage_mock):
+            calls = []
+            telebot_mock.stop_bot.side_effect = lambda: calls.append("stop_bot")
+            storage_mock.close.side_effect = lambda: calls.append("close_storage")
+            bot.start()
+            bot.stop()
+
+            self.assertEqual(["stop_bot", "close_storage"], calls)
+
+    def test_start_and_stop_webhook(self):
+        webhook = Mock()
+        with create_bot(webhook=webhook) as (bot, telebot_mock, _):
+            bot.start()
+            bot.stop()
+
+            webhook.start.assert_called_once()
+            webhook.wait.assert_called_once()
+            webhook.stop.assert_called_once()
+            telebot_mock.infinity_polling.assert_not_called()
+
     def test_methods(self):
         with create_bot() as (bot, telebot_mock, _):
             bot.start()
@@ -40,3 +72,324 @@ class TestBot(unittest.TestCase):
             telebot_mock.delete_message.assert_called_once_with(chat_id=1, message_id=1)
             telebot_mock.kick_chat_member.assert_called_once_with(chat_id=1, user_id=1)
             telebot_mock.send_message.assert_called_once_with(**{"a": "b"})
+
+    def test_moderation_executed_before_sends(self):
+        with create_bot(reply_workers=2, delete_batch_window=0) as (bot, telebot_mock, _):
+            calls = []
+            telebot_mock.send_message.side_effect = lambda **kw: calls.append(kw["text"])
+            telebot_mock.delete_message.side_effect = lambda **kw: calls.append("delete")
+            telebot_mock.kick_chat_member.side_effect = lambda **kw: calls.append("kick")
+
+            # Tasks are queued before workers are started
+            bot.send_message(chat_id=1, text="first")
+            bot.send_message(chat_id=1, text="second")
+            bot.delete_message(1, 5)
+            bot.kick_chat_member(1, 2)
+            bot.start()
+            bot.stop()
+
+            self.assertEqual(["kick", "delete", "first", "second"], calls)
+
+    def test_other_chats_are_not_blocked(self):
+        with create_bot(reply_workers=2) as (bot, telebot_mock, _):
+            release = Event()
+            deleted = Event()
+            telebot_mock.send_message.side_effect = lambda **kw: release.wait(5)
+            telebot_mock.delete_message.side_effect = lambda **kw: deleted.set()
+            bot.start()
+
+            bot.send_message(chat_id=1, text="slow")
+            bot.delete_message(2, 1)
+
+            self.assertTrue(deleted.wait(5))
+            release.set()
+            bot.stop()
+
+    def test_too_many_requests_retried(self):
+        limiter = RateLimiter()
+        with create_bot(rate_limiter=limiter) as (bot, telebot_mock, _):
+            telebot_mock.ban_chat_member.side_effect = [
+                ApiTelegramException(
+                    "banChatMember",
+                    None,
+                    {
+                        "error_code": 429,
+                        "description": "Too Many Requests: retry after 0.1",
+                        "parameters": {"retry_after": 0.1},
+                    },
+                ),
+                True,
+            ]
+            bot.start()
+
+            bot.ban_user(1, 2)
+
+            bot.stop()
+
+            self.assertEqual(2, telebot_mock.ban_chat_member.call_count)
+
+    def test_failed_task_retried_and_dead_lettered(self):
+        dead_letter = Mock()
+        backoff = Backoff(base=0.01)
+        with create_bot(backoff=backoff, dead_letter=dead_letter) as (bot, telebot_mock, _):
+            error = ConnectionError("network is down")
+            telebot_mock.kick_chat_member.side_effect = error
+            bot.start()
+
+            bot.kick_chat_member(1, 2)
+
+            bot.stop()
+
+            self.assertEqual(3, telebot_mock.kick_chat_member.call_count)
+            dead_letter.put.assert_called_once()
+            self.assertIs(error, dead_letter.put.call_args[0][1])
+
+    def test_retried_task_not_overtaken_in_chat(self):
+        backoff = Backoff(base=0.05)
+        with create_bot(backoff=backoff) as (bot, telebot_mock, _):
+            calls = []
+
+            def send_message(**kwargs):
+                if kwargs["text"] == "first" and "failed" not in calls:
+                    calls.append("failed")
+                    raise ConnectionError("network is down")
+                calls.append(kwargs["text"])
+
+            telebot_mock.send_message.side_effect = send_message
+            bot.start()
+
+            # Groups are not limited for a few messages
+            bot.send_message(chat_id=-1, text="first")
+            bot.send_message(chat_id=-1, text="second")
+            bot.send_message(chat_id=-2, text="other chat")
+            time.sleep(0.02)
+            bot.send_message(chat_id=-1, text="third")
+
+            bot.stop()
+
+            self.assertEqual(
+                ["failed", "first", "second", "third"],
+                [x for x in calls if x != "other chat"],
+            )
+            self.assertEqual(1, calls.count("other chat"))
+
+    def test_fresh_tasks_not_taken_when_too_many_deferred(self):
+        with create_bot(reply_workers=1, delete_batch_window=0) as (bot, telebot_mock, _):
+            calls = []
+
+            def ban_chat_member(**kwargs):
+                calls.append("ban")
+                if calls.count("ban") == 1:
+                    raise ApiTelegramException(
+                        "banChatMember",
+                        None,
+                        {
+                            "error_code": 429,
+                            "description": "Too Many Requests: retry after 0.2",
+                            "parameters": {"retry_after": 0.2},
+                        },
+                    )
+
+            telebot_mock.ban_chat_member.side_effect = ban_chat_member
+            telebot_mock.delete_message.side_effect = lambda **kw: calls.append("delete")
+            with patch("bot.MAX_DEFERRED_TASKS", 1):
+                bot.start()
+                bot.ban_user(-1, 2)
+                time.sleep(0.05)
+                bot.delete_message(-2, 5)
+                bot.stop()
+
+            self.assertEqual(["ban", "ban", "delete"], calls)
+
+    def test_bad_request_not_retried(self):
+        dead_letter = Mock()
+        with create_bot(dead_letter=dead_letter) as (bot, telebot_mock, _):
+            telebot_mock.delete_message.side_effect = ApiTelegramException(
+                "deleteMessage",
+                None,
+                {"error_code": 400, "description": "Bad Request: message not found"},
+            )
+            bot.start()
+
+            bot.delete_message(1, 2)
+
+            bot.stop()
+
+            telebot_mock.delete_message.assert_called_once()
+            dead_letter.put.assert_not_called()
+
+    def test_send_message_returns_future(self):
+        with create_bot() as (bot, telebot_mock, _):
+            telebot_mock.send_message.return_value = Mock(id=10)
+            bot.start()
+
+            sent = bot.send_message(chat_id=1, text="captha")
+
+            self.assertEqual(10, sent.result(timeout=5).id)
+            bot.stop()
+
+    def test_send_message_future_failed(self):
+        with create_bot() as (bot, telebot_mock, _):
+            error = ApiTelegramException(
+                "sendMessage", None, {"error_code": 403, "description": "Forbidden"}
+            )
+            telebot_mock.send_message.side_effect = error
+            bot.start()
+
+            sent = bot.send_message(chat_id=1, text="captha")
+
+            self.assertIs(error, sent.exception(timeout=5))
+            bot.stop()
+
+    def test_deletes_sent_in_batches(self):
+        with create_bot(delete_batch_window=0.05) as (bot, telebot_mock, _):
+            bot.start()
+
+            for message_id in range(150):
+                bot.delete_message(1, message_id)
+            bot.delete_message(2, 7)
+
+            bot.stop()
+
+            self.assertEqual(
+                [
+                    {"chat_id": 1, "message_ids": list(range(100))},
+                    {"chat_id": 1, "message_ids": list(range(100, 150))},
+                ],
+                [x.kwargs for x in telebot_mock.delete_messages.call_args_list],
+            )
+            telebot_mock.delete_message.assert_called_once_with(chat_id=2, message_id=7)
+
+    def test_failed_batch_deleted_one_by_one(self):
+        with create_bot(delete_batch_window=0.05) as (bot, telebot_mock, _):
+            telebot_mock.delete_messages.side_effect = ApiTelegramException(
+                "deleteMessages",
+                None,
+                {"error_code": 400, "description": "Bad Request: method not found"},
+            )
+            bot.start()
+
+            bot.delete_message(1, 1)
+            bot.delete_message(1, 2)
+
+            bot.stop()
+
+            telebot_mock.delete_messages.assert_called_once()
+            self.assertEqual(2, telebot_mock.delete_message.call_count)
+
+    def test_on_chat_message_deletes_message_of_unconfirmed_user(self):
+        with create_bot() as (bot, telebot_mock, storage_mock):
+            storage_mock.get_user_state.return_value = UserState(False, "❤️")
+            bot.start()
+
+            bot.on_chat_message(Mock(id=5, chat=Mock(id=1), from_user=Mock(id=2)))
+
+            bot.stop()
+
+            storage_mock.get_user_state.assert_called_once_with(1, 2)
+            telebot_mock.delete_message.assert_called_once_with(chat_id=1, message_id=5)
+
+    def test_on_chat_message_skips_users_added_before_bot(self):
+        with create_bot() as (bot, telebot_mock, storage_mock):
+            storage_mock.get_user_state.return_value = UserState(False, None)
+            bot.start()
+
+            bot.on_chat_message(Mock(id=5, chat=Mock(id=1), from_user=Mock(id=2)))
+
+            bot.stop()
+
+            telebot_mock.delete_message.assert_not_called()
+
+    def test_future_cancelled_during_call(self):
+        with create_bot(reply_workers=1) as (bot, telebot_mock, _):
+            future = bot.send_message(chat_id=1, text="captcha")
+            telebot_mock.send_message.side_effect = lambda **kw: future.cancel()
+            bot.start()
+            time.sleep(0.1)
+
+            # Worker is alive and serves the next task
+            telebot_mock.send_message.side_effect = None
+            sent = bot.send_message(chat_id=1, text="next")
+
+            self.assertIsNotNone(sent.result(timeout=5))
+            self.assertTrue(future.cancelled())
+            bot.stop()
+
+    def test_journal_errors_do_not_stop_worker(self):
+        journal = MagicMock(**{"pending.return_value": [], "ack.side_effect": OSError})
+        with create_bot(journal=journal, reply_workers=1) as (bot, telebot_mock, _):
+            bot.start()
+
+            bot.ban_user(1, 2)
+            bot.ban_user(1, 3)
+
+            bot.stop()
+
+            self.assertEqual(2, telebot_mock.ban_chat_member.call_count)
+
+    def test_journaled_tasks_acknowledged(self):
+        with tempfile.TemporaryDirectory() as path:
+            journal = TaskJournal(os.path.join(path, "tasks.journal"))
+            with create_bot(journal=journal) as (bot, telebot_mock, _):
+                bot.start()
+
+                bot.ban_user(1, 2)
+                bot.delete_message(1, 3)
+                bot.delete_message(1, 4)
+                bot.send_message(chat_id=1, text="captha")
+
+                bot.stop()
+
+                telebot_mock.delete_messages.assert_called_once()
+                journal = TaskJournal(os.path.join(path, "tasks.journal"))
+                self.assertEqual([], journal.pending())
+                journal.close()
+
+    def test_journaled_tasks_replayed_on_start(self):
+        with tempfile.TemporaryDirectory() as path:
+            journal = TaskJournal(os.path.join(path, "tasks.journal"))
+            journal.append("ban_chat_member", {"chat_id": 1, "user_id": 2})
+            with create_bot(journal=journal) as (bot, telebot_mock, _):
+                bot.start()
+                bot.stop()
+
+                telebot_mock.ban_chat_member.assert_called_once_with(chat_id=1, user_id=2)
+                self.assertEqual(0, len(journal))
+
+    def test_retried_task_journaled_with_its_tries(self):
+        with tempfile.TemporaryDirectory() as path:
+            journal = TaskJournal(os.path.join(path, "tasks.journal"))
+            with create_bot(
+                journal=journal, backoff=Backoff(base=60), drain_timeout=0.1
+            ) as (bot, telebot_mock, _):
+                telebot_mock.ban_chat_member.side_effect = ConnectionError("network is down")
+                bot.start()
+
+                bot.ban_user(1, 2)
+
+                bot.stop()
+
+                journal = TaskJournal(os.path.join(path, "tasks.journal"))
+                self.assertEqual([2], [x.tries for x in journal.pending()])
+                journal.close()
+
+    def test_tasks_left_after_drain_timeout_kept_in_journal(self):
+        with tempfile.TemporaryDirectory() as path:
+            journal = TaskJournal(os.path.join(path, "tasks.journal"))
+            with create_bot(
+                journal=journal, reply_workers=1, drain_timeout=0.1
+            ) as (bot, telebot_mock, _):
+                # The first ban is still executed when drain timeout is exceeded
+                telebot_mock.ban_chat_member.side_effect = lambda **kw: time.sleep(0.5)
+                bot.start()
+
+                bot.ban_user(1, 2)
+                bot.ban_user(1, 3)
+
+                bot.stop()
+
+                journal = TaskJournal(os.path.join(path, "tasks.journal"))
+                self.assertEqual(
+                    [3], [x.kwargs["user_id"] for x in journal.pending()]
+                )
+                journal.close()